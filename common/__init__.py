@@ -0,0 +1,7 @@
+"""
+Code shared by the services (material_service, notifications_service).
+
+Each service image is built from the repository root and copies this package
+next to its own `app` package; locally, put the repository root on
+PYTHONPATH (the services' pytest.ini already does).
+"""
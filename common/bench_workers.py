@@ -0,0 +1,139 @@
+"""
+Throughput vs. worker count for the production server profile.
+
+Starts `gunicorn -c common/gunicorn.conf.py app.main:app` in a service
+directory with 1, 2, 4, ... workers and drives it with a multi-process
+keep-alive HTTP load generator:
+
+    python common/bench_workers.py --service material_service --workers 1 2 4 8 --path "/materials/?limit=20"
+    python common/bench_workers.py --service notifications_service --path "/health"
+
+DATABASE_URL defaults to a throwaway SQLite file so the benchmark runs
+without Postgres.
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port: int, timeout: float = 30.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+def _client_process(port: int, path: str, connections: int, duration: float, results) -> None:
+    counts = [0] * connections
+    errors = [0] * connections
+    deadline = time.time() + duration
+
+    def run(i):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        while time.time() < deadline:
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                if response.status == 200:
+                    counts[i] += 1
+                else:
+                    errors[i] += 1
+            except (OSError, http.client.HTTPException):
+                errors[i] += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(connections)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    results.put((sum(counts), sum(errors)))
+
+
+def measure(port: int, path: str, clients: int, connections: int, duration: float):
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=_client_process, args=(port, path, connections, duration, results))
+        for _ in range(clients)
+    ]
+    started = time.perf_counter()
+    for p in procs:
+        p.start()
+    ok = errors = 0
+    for _ in procs:
+        n_ok, n_err = results.get()
+        ok += n_ok
+        errors += n_err
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - started
+    return ok / elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--service", required=True, help="service directory, e.g. material_service")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--path", default="/health")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=max(2, (os.cpu_count() or 2) // 2),
+                        help="load generator processes")
+    parser.add_argument("--connections", type=int, default=16, help="keep-alive connections per client")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # The shared `common` package lives in the repository root
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    config = os.path.join(root, "common", "gunicorn.conf.py")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+    env.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    env.setdefault("EMAIL_USER", "bench")
+    env.setdefault("EMAIL_PASSWORD", "bench")
+    env["ACCESS_LOG"] = "/dev/null"
+    env["LOG_LEVEL"] = "warning"
+
+    print(f"{'workers':>8} {'req/s':>10} {'speedup':>8} {'errors':>7}")
+    baseline = None
+    for n in args.workers:
+        port = free_port()
+        env["PORT"] = str(port)
+        env["WEB_CONCURRENCY"] = str(n)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", config, "app.main:app"],
+            cwd=args.service,
+            env=env
+        )
+        try:
+            wait_ready(port)
+            measure(port, args.path, args.clients, args.connections, 1.0)  # warm up
+            rps, errors = measure(port, args.path, args.clients, args.connections, args.duration)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        baseline = baseline or rps
+        print(f"{n:>8} {rps:>10.0f} {rps / baseline:>7.2f}x {errors:>7}")
+
+
+if __name__ == "__main__":
+    main()
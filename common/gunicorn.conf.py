@@ -0,0 +1,48 @@
+# Production server profile: gunicorn managing uvicorn workers, shared by
+# the services. In their images, /app holds both app/ and common/:
+#
+#   gunicorn -c common/gunicorn.conf.py app.main:app
+#
+# Every setting can be overridden from the environment; PORT sets the port.
+import math
+import os
+
+
+def _available_cpus() -> int:
+    """CPUs this container may actually use (affinity and cgroup quota)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY") or _available_cpus())
+
+# UvicornWorker runs with loop="auto" and http="auto", i.e. uvloop and
+# httptools when they are installed (uvicorn[standard]), asyncio/h11 otherwise
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app once in the master; database.py disposes the inherited
+# connection pool in every forked worker
+preload_app = os.getenv("PRELOAD_APP", "true").lower() == "true"
+
+# Recycle workers after a number of requests to bound memory growth; the
+# jitter keeps workers from restarting all at once
+max_requests = int(os.getenv("MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", max_requests // 10))
+
+timeout = int(os.getenv("WORKER_TIMEOUT", 60))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("KEEPALIVE", 5))
+
+accesslog = os.getenv("ACCESS_LOG", "-")
+loglevel = os.getenv("LOG_LEVEL", "info")
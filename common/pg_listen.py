@@ -0,0 +1,93 @@
+"""
+Postgres LISTEN loop for cross-process messages.
+
+`PostgresListener` keeps a dedicated autocommit connection (detached from the
+engine's pool) that LISTENs on one channel, and hands every payload to
+`on_notify` from a background thread. After an error it reconnects; whatever
+was sent while it was disconnected is lost, so `on_connect` is told whether
+this is a reconnect and the caller can recover (e.g. flush its caches).
+"""
+import logging
+import select
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PostgresListener:
+    """
+    Background LISTEN on `channel`:
+
+    - on_notify(payload): called for every notification received
+    - on_connect(conn, reconnected): called after each (re)connect
+    - before_wait(conn): called before each wait for notifications, at least
+      once per second, e.g. to take or release locks on the connection
+    """
+
+    def __init__(
+        self,
+        engine,
+        channel: str,
+        on_notify: Callable[[str], None],
+        on_connect: Optional[Callable[[object, bool], None]] = None,
+        before_wait: Optional[Callable[[object], None]] = None,
+        name: str = "pg-listener",
+        reconnect_delay: float = 1.0
+    ):
+        self.engine = engine
+        self.channel = channel
+        self.on_notify = on_notify
+        self.on_connect = on_connect
+        self.before_wait = before_wait
+        self.name = name
+        self.reconnect_delay = reconnect_delay
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._listen, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    def _listen(self) -> None:
+        first_connect = True
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                if self.on_connect:
+                    self.on_connect(conn, not first_connect)
+                first_connect = False
+                while not self._stopped.is_set():
+                    if self.before_wait:
+                        self.before_wait(conn)
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.on_notify(conn.notifies.pop(0).payload)
+            except Exception:
+                logger.exception("Listener on %s lost its connection, reconnecting", self.channel)
+                first_connect = False
+                self._stopped.wait(self.reconnect_delay)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def _connect(self):
+        pooled = self.engine.raw_connection()
+        pooled.detach()
+        conn = pooled.dbapi_connection
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel}")
+        return conn
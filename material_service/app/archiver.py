@@ -0,0 +1,45 @@
+import asyncio
+import logging
+import os
+from datetime import timedelta
+
+from starlette.concurrency import run_in_threadpool
+
+from . import crud
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Deactivated materials untouched for this long move to the archive table
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", 30))
+# How often the mover runs; 0 disables it
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", 3600))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 500))
+# Upper bound per run so one pass never holds a worker thread for long
+ARCHIVE_MAX_BATCHES = int(os.getenv("ARCHIVE_MAX_BATCHES", 100))
+
+
+def archive_once() -> int:
+    """Run one archiving pass; safe to run from several workers at once"""
+    db = SessionLocal()
+    try:
+        return crud.archive_inactive_materials(
+            db,
+            inactive_for=timedelta(days=ARCHIVE_AFTER_DAYS),
+            batch_size=ARCHIVE_BATCH_SIZE,
+            max_batches=ARCHIVE_MAX_BATCHES
+        )
+    finally:
+        db.close()
+
+
+async def run_archiver() -> None:
+    """Background loop started with the app"""
+    while True:
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+        try:
+            moved = await run_in_threadpool(archive_once)
+            if moved:
+                logger.info("Archived %d inactive materials", moved)
+        except Exception:
+            logger.exception("Archiving inactive materials failed")
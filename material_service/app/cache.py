@@ -0,0 +1,137 @@
+import gzip
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 512
+
+
+class WriteGeneration:
+    """Monotonic counter bumped by every catalog write in crud.py"""
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    def bump(self) -> int:
+        with self._lock:
+            self._value += 1
+            return self._value
+
+
+class ResponseCache:
+    """
+    LRU cache of serialized, compressed response bodies with a memory cap.
+
+    Every entry remembers the write generation it was built under; entries
+    from an older generation are never served.
+    """
+
+    def __init__(self, generation: WriteGeneration, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.generation = generation
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[int, str, bytes]]" = OrderedDict()
+        self._size = 0
+        self._seen_generation = generation.value
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Tuple[str, bytes]]:
+        """Return (content_encoding, body) for a fresh entry, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != self.generation.value:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key: Hashable, encoding: str, body: bytes, generation: int) -> None:
+        """Store a body computed under `generation` (read before the query ran)"""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            current = self.generation.value
+            if generation != current:
+                return
+            if self._seen_generation != current:
+                # First store after a write: everything cached so far is stale
+                self._clear()
+                self._seen_generation = current
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (generation, encoding, body)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "generation": self.generation.value,
+        }
+
+    def _drop(self, key: Hashable) -> None:
+        _, _, body = self._entries.pop(key)
+        self._size -= len(body)
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    """Pick br, gzip or identity from an Accept-Encoding header"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return "identity"
+
+
+def encode_body(body: bytes, encoding: str) -> Tuple[str, bytes]:
+    """Compress a serialized body; returns the encoding actually applied"""
+    if len(body) < MIN_COMPRESS_BYTES or encoding == "identity":
+        return "identity", body
+    if encoding == "br":
+        return "br", brotli.compress(body, quality=5)
+    return "gzip", gzip.compress(body, compresslevel=6)
+
+
+catalog_generation = WriteGeneration()
+list_cache = ResponseCache(catalog_generation)
@@ -1,19 +1,58 @@
+import os
+import threading
+from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, func, select, insert, delete
 from . import models, schemas
+from .cache import catalog_generation
+from .database import engine
+from .invalidation import create_bus
+from .trigram import TrigramIndex, DEFAULT_SIMILARITY_THRESHOLD
 from typing import List, Optional
 
+FUZZY_SIMILARITY_THRESHOLD = float(
+    os.getenv("FUZZY_SIMILARITY_THRESHOLD", DEFAULT_SIMILARITY_THRESHOLD)
+)
+
+# In-process title index for databases without pg_trgm (SQLite, tests).
+# Built lazily on the first fuzzy search; invalidated ids are re-read from
+# the database before the next search.
+title_index = TrigramIndex()
+_title_index_loaded = False
+_stale_title_ids = set()
+_title_index_lock = threading.Lock()
+
+# Every write publishes the touched ids; all workers evict their caches
+invalidation_bus = create_bus(engine)
+
+
+def _on_invalidation(material_ids: Optional[List[int]]) -> None:
+    global _title_index_loaded
+    catalog_generation.bump()
+    if material_ids is None:
+        _title_index_loaded = False
+    else:
+        _stale_title_ids.update(material_ids)
+
+
+invalidation_bus.subscribe(_on_invalidation)
+
 # Create
 def create_material(db: Session, material: schemas.MaterialCreate) -> models.Material:
     db_material = models.Material(**material.dict())
     db.add(db_material)
+    db.flush()
+    invalidation_bus.publish(db, [db_material.id])
     db.commit()
     db.refresh(db_material)
     return db_material
 
 
-def get_material(db: Session, material_id: int) -> Optional[models.Material]:
-    return db.query(models.Material).filter(models.Material.id == material_id).first()
+def get_material(db: Session, material_id: int, include_archived: bool = False):
+    db_material = db.query(models.Material).filter(models.Material.id == material_id).first()
+    if db_material is None and include_archived:
+        return db.get(models.ArchivedMaterial, material_id)
+    return db_material
 
 
 def get_materials(
@@ -23,7 +62,8 @@ def get_materials(
     subject: Optional[str] = None,
     grade_level: Optional[str] = None,
     is_active: Optional[bool] = None,
-    search: Optional[str] = None
+    search: Optional[str] = None,
+    fuzzy: bool = False
 ) -> List[models.Material]:
     
     query = db.query(models.Material)
@@ -35,6 +75,8 @@ def get_materials(
         query = query.filter(models.Material.grade_level == grade_level)
     if is_active is not None:
         query = query.filter(models.Material.is_active == is_active)
+    if search and fuzzy:
+        return _fuzzy_title_search(db, query, search, skip, limit)
     if search:
         query = query.filter(
             or_(
@@ -50,33 +92,153 @@ def update_material(
     material_update: schemas.MaterialUpdate
 ) -> Optional[models.Material]:
     
-    db_material = get_material(db, material_id)
+    # An archived material moves back to the hot table to be edited
+    db_material = get_material(db, material_id) or _unarchive(db, material_id)
     if not db_material:
         return None
     update_data = material_update.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(db_material, field, value)
+    invalidation_bus.publish(db, [material_id])
     db.commit()
     db.refresh(db_material)
     return db_material
 
 # Delete
 def delete_material(db: Session, material_id: int) -> bool:
-    db_material = get_material(db, material_id)
+    db_material = get_material(db, material_id, include_archived=True)
     if not db_material:
         return False
     
     db.delete(db_material)
+    invalidation_bus.publish(db, [material_id])
     db.commit()
     return True
 
 # Soft delete (deactivate)
 def deactivate_material(db: Session, material_id: int) -> Optional[models.Material]:
-    db_material = get_material(db, material_id)
+    db_material = get_material(db, material_id, include_archived=True)
     if not db_material:
         return None
+    if isinstance(db_material, models.ArchivedMaterial):
+        return db_material  # Only inactive materials are archived
     
     db_material.is_active = False
+    invalidation_bus.publish(db, [material_id])
     db.commit()
     db.refresh(db_material)
-    return db_material
\ No newline at end of file
+    return db_material
+
+
+# Columns copied between the hot table and the archive
+_ARCHIVE_COLUMNS = [
+    "id", "title", "description", "content_url", "file_type", "subject",
+    "grade_level", "created_by", "is_active", "created_at", "updated_at",
+]
+
+# Move long-inactive materials to the archive table, one batch per transaction
+def archive_inactive_materials(
+    db: Session,
+    inactive_for: timedelta,
+    batch_size: int = 500,
+    max_batches: Optional[int] = None
+) -> int:
+    cutoff = datetime.now(timezone.utc) - inactive_for
+    Material = models.Material
+    moved = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = db.scalars(
+            select(Material.id).where(
+                Material.is_active.is_(False),
+                or_(
+                    Material.updated_at < cutoff,
+                    and_(Material.updated_at.is_(None), Material.created_at < cutoff)
+                )
+            ).order_by(Material.id).limit(batch_size).with_for_update(skip_locked=True)
+        ).all()
+        if not ids:
+            break
+
+        columns = [getattr(Material, name) for name in _ARCHIVE_COLUMNS]
+        db.execute(insert(models.ArchivedMaterial).from_select(
+            _ARCHIVE_COLUMNS, select(*columns).where(Material.id.in_(ids))
+        ))
+        db.execute(delete(Material).where(Material.id.in_(ids)))
+        invalidation_bus.publish(db, ids)
+        db.commit()
+        moved += len(ids)
+        batches += 1
+    return moved
+
+# Restore an archived material into the hot table (reactivated)
+def restore_material(db: Session, material_id: int) -> Optional[models.Material]:
+    db_material = _unarchive(db, material_id)
+    if db_material is None:
+        return None
+
+    db_material.is_active = True
+    db.commit()
+    db.refresh(db_material)
+    return db_material
+
+# Move an archived material back to the hot table as it was; the caller commits
+def _unarchive(db: Session, material_id: int) -> Optional[models.Material]:
+    archived = db.get(models.ArchivedMaterial, material_id)
+    if archived is None:
+        return None
+
+    db_material = models.Material(**{name: getattr(archived, name) for name in _ARCHIVE_COLUMNS})
+    db.delete(archived)
+    db.flush()
+    db.add(db_material)
+    db.flush()
+    invalidation_bus.publish(db, [material_id])
+    return db_material
+
+
+# Fuzzy title search
+def _fuzzy_title_search(db: Session, query, search: str, skip: int, limit: int) -> List[models.Material]:
+    if db.get_bind().dialect.name == "postgresql":
+        # `%` uses the GIN trigram index; the threshold is scoped to this transaction
+        db.execute(select(func.set_config(
+            "pg_trgm.similarity_threshold", str(FUZZY_SIMILARITY_THRESHOLD), True
+        )))
+        score = func.similarity(models.Material.title, search)
+        return query.filter(models.Material.title.op("%")(search)).order_by(
+            score.desc(), models.Material.id
+        ).offset(skip).limit(limit).all()
+
+    with _title_index_lock:
+        _ensure_title_index(db)
+        scores = dict(title_index.search(search, FUZZY_SIMILARITY_THRESHOLD))
+    if not scores:
+        return []
+
+    materials = []
+    ids = list(scores)
+    # Keep the IN list under SQLite's bound parameter limit
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        materials.extend(query.filter(models.Material.id.in_(chunk)).all())
+
+    materials.sort(key=lambda m: (-scores[m.id], m.id))
+    return materials[skip:skip + limit]
+
+
+def _ensure_title_index(db: Session) -> None:
+    global _title_index_loaded
+    if not _title_index_loaded:
+        _stale_title_ids.clear()
+        title_index.clear()
+        title_index.add_many(db.query(models.Material.id, models.Material.title).yield_per(1000))
+        _title_index_loaded = True
+        return
+
+    while _stale_title_ids:
+        stale = [_stale_title_ids.pop() for _ in range(min(500, len(_stale_title_ids)))]
+        for material_id in stale:
+            title_index.remove(material_id)
+        title_index.add_many(
+            db.query(models.Material.id, models.Material.title).filter(models.Material.id.in_(stale))
+        )
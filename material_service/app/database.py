@@ -37,6 +37,11 @@ DATABASE_URL = os.getenv(
 
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# A forked worker (gunicorn preload, multiprocessing) must not reuse the
+# parent's pooled connections; start it with a fresh pool instead
+os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
 Base = declarative_base()
 
 def get_db():
@@ -0,0 +1,299 @@
+"""
+Cache invalidation bus shared by every worker of the materials service.
+
+Writes in crud.py call `bus.publish(db, ids)` before committing. The message
+is delivered to this process right after the commit (read-your-writes), and
+to every other worker through the backend:
+
+- PostgresBus: `pg_notify` inside the write transaction, so other workers
+  only hear about committed writes, in commit order. Each worker LISTENs on
+  a dedicated connection (common/pg_listen.py); delivery is reliable while
+  it is connected, and a worker that loses the connection does a full flush.
+- MultiprocessingBus: one multiprocessing.Queue inbox per worker, for tests
+  and multi-process runs without Postgres (INVALIDATION_BACKEND=multiprocessing).
+- LocalBus: single process only.
+
+Queue messages can be dropped when a peer's inbox is full, so the
+multiprocessing bus numbers them (origin, seq) as they are sent, after the
+commit: rolled back and concurrent transactions leave no holes, and a worker
+that sees a gap in an origin's sequence knows it missed a message and does a
+full flush.
+"""
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import event, func, select as sql_select
+from sqlalchemy.orm import Session
+
+from common.pg_listen import PostgresListener
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "materials_invalidation"
+
+# pg_notify payloads are limited to 8000 bytes; larger messages become flushes
+MAX_IDS_PER_MESSAGE = 500
+
+# Messages a multiprocessing inbox holds before further ones are dropped
+INBOX_SIZE = 10_000
+
+# Subscribers get the invalidated material ids, or None for a full flush
+Subscriber = Callable[[Optional[List[int]]], None]
+
+
+class InvalidationMessage:
+    """Invalidated ids (None: flush everything); `seq` is None on reliable transports"""
+
+    def __init__(self, origin: str, seq: Optional[int], ids: Optional[List[int]]):
+        self.origin = origin
+        self.seq = seq
+        self.ids = ids
+
+    def to_json(self) -> str:
+        return json.dumps({"o": self.origin, "s": self.seq, "ids": self.ids})
+
+    @classmethod
+    def from_json(cls, payload: str) -> "InvalidationMessage":
+        data = json.loads(payload)
+        return cls(data["o"], data["s"], data["ids"])
+
+
+class InvalidationBus:
+    """Base bus: staging on the session, local delivery and ordering checks"""
+
+    def __init__(self):
+        self._origin = None
+        self._origin_pid = None
+        self._seq = itertools.count(1)
+        self._seq_lock = threading.Lock()
+        self._subscribers: List[Subscriber] = []
+        self._last_seen: Dict[str, int] = {}
+        self._deliver_lock = threading.Lock()
+        self.flushes = 0
+
+    @property
+    def origin(self) -> str:
+        """Id of this process in messages; a bus created before forking gets one per worker"""
+        if self._origin_pid != os.getpid():
+            self._origin, self._origin_pid = uuid.uuid4().hex, os.getpid()
+        return self._origin
+
+    def subscribe(self, callback: Subscriber) -> None:
+        self._subscribers.append(callback)
+
+    def publish(self, db: Session, material_ids: Optional[Iterable[int]] = None) -> None:
+        """Stage an invalidation; it is sent when `db` commits and dropped on rollback"""
+        ids = None if material_ids is None else sorted(set(material_ids))
+        if ids is not None and len(ids) > MAX_IDS_PER_MESSAGE:
+            ids = None
+        if not db.in_transaction():
+            db.begin()
+        self._within_transaction(db, ids)
+        db.info.setdefault("pending_invalidations", []).append((self, ids))
+
+    def start(self) -> None:
+        """Start receiving messages from other workers"""
+
+    def stop(self) -> None:
+        pass
+
+    def flush_all(self) -> None:
+        self.flushes += 1
+        self._notify(None)
+
+    # Backend hooks
+    def _within_transaction(self, db: Session, ids: Optional[List[int]]) -> None:
+        pass
+
+    def _broadcast(self, ids: Optional[List[int]]) -> None:
+        pass
+
+    # Delivery
+    def _committed(self, ids: Optional[List[int]]) -> None:
+        self._notify(ids)
+        self._broadcast(ids)
+
+    def _receive(self, message: InvalidationMessage) -> None:
+        """Apply a message from another worker, flushing on sequence gaps"""
+        if message.origin == self.origin:
+            return
+        if message.seq is None:
+            self._notify(message.ids)
+            return
+        with self._deliver_lock:
+            last = self._last_seen.get(message.origin)
+            gap = last is not None and message.seq > last + 1
+            if last is None or message.seq > last:
+                self._last_seen[message.origin] = message.seq
+        # Late (out-of-order) messages are still applied; eviction is idempotent
+        if gap or message.ids is None:
+            self.flush_all()
+        else:
+            self._notify(message.ids)
+
+    def _notify(self, ids: Optional[List[int]]) -> None:
+        for callback in self._subscribers:
+            try:
+                callback(ids)
+            except Exception:
+                logger.exception("Invalidation subscriber failed")
+
+
+class LocalBus(InvalidationBus):
+    """Single-process bus: only delivers to this process"""
+
+
+class MultiprocessingBus(InvalidationBus):
+    """
+    Bus over multiprocessing queues, one inbox per worker. Create it before
+    the workers are forked (gunicorn preload_app, see `create`): each worker
+    then takes a free inbox in start(), unless it was given a fixed `index`
+    (with `owners` None, every inbox belongs to a live worker).
+    """
+
+    def __init__(self, inboxes: List, index: Optional[int] = None, owners=None):
+        super().__init__()
+        self.inboxes = inboxes
+        self.index = index
+        self.owners = owners  # Shared array: pid owning each inbox, 0 if free
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def create(cls, size: int) -> "MultiprocessingBus":
+        """Bus with `size` inboxes for workers to take (spares cover worker restarts)"""
+        inboxes = [multiprocessing.Queue(INBOX_SIZE) for _ in range(size)]
+        return cls(inboxes, owners=multiprocessing.Array("i", size))
+
+    def _broadcast(self, ids: Optional[List[int]]) -> None:
+        # Numbered as sent, so each peer's inbox gets a gapless sequence unless it overflows
+        with self._seq_lock:
+            payload = InvalidationMessage(self.origin, next(self._seq), ids).to_json()
+            for i, inbox in enumerate(self.inboxes):
+                if i == self.index or (self.owners is not None and not self.owners[i]):
+                    continue
+                try:
+                    inbox.put_nowait(payload)
+                except queue.Full:
+                    # The peer will see a sequence gap and flush
+                    logger.warning("Invalidation inbox %s is full, dropping message", i)
+
+    def start(self) -> None:
+        if self.owners is not None:
+            self.index = self._take_inbox()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._listen, name="invalidation-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self.owners is not None and self.index is not None:
+            with self.owners.get_lock():
+                if self.owners[self.index] == os.getpid():
+                    self.owners[self.index] = 0
+            self.index = None
+
+    def _take_inbox(self) -> int:
+        """Take a free inbox, or one left by a worker that died without stop()"""
+        with self.owners.get_lock():
+            for i, pid in enumerate(self.owners):
+                if not pid or not _alive(pid):
+                    self.owners[i] = os.getpid()
+                    break
+            else:
+                raise RuntimeError("No free invalidation inbox, raise INVALIDATION_INBOXES")
+        # Messages left for the previous owner are about a cache we don't have
+        try:
+            while True:
+                self.inboxes[i].get_nowait()
+        except queue.Empty:
+            pass
+        return i
+
+    def _listen(self) -> None:
+        inbox = self.inboxes[self.index]
+        while not self._stopped.is_set():
+            try:
+                payload = inbox.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            self._receive(InvalidationMessage.from_json(payload))
+
+
+class PostgresBus(InvalidationBus):
+    """Bus over Postgres LISTEN/NOTIFY"""
+
+    def __init__(self, engine, channel: str = CHANNEL, reconnect_delay: float = 1.0):
+        super().__init__()
+        self.channel = channel
+        self.listener = PostgresListener(
+            engine, channel,
+            on_notify=lambda payload: self._receive(InvalidationMessage.from_json(payload)),
+            on_connect=self._connected,
+            name="invalidation-bus",
+            reconnect_delay=reconnect_delay
+        )
+
+    def _within_transaction(self, db: Session, ids: Optional[List[int]]) -> None:
+        # Queued by Postgres and delivered only if and when this transaction commits
+        message = InvalidationMessage(self.origin, None, ids)
+        db.execute(sql_select(func.pg_notify(self.channel, message.to_json())))
+
+    def start(self) -> None:
+        self.listener.start()
+
+    def stop(self) -> None:
+        self.listener.stop()
+
+    def _connected(self, conn, reconnected: bool) -> None:
+        if reconnected:
+            # Anything published while we were disconnected is lost
+            self.flush_all()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def create_bus(engine) -> InvalidationBus:
+    backend = os.getenv("INVALIDATION_BACKEND")
+    if backend is None:
+        backend = "postgres" if engine.dialect.name == "postgresql" else "local"
+    if backend == "postgres":
+        return PostgresBus(engine)
+    if backend == "multiprocessing":
+        # Needs the app imported before forking (gunicorn preload_app, the default);
+        # twice the workers leaves inboxes for workers replacing exited ones
+        size = os.getenv("INVALIDATION_INBOXES") or 2 * int(os.getenv("WEB_CONCURRENCY") or os.cpu_count() or 1)
+        return MultiprocessingBus.create(int(size))
+    if backend == "local":
+        return LocalBus()
+    raise ValueError(f"Unknown INVALIDATION_BACKEND: {backend}")
+
+
+@event.listens_for(Session, "after_commit")
+def _deliver_committed(session: Session) -> None:
+    for bus, ids in session.info.pop("pending_invalidations", ()):
+        bus._committed(ids)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back(session: Session, previous_transaction) -> None:
+    # A rolled back savepoint leaves the outer transaction (and its messages) alive
+    if not session.in_transaction():
+        session.info.pop("pending_invalidations", None)
@@ -37,13 +37,16 @@
 #     )
 
 
+import asyncio
 from fastapi import FastAPI
 from .routers import materials
 from .database import engine
-from . import models
+from . import archiver, crud, models
 
 # Create tables
 models.Base.metadata.create_all(bind=engine)
+models.create_search_indexes(engine)
+models.upgrade_archive_schema(engine)
 
 app = FastAPI(
     title="Materials Service API",
@@ -56,6 +59,27 @@ app = FastAPI(
 # Include routers
 app.include_router(materials.router)
 
+# Cross-worker cache invalidation
+@app.on_event("startup")
+def start_invalidation_bus():
+    crud.invalidation_bus.start()
+
+@app.on_event("shutdown")
+def stop_invalidation_bus():
+    crud.invalidation_bus.stop()
+
+# Background mover for long-inactive materials
+@app.on_event("startup")
+async def start_archiver():
+    if archiver.ARCHIVE_INTERVAL_SECONDS > 0:
+        app.state.archiver_task = asyncio.create_task(archiver.run_archiver())
+
+@app.on_event("shutdown")
+async def stop_archiver():
+    task = getattr(app.state, "archiver_task", None)
+    if task is not None:
+        task.cancel()
+
 # Health check endpoint
 @app.get("/health")
 def health_check():
@@ -1,9 +1,19 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Index, text
 from sqlalchemy.sql import func
 from .database import Base
 
 class Material(Base):
     __tablename__ = "materials"
+    __table_args__ = (
+        # Lets the archiver find long-inactive rows without scanning active ones
+        Index(
+            "ix_materials_inactive_updated_at", "updated_at",
+            postgresql_where=text("NOT is_active"),
+            sqlite_where=text("NOT is_active")
+        ),
+        # Never reuse ids on SQLite: archived materials keep theirs
+        {"sqlite_autoincrement": True},
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False, index=True)
@@ -18,4 +28,94 @@ class Material(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     def __repr__(self):
-        return f"<Material(id={self.id}, title='{self.title}')>"
\ No newline at end of file
+        return f"<Material(id={self.id}, title='{self.title}')>"
+
+
+# Cold storage for deactivated materials, moved here by the archiver so the
+# hot `materials` table and its indexes only hold live rows
+class ArchivedMaterial(Base):
+    __tablename__ = "materials_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)  # id from `materials`
+    title = Column(String(200), nullable=False)
+    description = Column(Text)
+    content_url = Column(String(500))
+    file_type = Column(String(50))
+    subject = Column(String(100))
+    grade_level = Column(String(50))
+    created_by = Column(String(100))
+    is_active = Column(Boolean, default=False)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    def __repr__(self):
+        return f"<ArchivedMaterial(id={self.id}, title='{self.title}')>"
+
+
+def create_search_indexes(bind):
+    """Create the pg_trgm GIN index used by fuzzy title search (Postgres only)"""
+    if bind.dialect.name != "postgresql":
+        return
+    with bind.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_materials_title_trgm "
+            "ON materials USING gin (title gin_trgm_ops)"
+        ))
+
+
+def upgrade_archive_schema(bind):
+    """
+    Bring a `materials` table created before archiving up to date: create
+    the partial index on inactive rows and, on SQLite, rebuild the table
+    with AUTOINCREMENT (create_all does neither for an existing table)
+    """
+    if bind.dialect.name == "postgresql":
+        # CONCURRENTLY doesn't block writes to a large table; it can't run in a transaction
+        with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_materials_inactive_updated_at "
+                "ON materials (updated_at) WHERE NOT is_active"
+            ))
+        return
+    if bind.dialect.name != "sqlite":
+        return
+    # pysqlite doesn't put DDL in a transaction on its own; the copy must be all or nothing
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            _rebuild_materials_with_autoincrement(conn)
+        except BaseException:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
+        conn.exec_driver_sql("COMMIT")
+
+
+def _rebuild_materials_with_autoincrement(conn):
+    table_sql = conn.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'materials'"
+    )).scalar()
+    if table_sql is None or "AUTOINCREMENT" in table_sql.upper():
+        return
+    # Index names are global in SQLite: drop the old ones before the copy gets its own
+    for (index,) in conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'materials' AND sql IS NOT NULL"
+    )).all():
+        conn.execute(text(f'DROP INDEX "{index}"'))
+    conn.execute(text("ALTER TABLE materials RENAME TO materials_before_autoincrement"))
+    Material.__table__.create(conn)
+    columns = ", ".join(column.name for column in Material.__table__.columns)
+    conn.execute(text(
+        f"INSERT INTO materials ({columns}) SELECT {columns} FROM materials_before_autoincrement"
+    ))
+    conn.execute(text("DROP TABLE materials_before_autoincrement"))
+    # The old table could hand out archived ids again; new ids start above them
+    conn.execute(text(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'materials', 0 "
+        "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'materials')"
+    ))
+    conn.execute(text(
+        "UPDATE sqlite_sequence SET seq = max(seq, (SELECT coalesce(max(id), 0) FROM materials_archive)) "
+        "WHERE name = 'materials'"
+    ))
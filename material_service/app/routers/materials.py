@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from .. import crud, schemas
+from ..cache import list_cache, negotiate_encoding, encode_body
 from ..database import get_db
 
 router = APIRouter(prefix="/materials", tags=["materials"])
 
+_material_list = TypeAdapter(List[schemas.MaterialResponse])
+
 # Create material
 @router.post("/", response_model=schemas.MaterialResponse, status_code=status.HTTP_201_CREATED)
 def create_material(
@@ -15,31 +19,52 @@ def create_material(
     return crud.create_material(db=db, material=material)
 
 # Get all materials with filters
+# Responses are cached already serialized and compressed, keyed by the
+# normalized filters; any catalog write invalidates them.
 @router.get("/", response_model=List[schemas.MaterialResponse])
 def read_materials(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     subject: Optional[str] = None,
     grade_level: Optional[str] = None,
     is_active: Optional[bool] = None,
     search: Optional[str] = None,
+    fuzzy: bool = Query(False, description="Typo-tolerant trigram match on title"),
     db: Session = Depends(get_db)
 ):
-    materials = crud.get_materials(
-        db=db,
-        skip=skip,
-        limit=limit,
-        subject=subject,
-        grade_level=grade_level,
-        is_active=is_active,
-        search=search
-    )
-    return materials
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    key = (skip, limit, subject, grade_level, is_active, search, fuzzy and bool(search), encoding)
+
+    cached = list_cache.get(key)
+    if cached is None:
+        generation = list_cache.generation.value
+        materials = crud.get_materials(
+            db=db,
+            skip=skip,
+            limit=limit,
+            subject=subject,
+            grade_level=grade_level,
+            is_active=is_active,
+            search=search,
+            fuzzy=fuzzy
+        )
+        body = _material_list.dump_json(
+            _material_list.validate_python(materials, from_attributes=True)
+        )
+        cached = encode_body(body, encoding)
+        list_cache.put(key, *cached, generation=generation)
+
+    content_encoding, body = cached
+    headers = {"Vary": "Accept-Encoding"}
+    if content_encoding != "identity":
+        headers["Content-Encoding"] = content_encoding
+    return Response(content=body, media_type="application/json", headers=headers)
 
-# Get material by ID
+# Get material by ID (falls back to the archive)
 @router.get("/{material_id}", response_model=schemas.MaterialResponse)
 def read_material(material_id: int, db: Session = Depends(get_db)):
-    db_material = crud.get_material(db, material_id=material_id)
+    db_material = crud.get_material(db, material_id=material_id, include_archived=True)
     if db_material is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -84,6 +109,17 @@ def deactivate_material(material_id: int, db: Session = Depends(get_db)):
         )
     return db_material
 
+# Restore archived material
+@router.post("/{material_id}/restore", response_model=schemas.MaterialResponse)
+def restore_material(material_id: int, db: Session = Depends(get_db)):
+    db_material = crud.restore_material(db, material_id=material_id)
+    if db_material is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Archived material with ID {material_id} not found"
+        )
+    return db_material
+
 
 # # NEW: Simple search by name/title
 # @router.get("/search/", response_model=List[schemas.MaterialResponse])
@@ -32,6 +32,7 @@ class MaterialResponse(MaterialBase):
     id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
+    archived_at: Optional[datetime] = None  # Set only for materials read from the archive
     
     class Config:
         from_attributes = True  # Replaces orm_mode in Pydantic v2
\ No newline at end of file
@@ -0,0 +1,120 @@
+import math
+import re
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+# Words are runs of alphanumeric characters, same as pg_trgm
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.3
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """
+    Extract trigrams the way pg_trgm does.
+
+    The text is lowercased and split into words; every word is padded with
+    two spaces in front and one behind before taking 3-character windows.
+    """
+    result: Set[str] = set()
+    for word in _WORD_RE.findall(text.lower()):
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            result.add(padded[i:i + 3])
+    return frozenset(result)
+
+
+def similarity(a: str, b: str) -> float:
+    """Trigram similarity of two strings (pg_trgm `similarity()`)"""
+    return _score(trigrams(a), trigrams(b))
+
+
+def _score(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+class TrigramIndex:
+    """
+    In-process inverted trigram index with pg_trgm compatible scoring.
+
+    Used for fuzzy title search on databases without pg_trgm (SQLite in
+    tests and local development).
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+        self._docs: Dict[int, FrozenSet[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, doc_id: int) -> bool:
+        return doc_id in self._docs
+
+    def add(self, doc_id: int, text: str) -> None:
+        """Index `text` under `doc_id`, replacing any previous text"""
+        if doc_id in self._docs:
+            self.remove(doc_id)
+        grams = trigrams(text or "")
+        self._docs[doc_id] = grams
+        for gram in grams:
+            self._postings[gram].add(doc_id)
+
+    def add_many(self, docs: Iterable[Tuple[int, str]]) -> None:
+        for doc_id, text in docs:
+            self.add(doc_id, text)
+
+    def remove(self, doc_id: int) -> None:
+        grams = self._docs.pop(doc_id, None)
+        if not grams:
+            return
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                continue
+            posting.discard(doc_id)
+            if not posting:
+                del self._postings[gram]
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._docs.clear()
+
+    def search(
+        self,
+        query: str,
+        threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        limit: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Return (doc_id, score) pairs with similarity >= threshold,
+        best matches first.
+        """
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+
+        # A match needs at least `min_overlap` shared trigrams, so it must
+        # contain one of the (len - min_overlap + 1) rarest query trigrams.
+        # Only those posting lists are scanned for candidates.
+        min_overlap = max(1, math.ceil(threshold * len(query_grams)))
+        by_rarity = sorted(query_grams, key=lambda g: len(self._postings.get(g, ())))
+        prefix = by_rarity[:len(query_grams) - min_overlap + 1]
+
+        candidates: Set[int] = set()
+        for gram in prefix:
+            candidates.update(self._postings.get(gram, ()))
+
+        matches = []
+        for doc_id in candidates:
+            score = _score(query_grams, self._docs[doc_id])
+            if score >= threshold:
+                matches.append((doc_id, score))
+
+        matches.sort(key=lambda match: (-match[1], match[0]))
+        if limit is not None:
+            matches = matches[:limit]
+        return matches
@@ -0,0 +1,146 @@
+"""
+Fuzzy title search benchmark on a synthetic catalog.
+
+In-process mode (default) builds the TrigramIndex used on SQLite and times
+typo'd queries against it, with a brute-force similarity scan as baseline:
+
+    python benchmarks/bench_fuzzy_search.py --size 1000000
+
+Postgres mode seeds a scratch `bench_materials` table and times the pg_trgm query path
+(`%` + similarity ordering) with and without the GIN index:
+
+    DATABASE_URL=postgresql://... python benchmarks/bench_fuzzy_search.py --postgres
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.trigram import TrigramIndex, similarity, DEFAULT_SIMILARITY_THRESHOLD  # noqa: E402
+
+SUBJECTS = [
+    "Algebra", "Geometry", "Calculus", "Physics", "Chemistry", "Biology",
+    "History", "Geography", "Literature", "Grammar", "Statistics",
+    "Programming", "Economics", "Astronomy", "Philosophy", "Music",
+]
+TOPICS = [
+    "equations", "functions", "triangles", "vectors", "integrals", "atoms",
+    "cells", "revolutions", "maps", "poetry", "probability", "recursion",
+    "markets", "planets", "ethics", "harmony", "derivatives", "matrices",
+]
+QUERIES = [
+    "algbra", "geomtry equatoins", "calclus integrls", "phisics vectors",
+    "chemestry atoms 7", "biolgy cels", "progamming recursoin", "statistcs probablity",
+]
+
+
+def make_titles(size: int, seed: int = 42):
+    rng = random.Random(seed)
+    for i in range(size):
+        yield (
+            i + 1,
+            f"{rng.choice(SUBJECTS)} {rng.choice(TOPICS)} {rng.randint(1, 11)}"
+        )
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def bench_in_process(size: int, repeat: int, threshold: float, brute_sample: int):
+    print(f"Building TrigramIndex over {size:,} titles...")
+    titles = list(make_titles(size))
+    index = TrigramIndex()
+    started = time.perf_counter()
+    index.add_many(titles)
+    print(f"  build: {time.perf_counter() - started:.1f}s")
+
+    timings = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            started = time.perf_counter()
+            matches = index.search(query, threshold, limit=100)
+            timings.append((time.perf_counter() - started) * 1000)
+    print(f"  indexed search: p50={statistics.median(timings):.1f}ms "
+          f"p95={percentile(timings, 95):.1f}ms  ({len(matches)} hits for last query)")
+
+    # Brute force over a sample, extrapolated to the full catalog
+    sample = titles[:brute_sample]
+    started = time.perf_counter()
+    for query in QUERIES:
+        [t for t in sample if similarity(query, t[1]) >= threshold]
+    per_query = (time.perf_counter() - started) / len(QUERIES) * 1000 * size / len(sample)
+    print(f"  brute-force scan (extrapolated): {per_query:.0f}ms per query")
+
+
+def bench_postgres(size: int, repeat: int, threshold: float):
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(os.environ["DATABASE_URL"])
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text("DROP TABLE IF EXISTS bench_materials"))
+        conn.execute(text("CREATE TABLE bench_materials (id integer PRIMARY KEY, title varchar(200) NOT NULL)"))
+
+    print(f"Seeding {size:,} titles...")
+    batch = []
+    with engine.begin() as conn:
+        for row in make_titles(size):
+            batch.append({"id": row[0], "title": row[1]})
+            if len(batch) == 10000:
+                conn.execute(text("INSERT INTO bench_materials VALUES (:id, :title)"), batch)
+                batch = []
+        if batch:
+            conn.execute(text("INSERT INTO bench_materials VALUES (:id, :title)"), batch)
+        conn.execute(text("ANALYZE bench_materials"))
+
+    sql = text(
+        "SELECT id FROM bench_materials WHERE title % :q "
+        "ORDER BY similarity(title, :q) DESC, id LIMIT 100"
+    )
+
+    def run(label):
+        timings = []
+        with engine.connect() as conn:
+            conn.execute(text("SELECT set_config('pg_trgm.similarity_threshold', :t, false)"),
+                         {"t": str(threshold)})
+            for _ in range(repeat):
+                for query in QUERIES:
+                    started = time.perf_counter()
+                    conn.execute(sql, {"q": query}).fetchall()
+                    timings.append((time.perf_counter() - started) * 1000)
+        print(f"  {label}: p50={statistics.median(timings):.1f}ms p95={percentile(timings, 95):.1f}ms")
+
+    run("seq scan")
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text("CREATE INDEX bench_materials_title_trgm ON bench_materials USING gin (title gin_trgm_ops)"))
+    print(f"  GIN build: {time.perf_counter() - started:.1f}s")
+    run("GIN index")
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE bench_materials"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_SIMILARITY_THRESHOLD)
+    parser.add_argument("--brute-sample", type=int, default=50_000)
+    parser.add_argument("--postgres", action="store_true", help="benchmark pg_trgm against DATABASE_URL")
+    args = parser.parse_args()
+
+    if args.postgres:
+        bench_postgres(args.size, args.repeat, args.threshold)
+    else:
+        bench_in_process(args.size, args.repeat, args.threshold, args.brute_sample)
+
+
+if __name__ == "__main__":
+    main()
@@ -252,4 +252,435 @@ class TestMaterialsService:
         assert len(materials) == 2
         assert materials[0]["title"] == title1
         assert materials[1]["title"] == title2
-        mock_get.assert_called_once_with(f"{base_url}/materials")
\ No newline at end of file
+        mock_get.assert_called_once_with(f"{base_url}/materials")
+
+class TestTrigramIndex:
+    """Тесты для нечеткого поиска по названию (триграммы)"""
+
+    def test_trigrams_match_pg_trgm(self):
+        """Тест - триграммы строятся так же, как в pg_trgm"""
+        from app.trigram import trigrams
+
+        assert trigrams("Cat") == {"  c", " ca", "cat", "at "}
+        assert trigrams("a-b") == {"  a", " a ", "  b", " b "}
+        assert trigrams("") == frozenset()
+
+    def test_search_tolerates_typos(self):
+        """Тест - поиск находит материал по названию с опечаткой"""
+        from app.trigram import TrigramIndex
+
+        # Дано
+        index = TrigramIndex()
+        index.add_many([(1, "Algebra 7"), (2, "Geometry 9"), (3, "Physics")])
+
+        # Когда
+        matches = index.search("algbra")
+
+        # Тогда
+        assert [doc_id for doc_id, _ in matches] == [1]
+        assert 0.3 <= matches[0][1] < 1.0
+
+    def test_search_scores_like_brute_force(self):
+        """Тест - индекс возвращает те же оценки, что и полный перебор"""
+        from app.trigram import TrigramIndex, similarity
+
+        # Дано
+        titles = {1: "Алгебра 7 класс", 2: "Геометрия 9 класс", 3: "Алгебра 8 класс", 4: "Физика"}
+        index = TrigramIndex()
+        index.add_many(titles.items())
+
+        # Когда
+        matches = index.search("алгебра класс", threshold=0.2)
+
+        # Тогда
+        expected = sorted(
+            ((i, similarity("алгебра класс", t)) for i, t in titles.items()
+             if similarity("алгебра класс", t) >= 0.2),
+            key=lambda m: (-m[1], m[0])
+        )
+        assert matches == expected
+
+    def test_update_and_remove(self):
+        """Тест - обновление и удаление записей в индексе"""
+        from app.trigram import TrigramIndex
+
+        # Дано
+        index = TrigramIndex()
+        index.add(1, "Algebra 7")
+
+        # Когда
+        index.add(1, "Chemistry")
+
+        # Тогда
+        assert index.search("algebra") == []
+        assert index.search("chemistry")[0][0] == 1
+        index.remove(1)
+        assert len(index) == 0
+        assert index.search("chemistry") == []
+
+
+class TestResponseCache:
+    """Тесты для кэша ответов списка материалов"""
+
+    def test_write_generation_invalidates(self):
+        """Тест - запись в каталог делает закэшированные ответы устаревшими"""
+        from app.cache import ResponseCache, WriteGeneration
+
+        # Дано
+        generation = WriteGeneration()
+        cache = ResponseCache(generation, max_bytes=1024)
+        cache.put(("subject", "Math"), "gzip", b"body", generation=generation.value)
+        assert cache.get(("subject", "Math")) == ("gzip", b"body")
+
+        # Когда
+        generation.bump()
+
+        # Тогда
+        assert cache.get(("subject", "Math")) is None
+
+    def test_stale_generation_not_stored(self):
+        """Тест - ответ, вычисленный до записи, не попадает в кэш"""
+        from app.cache import ResponseCache, WriteGeneration
+
+        generation = WriteGeneration()
+        cache = ResponseCache(generation, max_bytes=1024)
+        read_at = generation.value
+        generation.bump()
+
+        cache.put("key", "identity", b"[]", generation=read_at)
+
+        assert cache.get("key") is None
+
+    def test_lru_eviction_by_memory(self):
+        """Тест - при превышении лимита памяти вытесняются самые старые записи"""
+        from app.cache import ResponseCache, WriteGeneration
+
+        # Дано
+        generation = WriteGeneration()
+        cache = ResponseCache(generation, max_bytes=10)
+        cache.put("a", "identity", b"aaaa", generation=0)
+        cache.put("b", "identity", b"bbbb", generation=0)
+        cache.get("a")
+
+        # Когда
+        cache.put("c", "identity", b"cccc", generation=0)
+
+        # Тогда
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+        assert cache.stats()["evictions"] == 1
+
+    def test_negotiate_encoding(self):
+        """Тест - выбор сжатия по заголовку Accept-Encoding"""
+        from app.cache import negotiate_encoding
+
+        assert negotiate_encoding("gzip, deflate") == "gzip"
+        assert negotiate_encoding("gzip;q=0") == "identity"
+        assert negotiate_encoding("") == "identity"
+
+
+class TestInvalidationBus:
+    """Тесты для шины инвалидации кэшей между воркерами"""
+
+    def test_peer_receives_only_committed_writes(self):
+        """Тест - другой воркер получает инвалидацию только после коммита"""
+        import multiprocessing
+        import time
+        from sqlalchemy.orm import Session
+        from app.invalidation import MultiprocessingBus
+
+        # Дано
+        inboxes = [multiprocessing.Queue(), multiprocessing.Queue()]
+        writer, reader = MultiprocessingBus(inboxes, 0), MultiprocessingBus(inboxes, 1)
+        received = []
+        reader.subscribe(received.append)
+        reader.start()
+
+        try:
+            # Когда
+            with Session() as db:
+                writer.publish(db, [1])
+                db.rollback()
+                writer.publish(db, [2, 3])
+                db.commit()
+
+            deadline = time.time() + 5
+            while not received and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            reader.stop()
+
+        # Тогда
+        assert received == [[2, 3]]
+
+    def test_sequence_gap_triggers_full_flush(self):
+        """Тест - пропуск сообщения приводит к полной очистке кэша"""
+        from app.invalidation import LocalBus, InvalidationMessage
+
+        # Дано
+        bus = LocalBus()
+        received = []
+        bus.subscribe(received.append)
+
+        # Когда
+        bus._receive(InvalidationMessage("worker-a", 1, [10]))
+        bus._receive(InvalidationMessage("worker-a", 3, [30]))
+        bus._receive(InvalidationMessage("worker-a", 2, [20]))
+
+        # Тогда
+        assert received == [[10], None, [20]]
+        assert bus.flushes == 1
+
+    def test_rollbacks_and_commit_order_cause_no_flush(self):
+        """Тест - откат и коммиты не по порядку публикации не дают пропусков в нумерации"""
+        import multiprocessing
+        import time
+        from sqlalchemy.orm import Session
+        from app.invalidation import MultiprocessingBus
+
+        # Дано
+        inboxes = [multiprocessing.Queue(), multiprocessing.Queue()]
+        writer, reader = MultiprocessingBus(inboxes, 0), MultiprocessingBus(inboxes, 1)
+        received = []
+        reader.subscribe(received.append)
+        reader.start()
+
+        try:
+            # Когда
+            with Session() as db:
+                writer.publish(db, [0])
+                db.commit()
+            first, second, rolled_back = Session(), Session(), Session()
+            writer.publish(first, [1])
+            writer.publish(rolled_back, [2])
+            writer.publish(second, [3])
+            rolled_back.rollback()
+            second.commit()
+            first.commit()
+
+            deadline = time.time() + 5
+            while len(received) < 3 and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            reader.stop()
+
+        # Тогда
+        assert received == [[0], [3], [1]]
+        assert reader.flushes == 0
+
+    def test_forked_workers_take_their_own_inboxes(self):
+        """Тест - шина, созданная до fork, доставляет сообщения между воркерами"""
+        import multiprocessing
+        import os
+        import time
+        from sqlalchemy.orm import Session
+        from app.invalidation import create_bus, MultiprocessingBus
+
+        def worker(bus):
+            bus.start()
+            with Session() as db:
+                bus.publish(db, [7])
+                db.commit()
+            bus.stop()
+
+        # Дано
+        with patch.dict(os.environ, {"INVALIDATION_BACKEND": "multiprocessing", "INVALIDATION_INBOXES": "2"}):
+            bus = create_bus(engine=None)
+        assert isinstance(bus, MultiprocessingBus)
+        received = []
+        bus.subscribe(received.append)
+        bus.start()
+
+        try:
+            # Когда
+            child = multiprocessing.get_context("fork").Process(target=worker, args=(bus,))
+            child.start()
+            child.join(timeout=10)
+
+            deadline = time.time() + 5
+            while not received and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            bus.stop()
+
+        # Тогда
+        assert child.exitcode == 0
+        assert received == [[7]]
+        assert list(bus.owners) == [0, 0]
+
+
+def _sqlite_session(tmp_path):
+    """Сессия на новой базе SQLite с таблицами сервиса; вызывать до импорта app.crud"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    with patch.dict('os.environ', {'DATABASE_URL': f"sqlite:///{tmp_path}/import.db"}):
+        from app import models, crud  # noqa: F401
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    models.Base.metadata.create_all(engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+
+def _add_material(db, title, is_active=True, updated_at=None):
+    from app import models
+    material = models.Material(title=title, subject="Math", is_active=is_active, updated_at=updated_at)
+    db.add(material)
+    db.commit()
+    return material.id
+
+
+class TestArchive:
+    """Тесты для переноса неактивных материалов в архив"""
+
+    def test_archive_moves_old_inactive_materials_in_batches(self, tmp_path):
+        """Тест - архивация переносит только давно неактивные материалы, пачками"""
+        from datetime import timedelta
+
+        # Дано
+        db = _sqlite_session(tmp_path)
+        from app import crud, models
+        old = datetime(2020, 1, 1)
+        old_ids = [_add_material(db, f"Old {i}", is_active=False, updated_at=old) for i in range(5)]
+        active_id = _add_material(db, "Active", updated_at=old)
+        recent_id = _add_material(db, "Recently deactivated", is_active=False, updated_at=datetime.utcnow())
+
+        # Когда
+        first_pass = crud.archive_inactive_materials(db, timedelta(days=30), batch_size=2, max_batches=1)
+        second_pass = crud.archive_inactive_materials(db, timedelta(days=30), batch_size=2)
+
+        # Тогда
+        assert (first_pass, second_pass) == (2, 3)
+        assert sorted(m.id for m in db.query(models.Material)) == [active_id, recent_id]
+        assert sorted(m.id for m in db.query(models.ArchivedMaterial)) == old_ids
+
+    def test_get_material_falls_back_to_archive(self, tmp_path):
+        """Тест - архивный материал находится по id только с include_archived"""
+        from datetime import timedelta
+
+        # Дано
+        db = _sqlite_session(tmp_path)
+        from app import crud, models
+        material_id = _add_material(db, "Algebra 7", is_active=False, updated_at=datetime(2020, 1, 1))
+        crud.archive_inactive_materials(db, timedelta(days=30))
+
+        # Когда
+        hot = crud.get_material(db, material_id)
+        archived = crud.get_material(db, material_id, include_archived=True)
+
+        # Тогда
+        assert hot is None
+        assert isinstance(archived, models.ArchivedMaterial)
+        assert archived.title == "Algebra 7"
+        assert archived.archived_at is not None
+
+    def test_restore_returns_material_to_hot_table(self, tmp_path):
+        """Тест - восстановление возвращает материал с тем же id и активирует его"""
+        from datetime import timedelta
+
+        # Дано
+        db = _sqlite_session(tmp_path)
+        from app import crud, models
+        material_id = _add_material(db, "Algebra 7", is_active=False, updated_at=datetime(2020, 1, 1))
+        crud.archive_inactive_materials(db, timedelta(days=30))
+
+        # Когда
+        restored = crud.restore_material(db, material_id)
+
+        # Тогда
+        assert restored.id == material_id
+        assert restored.is_active is True
+        assert db.get(models.ArchivedMaterial, material_id) is None
+        assert crud.restore_material(db, material_id) is None
+
+    def test_update_moves_archived_material_back_to_hot_table(self, tmp_path):
+        """Тест - изменение архивного материала возвращает его в основную таблицу неактивным"""
+        from datetime import timedelta
+
+        # Дано
+        db = _sqlite_session(tmp_path)
+        from app import crud, models, schemas
+        material_id = _add_material(db, "Algebra 7", is_active=False, updated_at=datetime(2020, 1, 1))
+        crud.archive_inactive_materials(db, timedelta(days=30))
+
+        # Когда
+        updated = crud.update_material(db, material_id, schemas.MaterialUpdate(title="Algebra 8"))
+
+        # Тогда
+        assert isinstance(updated, models.Material)
+        assert (updated.id, updated.title, updated.is_active) == (material_id, "Algebra 8", False)
+        assert db.get(models.ArchivedMaterial, material_id) is None
+        assert crud.archive_inactive_materials(db, timedelta(days=30)) == 0
+
+    def test_deactivate_archived_material_is_a_no_op(self, tmp_path):
+        """Тест - деактивация архивного материала возвращает его без изменений"""
+        from datetime import timedelta
+
+        # Дано
+        db = _sqlite_session(tmp_path)
+        from app import crud, models
+        material_id = _add_material(db, "Algebra 7", is_active=False, updated_at=datetime(2020, 1, 1))
+        crud.archive_inactive_materials(db, timedelta(days=30))
+
+        # Когда
+        deactivated = crud.deactivate_material(db, material_id)
+
+        # Тогда
+        assert isinstance(deactivated, models.ArchivedMaterial)
+        assert deactivated.is_active is False
+        assert crud.get_material(db, material_id) is None
+        assert crud.deactivate_material(db, material_id + 1) is None
+
+    def test_new_ids_never_reuse_archived_ones(self, tmp_path):
+        """Тест - новый материал не получает id материала из архива"""
+        from datetime import timedelta
+
+        # Дано
+        db = _sqlite_session(tmp_path)
+        from app import crud
+        archived_id = _add_material(db, "Algebra 7", is_active=False, updated_at=datetime(2020, 1, 1))
+        crud.archive_inactive_materials(db, timedelta(days=30))
+
+        # Когда
+        new_id = _add_material(db, "Geometry 9")
+
+        # Тогда
+        assert new_id > archived_id
+
+    def test_upgrade_rebuilds_table_created_before_archiving(self, tmp_path):
+        """Тест - таблица из старой схемы получает AUTOINCREMENT и частичный индекс"""
+        from sqlalchemy import create_engine, text
+
+        # Дано
+        _sqlite_session(tmp_path)
+        from app import models
+        engine = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE materials (id INTEGER PRIMARY KEY, title VARCHAR(200) NOT NULL, "
+                "description TEXT, content_url VARCHAR(500), file_type VARCHAR(50), subject VARCHAR(100), "
+                "grade_level VARCHAR(50), created_by VARCHAR(100), is_active BOOLEAN, "
+                "created_at DATETIME DEFAULT CURRENT_TIMESTAMP, updated_at DATETIME)"
+            ))
+            conn.execute(text("CREATE INDEX ix_materials_title ON materials (title)"))
+            conn.execute(text("INSERT INTO materials (id, title, is_active) VALUES (1, 'Algebra 7', 1)"))
+        models.Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO materials_archive (id, title) VALUES (9, 'Archived')"))
+
+        # Когда
+        models.upgrade_archive_schema(engine)
+        models.upgrade_archive_schema(engine)
+
+        # Тогда
+        with engine.begin() as conn:
+            table_sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'materials'")).scalar()
+            indexes = set(conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'materials'"
+            )).scalars())
+            titles = conn.execute(text("SELECT title FROM materials")).scalars().all()
+            conn.execute(text("INSERT INTO materials (title) VALUES ('Geometry 9')"))
+            new_id = conn.execute(text("SELECT id FROM materials WHERE title = 'Geometry 9'")).scalar()
+        assert "AUTOINCREMENT" in table_sql
+        assert {"ix_materials_title", "ix_materials_inactive_updated_at"} <= indexes
+        assert titles == ["Algebra 7"]
+        assert new_id == 10
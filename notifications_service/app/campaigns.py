@@ -0,0 +1,179 @@
+"""
+Mail-merge campaigns: one templated email to many recipients.
+
+Recipients arrive as an NDJSON stream (one object per line with "email"
+and the template variables). Lines are grouped into chunks and rendered in
+a process pool (app.email.mailmerge); each rendered chunk is inserted as
+pending notifications carrying the finished MIME message, which the
+delivery workers send as is.
+
+Backpressure keeps memory bounded for any number of recipients:
+
+- at most `campaign_max_inflight_chunks` chunks render at once; reading
+  the stream pauses (and the client's upload with it) until one is done;
+- while more than `campaign_max_queued` of the campaign's notifications are
+  waiting to be sent, loading pauses until the workers drain the queue. The
+  waiting count is kept in memory as an upper bound (workers only drain the
+  queue) and re-read from the database only when it reaches the limit.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional, Set, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from . import crud, models, schemas
+from .config import settings
+from .database import SessionLocal
+from .email.mailmerge import render_chunk
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def render_processes() -> int:
+    return settings.campaign_render_processes or os.cpu_count() or 1
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all campaigns of this server process"""
+    global _pool
+    if _pool is None:
+        # spawn: don't fork a process that runs an event loop and threads
+        _pool = ProcessPoolExecutor(
+            max_workers=render_processes(),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def shutdown_render_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def read_ndjson_chunks(stream: AsyncIterator[bytes], chunk_size: int) -> AsyncIterator[List[Tuple[int, bytes]]]:
+    """Split a byte stream into chunks of (line_number, line), skipping blank lines"""
+    buffer = b""
+    line_number = 0
+    chunk: List[Tuple[int, bytes]] = []
+    async for data in stream:
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                chunk.append((line_number, line))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+    if buffer.strip():
+        chunk.append((line_number + 1, buffer))
+    if chunk:
+        yield chunk
+
+
+def with_session(func, *args):
+    """Run a crud function in its own session (for run_in_threadpool)"""
+    db = SessionLocal()
+    try:
+        return func(db, *args)
+    finally:
+        db.close()
+
+
+class QueueRoom:
+    """
+    Upper bound of a campaign's notifications waiting to be sent: the last
+    count read from the database plus the rows queued since
+    """
+
+    def __init__(self, campaign_id: int):
+        self.campaign_id = campaign_id
+        self.waiting: Optional[int] = None  # Unknown until first counted
+
+    def queued(self, count: int) -> None:
+        if self.waiting is not None:
+            self.waiting += count
+
+    async def wait(self) -> None:
+        """Return once fewer than `campaign_max_queued` are waiting"""
+        if self.waiting is not None and self.waiting < settings.campaign_max_queued:
+            return
+        while True:
+            self.waiting = await run_in_threadpool(
+                with_session, crud.count_waiting_campaign_notifications, self.campaign_id
+            )
+            if self.waiting < settings.campaign_max_queued:
+                return
+            await asyncio.sleep(settings.campaign_queue_poll_seconds)
+
+
+async def load_recipients(campaign: models.Campaign, stream: AsyncIterator[bytes]) -> None:
+    """Render and queue every recipient in `stream` for an existing campaign"""
+    loop = asyncio.get_running_loop()
+    pool = get_render_pool()
+    max_inflight = settings.campaign_max_inflight_chunks or 2 * render_processes()
+    in_flight: Set[asyncio.Future] = set()
+    render_args = (campaign.subject_template, campaign.body_template, settings.email_from)
+    room = QueueRoom(campaign.id)
+
+    async def store(done: Set[asyncio.Future]) -> None:
+        for future in done:
+            rows, errors = future.result()
+            await run_in_threadpool(with_session, crud.add_campaign_chunk, campaign.id, rows, errors)
+            room.queued(len(rows))
+
+    try:
+        async for chunk in read_ndjson_chunks(stream, settings.campaign_chunk_size):
+            if len(in_flight) >= max_inflight:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                await store(done)
+            await room.wait()
+            in_flight.add(loop.run_in_executor(pool, render_chunk, *render_args, chunk))
+        if in_flight:
+            done, in_flight = await asyncio.wait(in_flight)
+            await store(done)
+    except BaseException as e:
+        for future in in_flight:
+            future.cancel()
+        logger.exception("Loading recipients for campaign %s failed", campaign.id)
+        await run_in_threadpool(
+            with_session, crud.finish_campaign_load, campaign.id, "failed", f"Loading stopped: {e!r}"
+        )
+        raise
+    await run_in_threadpool(with_session, crud.finish_campaign_load, campaign.id, "queued")
+
+
+def _seconds_since(start: Optional[datetime], end: datetime) -> Optional[float]:
+    if start is None:
+        return None
+    if start.tzinfo is not None:
+        start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    if end.tzinfo is not None:
+        end = end.astimezone(timezone.utc).replace(tzinfo=None)
+    return max((end - start).total_seconds(), 1e-6)
+
+
+def campaign_progress(db, campaign: models.Campaign) -> schemas.CampaignProgress:
+    """Counters, delivery status and throughput of a campaign"""
+    delivery, last_sent_at = crud.get_campaign_delivery_stats(db, campaign.id)
+    now = datetime.utcnow()
+    render_seconds = _seconds_since(campaign.started_at, campaign.loaded_at or now)
+    waiting = delivery.get("pending", 0) + delivery.get("processing", 0)
+    send_seconds = _seconds_since(campaign.started_at, last_sent_at if waiting == 0 and last_sent_at else now)
+    sent = delivery.get("sent", 0)
+    return schemas.CampaignProgress(
+        campaign=schemas.CampaignResponse.model_validate(campaign),
+        delivery=delivery,
+        rendered_per_second=round(campaign.rendered_count / render_seconds, 1) if render_seconds else None,
+        sent_per_second=round(sent / send_seconds, 1) if send_seconds and sent else None,
+        done=campaign.status == models.CampaignStatus.QUEUED and waiting == 0
+    )
@@ -1,5 +1,6 @@
 
 import os
+from typing import Dict
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -13,11 +14,78 @@ class Settings(BaseSettings):
     email_password: str = os.getenv("EMAIL_PASSWORD", "")
     email_from: str = os.getenv("EMAIL_FROM", "noreply@educenter.com")
     
-    # Retry settings
+    # Retry settings (app/retry.py): exponential backoff with jitter, then dead_letter
     max_retry_attempts: int = 3
     retry_delay_seconds: int = 60
+    retry_max_delay_seconds: int = 3600
+    
+    # Digests: notifications for the same recipient and event_type arriving
+    # within the window are merged into one email
+    digest_event_types: str = ""              # Comma-separated, e.g. "material_created"
+    digest_window_seconds: int = 300
+    
+    # Retention (app/retention.py): finished notifications move to
+    # notify_db_archive, archived rows are deleted later; both in small batches
+    retention_archive_after_days: float = 30
+    retention_delete_after_days: float = 365
+    retention_interval_seconds: float = 3600   # 0 disables the purger
+    retention_batch_size: int = 500
+    retention_max_batches: int = 100          # Per table and run
+    retention_batch_pause_seconds: float = 0.05  # Lets other writers in between batches
+    
+    # Delivery statistics (app/stats.py)
+    stats_counter_shards: int = 8             # Rows per counter key, spreads lock contention
+    stats_minute_rollup_retention_hours: float = 48
+    stats_hour_rollup_retention_days: float = 90
+    
+    # Event fan-out to subscribers (POST /notifications/events)
+    fanout_chunk_size: int = 1000              # Recipients per bulk insert and transaction
+    
+    # Status change stream (GET /notifications/stream)
+    sse_queue_size: int = 100                  # Buffered events per client; the oldest are dropped beyond
+    sse_heartbeat_seconds: float = 15.0        # Keep-alive comment when nothing happened
+    sse_presence_check_seconds: float = 5.0    # How often writers check for subscribers before NOTIFY
+    
+    # Idempotency-Key header on /send and /send-now
+    idempotency_key_ttl_seconds: int = 24 * 3600
+    
+    # Delivery worker (python -m app.worker)
+    worker_concurrency: int = 4                 # Parallel sends per worker process
+    worker_batch_size: int = 50                 # Rows claimed per query
+    worker_poll_interval_seconds: float = 2.0   # Sleep when the queue is empty
+    worker_visibility_timeout_seconds: int = 300  # Reclaim rows stuck in processing
+    worker_group_max_recipients: int = 50       # Identical emails sent in one SMTP transaction, 1 = off
+    worker_heartbeat_seconds: float = 10.0      # Workers report their SMTP breaker for /health
+    
+    # Priority lanes in the worker. Each claimed batch is shared among the
+    # lanes by weight; a lane with fewer due rows leaves its share to the others.
+    # The express lane has its own threads and only sends high priority.
+    worker_lane_weights: Dict[str, int] = {"high": 6, "normal": 3, "bulk": 1}
+    worker_express_concurrency: int = 2         # Threads reserved for high priority, 0 = no express lane
+    worker_express_poll_interval_seconds: float = 0.5
+    
+    # Fair share across service_source values in each lane (app/fairness.py).
+    # JSON, e.g. {"material_service": 3}; sources without a weight weigh 1
+    fair_source_weights: Dict[str, float] = {}
+    fair_source_max_processing: Dict[str, int] = {}  # In flight across all workers, per source
+    
+    # Per-recipient-domain limits in the worker (app/throttle.py), per process.
+    # JSON, e.g. {"gmail.com": {"rate": 5, "burst": 10, "concurrency": 2}}
+    domain_limits: Dict[str, Dict[str, float]] = {}
+    domain_default_rate: float = 0              # Sends per second per domain, 0 = unlimited
+    domain_default_burst: float = 0
+    domain_default_concurrency: int = 0         # 0 = unlimited
+    throttle_max_hold_seconds: float = 5.0      # Longer waits put the notification back in the queue
+    
+    # Campaigns (mail merge)
+    campaign_render_processes: int = 0          # Render processes, 0 = one per CPU
+    campaign_chunk_size: int = 500              # Recipients per render task
+    campaign_max_inflight_chunks: int = 0       # Chunks rendering at once, 0 = 2 per process
+    campaign_max_queued: int = 20000            # Pause loading while more are waiting to be sent
+    campaign_queue_poll_seconds: float = 1.0
     
     class Config:
         env_file = ".env"
+        extra = "ignore"  # .env also holds keys for other components (SECRET_KEY, ...)
 
 settings = Settings()
\ No newline at end of file
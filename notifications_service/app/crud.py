@@ -1,31 +1,190 @@
 from sqlalchemy.orm import Session
-from . import models, schemas
-from typing import List, Optional
-from datetime import datetime
+from sqlalchemy import or_, and_, insert, func, select, delete, literal, tuple_
+from sqlalchemy.exc import IntegrityError
+import base64
+import heapq
+import time
+from types import SimpleNamespace
+from . import models, schemas, stats, status_events
+from .config import settings
+from typing import Iterator, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from .retry import backoff_delay, retries_exhausted
+
+# Timestamps are stored as naive UTC (datetime.utcnow())
+def _as_utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+# Event types merged into digests by default (DIGEST_EVENT_TYPES)
+def _is_digest_event(event_type: Optional[str]) -> bool:
+    return event_type in {e.strip() for e in settings.digest_event_types.split(",") if e.strip()}
+
+# Digest key for notifications that should be merged into a digest, else None
+def _digest_key(notification: schemas.NotificationCreate) -> Optional[str]:
+    use_digest = notification.digest
+    if use_digest is None:
+        use_digest = _is_digest_event(notification.event_type)
+    if not use_digest:
+        return None
+    return f"{notification.recipient_email.lower()}|{notification.event_type or ''}"
+
+# Column values for a new notification: scheduling and digest coalescing
+def _notification_values(notification: schemas.NotificationCreate, now: datetime) -> dict:
+    values = notification.dict(exclude={"digest"})
+    values["priority"] = notification.priority.value
+    values["send_at"] = _as_utc_naive(values["send_at"])
+    values["next_attempt_at"] = values["send_at"] or now
+    digest_key = _digest_key(notification)
+    if digest_key is not None:
+        # Hold it for the window so later notifications can join the digest
+        values["digest_key"] = digest_key
+        values["next_attempt_at"] = max(values["next_attempt_at"], now + timedelta(seconds=settings.digest_window_seconds))
+    return values
 
 # Create notification
-def create_notification(db: Session, notification: schemas.NotificationCreate) -> models.Notification:
-    db_notification = models.Notification(**notification.dict())
+# With `claimed_by` the row is created already claimed, so delivery
+# workers leave it to the caller that sends it inline (send-now).
+def create_notification(
+    db: Session,
+    notification: schemas.NotificationCreate,
+    claimed_by: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
+    idempotency_ttl_seconds: int = 0
+) -> models.Notification:
+    now = datetime.utcnow()
+    values = _notification_values(notification, now)
+    if claimed_by is not None:
+        # Sent inline right away, never merged into a digest
+        values.pop("digest_key", None)
+        values["next_attempt_at"] = now
+    db_notification = models.Notification(**values)
+    if idempotency_key is not None:
+        db_notification.idempotency_key = idempotency_key
+        db_notification.idempotency_expires_at = datetime.utcnow() + timedelta(seconds=idempotency_ttl_seconds)
+    batch = stats.StatsBatch()
+    batch.created(db_notification.service_source, db_notification.event_type, at=now)
+    if claimed_by is not None:
+        db_notification.status = "processing"
+        db_notification.claimed_at = datetime.utcnow()
+        db_notification.claimed_by = claimed_by
+        batch.transition(db_notification.service_source, db_notification.event_type, "pending", "processing")
     db.add(db_notification)
+    db.flush()
+    status_events.publish(db, [db_notification])
+    batch.flush(db)
     db.commit()
     db.refresh(db_notification)
     return db_notification
 
+# Create a notification unless one with the same idempotency key exists.
+# Returns (notification, created). Concurrent duplicates are settled by the
+# unique index: the losing insert fails and returns the winner's row.
+def create_notification_idempotent(
+    db: Session,
+    notification: schemas.NotificationCreate,
+    idempotency_key: str,
+    ttl_seconds: int,
+    claimed_by: Optional[str] = None
+) -> Tuple[models.Notification, bool]:
+    
+    existing = get_notification_by_idempotency_key(db, idempotency_key)
+    if existing is not None:
+        if _as_utc_naive(existing.idempotency_expires_at) > datetime.utcnow():
+            return existing, False
+        # Expired: release the key so it can be used again
+        db.query(models.Notification).filter(
+            models.Notification.id == existing.id,
+            models.Notification.idempotency_key == idempotency_key
+        ).update({
+            models.Notification.idempotency_key: None,
+            models.Notification.idempotency_expires_at: None
+        }, synchronize_session=False)
+        db.commit()
+    
+    try:
+        return create_notification(
+            db, notification, claimed_by=claimed_by,
+            idempotency_key=idempotency_key, idempotency_ttl_seconds=ttl_seconds
+        ), True
+    except IntegrityError:
+        db.rollback()
+        existing = get_notification_by_idempotency_key(db, idempotency_key)
+        if existing is None:
+            raise
+        return existing, False
+
+# Get notification by idempotency key
+def get_notification_by_idempotency_key(db: Session, idempotency_key: str) -> Optional[models.Notification]:
+    return db.query(models.Notification).filter(
+        models.Notification.idempotency_key == idempotency_key
+    ).first()
+
+# Create many notifications with multi-row INSERT ... RETURNING in one transaction
+def create_notifications_bulk(db: Session, notifications: List[schemas.NotificationCreate]) -> List[int]:
+    if not notifications:
+        return []
+    now = datetime.utcnow()
+    rows = [_notification_values(notification, now) for notification in notifications]
+    # insertmanyvalues needs every row to have the same keys
+    for row in rows:
+        row.setdefault("digest_key", None)
+    result = db.execute(
+        insert(models.Notification).returning(models.Notification.id, sort_by_parameter_order=True),
+        rows
+    )
+    ids = list(result.scalars())
+    batch = stats.StatsBatch()
+    for row in rows:
+        batch.created(row["service_source"], row["event_type"], at=now)
+    batch.flush(db)
+    status_events.publish(db, [
+        SimpleNamespace(**row, id=id_, status="pending", attempts=0, error_message=None)
+        for id_, row in zip(ids, rows)
+    ])
+    db.commit()
+    return ids
+
 # Get notification by ID
 def get_notification(db: Session, notification_id: int) -> Optional[models.Notification]:
     return db.query(models.Notification).filter(models.Notification.id == notification_id).first()
 
-# Get all notifications
+# Opaque keyset cursor: the (created_at, id) of the last row on a page
+def encode_cursor(db_notification: models.Notification) -> str:
+    raw = f"{db_notification.created_at.isoformat()}|{db_notification.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, notification_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(notification_id)
+    except (UnicodeDecodeError, TypeError, base64.binascii.Error) as e:
+        raise ValueError("Invalid cursor") from e
+
+# Get all notifications, newest first.
+# With `cursor` (from decode_cursor) the page starts right after that row;
+# together with the (filter, created_at, id) indexes every page is an index
+# range scan, however deep, unlike `skip`.
 def get_notifications(
     db: Session, 
     skip: int = 0, 
     limit: int = 100,
     recipient_email: Optional[str] = None,
     status: Optional[str] = None,
-    service_source: Optional[str] = None
+    service_source: Optional[str] = None,
+    cursor: Optional[Tuple[datetime, int]] = None
 ) -> List[models.Notification]:
     
     query = db.query(models.Notification)
+    if cursor is not None:
+        query = query.filter(
+            tuple_(models.Notification.created_at, models.Notification.id) < tuple_(
+                literal(cursor[0], models.Notification.created_at.type), cursor[1]
+            )
+        )
     
     if recipient_email:
         query = query.filter(models.Notification.recipient_email == recipient_email)
@@ -34,31 +193,723 @@ def get_notifications(
     if service_source:
         query = query.filter(models.Notification.service_source == service_source)
     
-    return query.order_by(models.Notification.created_at.desc()).offset(skip).limit(limit).all()
+    query = query.order_by(models.Notification.created_at.desc(), models.Notification.id.desc())
+    if cursor is None and skip:
+        query = query.offset(skip)
+    return query.limit(limit).all()
 
 # Update notification status
 def update_notification_status(
     db: Session, 
     notification_id: int, 
     status: str,
-    error_message: Optional[str] = None
+    error_message: Optional[str] = None,
+    claimed_by: Optional[str] = None
 ) -> Optional[models.Notification]:
     
     db_notification = get_notification(db, notification_id)
     if not db_notification:
         return None
+    # A worker whose claim expired and was taken over must not overwrite the result
+    if claimed_by is not None and db_notification.claimed_by != claimed_by:
+        return None
     
+    batch = stats.StatsBatch()
+    batch.transition(db_notification.service_source, db_notification.event_type, db_notification.status, status)
     db_notification.status = status
     db_notification.sent_at = datetime.utcnow() if status == "sent" else None
     if error_message:
         db_notification.error_message = error_message
+    if status in ("sent", "failed", "dead_letter"):
+        batch.attempt_finished(
+            db_notification.service_source, db_notification.event_type, status,
+            db_notification.created_at, datetime.utcnow()
+        )
+    batch.flush(db)
+    status_events.publish(db, [db_notification])
+    
+    db.commit()
+    db.refresh(db_notification)
+    return db_notification
+
+# Record the outcome of a delivery attempt: sent, retry later with backoff,
+# or dead_letter once retries are exhausted
+def record_delivery_result(
+    db: Session,
+    notification_id: int,
+    success: bool,
+    error_message: Optional[str] = None,
+    claimed_by: Optional[str] = None
+) -> Optional[models.Notification]:
+    
+    db_notification = get_notification(db, notification_id)
+    if not db_notification:
+        return None
+    if claimed_by is not None and db_notification.claimed_by != claimed_by:
+        return None
+    
+    now = datetime.utcnow()
+    old_status = db_notification.status
+    db_notification.attempts = (db_notification.attempts or 0) + 1
+    db_notification.claimed_at = None
+    db_notification.claimed_by = None
+    if success:
+        db_notification.status = "sent"
+        db_notification.sent_at = now
+        db_notification.error_message = None
+    elif retries_exhausted(db_notification.attempts):
+        db_notification.status = "dead_letter"
+        db_notification.error_message = error_message
+    else:
+        db_notification.status = "pending"
+        db_notification.next_attempt_at = now + timedelta(seconds=backoff_delay(db_notification.attempts))
+        db_notification.error_message = error_message
+    
+    source, event = db_notification.service_source, db_notification.event_type
+    batch = stats.StatsBatch()
+    batch.transition(source, event, old_status, db_notification.status)
+    batch.attempt_finished(source, event, db_notification.status, db_notification.created_at, now)
+    
+    if db_notification.status != "pending":
+        _finish_digest(db, db_notification, batch)
+    batch.flush(db)
+    status_events.publish(db, [db_notification])
     
     db.commit()
     db.refresh(db_notification)
     return db_notification
 
+# A digest's final status applies to every notification merged into it
+def _finish_digest(db: Session, db_notification: models.Notification, batch: stats.StatsBatch) -> None:
+    merged = db.query(
+        models.Notification.service_source, models.Notification.event_type, func.count(models.Notification.id)
+    ).filter(
+        models.Notification.digest_id == db_notification.id,
+        models.Notification.status == "digested"
+    ).group_by(models.Notification.service_source, models.Notification.event_type).all()
+    for merged_source, merged_event, count in merged:
+        batch.transition(merged_source, merged_event, "digested", db_notification.status, count)
+    if merged:
+        status_events.publish(db, db.query(models.Notification).filter(
+            models.Notification.digest_id == db_notification.id
+        ), status=db_notification.status)
+    db.query(models.Notification).filter(
+        models.Notification.digest_id == db_notification.id
+    ).update({
+        models.Notification.status: db_notification.status,
+        models.Notification.sent_at: db_notification.sent_at,
+    }, synchronize_session=False)
+
+# Match a service_source as keyed in the statistics counters ("" = none)
+def _source_filter(service_source: str):
+    if service_source:
+        return models.Notification.service_source == service_source
+    return or_(models.Notification.service_source.is_(None), models.Notification.service_source == "")
+
 # Get pending notifications
-def get_pending_notifications(db: Session, limit: int = 10) -> List[models.Notification]:
+def get_pending_notifications(
+    db: Session,
+    limit: int = 10,
+    stale_claims_before: Optional[datetime] = None,
+    skip_locked: bool = False,
+    priority: Optional[str] = None,
+    service_source: Optional[str] = None,
+    exclude_sources: Optional[List[str]] = None
+) -> List[models.Notification]:
+    
+    # Only rows that are due; the (status, next_attempt_at) index makes this a range scan
+    pending = and_(
+        models.Notification.status == "pending",
+        models.Notification.next_attempt_at <= datetime.utcnow()
+    )
+    if stale_claims_before is not None:
+        # Claims older than the visibility timeout are up for grabs again
+        pending = or_(pending, and_(
+            models.Notification.status == "processing",
+            models.Notification.claimed_at < stale_claims_before
+        ))
+    if priority is not None:
+        # One lane: a range scan of the (status, priority, next_attempt_at) index
+        pending = and_(models.Notification.priority == priority, pending)
+    if service_source is not None:
+        # One source ("" = none) of a lane: (status, priority, service_source, next_attempt_at)
+        pending = and_(_source_filter(service_source), pending)
+    if exclude_sources:
+        pending = and_(~or_(*(_source_filter(source) for source in exclude_sources)), pending)
+    
+    query = db.query(models.Notification).filter(pending).order_by(
+        models.Notification.next_attempt_at
+    ).limit(limit)
+    if skip_locked:
+        query = query.with_for_update(skip_locked=True)
+    return query.all()
+
+# Claim a batch of pending notifications for delivery.
+# FOR UPDATE SKIP LOCKED lets any number of workers claim concurrently
+# without blocking on, or double-claiming, each other's rows.
+def claim_pending_notifications(
+    db: Session,
+    worker_id: str,
+    limit: int,
+    visibility_timeout_seconds: int,
+    priority: Optional[str] = None,
+    exclude_sources: Optional[List[str]] = None
+) -> List[models.Notification]:
+    
+    now = datetime.utcnow()
+    claimed = get_pending_notifications(
+        db,
+        limit=limit,
+        stale_claims_before=now - timedelta(seconds=visibility_timeout_seconds),
+        skip_locked=True,
+        priority=priority,
+        exclude_sources=exclude_sources
+    )
+    return _claim(db, claimed, worker_id, now)
+
+# Claim pending notifications of several service_sources in one transaction,
+# with an indexed scan per source; `shares` is a list of (service_source, limit)
+def claim_pending_by_source(
+    db: Session,
+    worker_id: str,
+    shares: List[Tuple[str, int]],
+    visibility_timeout_seconds: int,
+    priority: Optional[str] = None
+) -> List[models.Notification]:
+    
+    now = datetime.utcnow()
+    claimed = []
+    for service_source, limit in shares:
+        claimed.extend(get_pending_notifications(
+            db,
+            limit=limit,
+            stale_claims_before=now - timedelta(seconds=visibility_timeout_seconds),
+            skip_locked=True,
+            priority=priority,
+            service_source=service_source
+        ))
+    return _claim(db, claimed, worker_id, now)
+
+# Mark selected rows as claimed by `worker_id` and commit. Taking over an
+# expired claim uses up an attempt (its worker crashed or hung on the row),
+# so a notification that keeps killing workers ends up in dead_letter.
+def _claim(db: Session, claimed: List[models.Notification], worker_id: str, now: datetime) -> List[models.Notification]:
+    ids = []
+    batch = stats.StatsBatch()
+    for db_notification in claimed:
+        source, event = db_notification.service_source, db_notification.event_type
+        if db_notification.status == "processing":
+            db_notification.attempts = (db_notification.attempts or 0) + 1
+            if retries_exhausted(db_notification.attempts):
+                batch.transition(source, event, "processing", "dead_letter")
+                batch.attempt_finished(source, event, "dead_letter", db_notification.created_at, now)
+                db_notification.status = "dead_letter"
+                db_notification.error_message = "Delivery did not finish within the visibility timeout"
+                db_notification.claimed_at = None
+                db_notification.claimed_by = None
+                _finish_digest(db, db_notification, batch)
+                continue
+        batch.transition(source, event, db_notification.status, "processing")
+        db_notification.status = "processing"
+        db_notification.claimed_at = now
+        db_notification.claimed_by = worker_id
+        ids.append(db_notification.id)
+    batch.flush(db)
+    status_events.publish(db, claimed)
+    db.commit()
+    
+    if not ids:
+        return []
+    return db.query(models.Notification).filter(models.Notification.id.in_(ids)).order_by(
+        models.Notification.next_attempt_at
+    ).all()
+
+# Put claimed notifications back in the queue without using up an attempt
+# (e.g. their recipient domain is rate limited); `delays` maps id -> seconds
+def defer_notifications(db: Session, delays: dict, claimed_by: str) -> int:
+    if not delays:
+        return 0
+    now = datetime.utcnow()
+    rows = db.query(models.Notification).filter(
+        models.Notification.id.in_(list(delays)),
+        models.Notification.claimed_by == claimed_by
+    ).all()
+    batch = stats.StatsBatch()
+    for db_notification in rows:
+        batch.transition(db_notification.service_source, db_notification.event_type, db_notification.status, "pending")
+        db_notification.status = "pending"
+        db_notification.next_attempt_at = now + timedelta(seconds=delays[db_notification.id])
+        db_notification.claimed_at = None
+        db_notification.claimed_by = None
+    batch.flush(db)
+    status_events.publish(db, rows)
+    db.commit()
+    return len(rows)
+
+# Lock the pending notifications waiting to join a digest
+def lock_pending_digest_sources(db: Session, digest_key: str, exclude_ids: List[int]) -> List[models.Notification]:
     return db.query(models.Notification).filter(
+        models.Notification.digest_key == digest_key,
+        models.Notification.status == "pending",
+        ~models.Notification.id.in_(exclude_ids)
+    ).order_by(models.Notification.created_at).with_for_update(skip_locked=True).all()
+
+# Create a digest claimed by `worker_id` and link its sources to it with a single UPDATE
+def create_digest(
+    db: Session,
+    sources: List[models.Notification],
+    subject: str,
+    message: str,
+    mime_message: str,
+    worker_id: str
+) -> models.Notification:
+    
+    first = sources[0]
+    now = datetime.utcnow()
+    digest = models.Notification(
+        recipient_email=first.recipient_email,
+        subject=subject,
+        message=message,
+        mime_message=mime_message,
+        notification_type=first.notification_type,
+        priority=first.priority,
+        service_source=first.service_source,
+        event_type=first.event_type,
+        status="processing",
+        claimed_at=now,
+        claimed_by=worker_id,
+        next_attempt_at=now
+    )
+    db.add(digest)
+    db.flush()
+    batch = stats.StatsBatch()
+    batch.transition(digest.service_source, digest.event_type, None, "processing")
+    for source in sources:
+        batch.transition(source.service_source, source.event_type, source.status, "digested")
+    batch.flush(db)
+    status_events.publish(db, [digest])
+    status_events.publish(db, sources, status="digested")
+    db.query(models.Notification).filter(
+        models.Notification.id.in_([source.id for source in sources])
+    ).update({
+        models.Notification.status: "digested",
+        models.Notification.digest_id: digest.id,
+        models.Notification.claimed_at: None,
+        models.Notification.claimed_by: None,
+    }, synchronize_session=False)
+    db.commit()
+    db.refresh(digest)
+    return digest
+
+# Notifications waiting and in flight per service_source ("" = none), from
+# the statistics counters: {source: {"pending": n, "processing": n}}
+def get_queue_depths(db: Session) -> dict:
+    Counter = models.NotificationCounter
+    rows = db.query(Counter.service_source, Counter.status, func.sum(Counter.count)).filter(
+        Counter.status.in_(("pending", "processing"))
+    ).group_by(Counter.service_source, Counter.status)
+    depths = {}
+    for source, status, count in rows:
+        if count:
+            depths.setdefault(source, {"pending": 0, "processing": 0})[status] = int(count)
+    return depths
+
+# Earliest time a pending notification becomes due (scheduled sends and retries)
+def get_next_due_time(db: Session) -> Optional[datetime]:
+    return db.query(func.min(models.Notification.next_attempt_at)).filter(
         models.Notification.status == "pending"
-    ).order_by(models.Notification.created_at).limit(limit).all()
\ No newline at end of file
+    ).scalar()
+
+# Record a worker's SMTP circuit breaker state (app/email/breaker.py stats)
+def record_worker_heartbeat(db: Session, worker_id: str, breaker: dict) -> None:
+    values = {
+        models.WorkerHeartbeat.breaker_state: breaker["state"],
+        models.WorkerHeartbeat.failure_rate: breaker["failure_rate"],
+        models.WorkerHeartbeat.updated_at: datetime.utcnow(),
+    }
+    updated = db.query(models.WorkerHeartbeat).filter(
+        models.WorkerHeartbeat.worker_id == worker_id
+    ).update(values, synchronize_session=False)
+    if not updated:
+        db.add(models.WorkerHeartbeat(worker_id=worker_id, **{column.key: value for column, value in values.items()}))
+    db.commit()
+
+# A stopping worker leaves no stale heartbeat behind
+def delete_worker_heartbeat(db: Session, worker_id: str) -> None:
+    db.query(models.WorkerHeartbeat).filter(models.WorkerHeartbeat.worker_id == worker_id).delete()
+    db.commit()
+
+# Workers that reported since `since` (UTC)
+def get_worker_heartbeats(db: Session, since: datetime) -> List[models.WorkerHeartbeat]:
+    return db.query(models.WorkerHeartbeat).filter(
+        models.WorkerHeartbeat.updated_at >= since
+    ).order_by(models.WorkerHeartbeat.worker_id).all()
+
+# Put a notification back in the queue (manual retry)
+def requeue_notification(db: Session, db_notification: models.Notification) -> models.Notification:
+    batch = stats.StatsBatch()
+    batch.transition(db_notification.service_source, db_notification.event_type, db_notification.status, "pending")
+    batch.flush(db)
+    db_notification.status = "pending"
+    db_notification.error_message = None
+    db_notification.attempts = 0
+    db_notification.next_attempt_at = datetime.utcnow()
+    db_notification.claimed_at = None
+    db_notification.claimed_by = None
+    status_events.publish(db, [db_notification])
+    db.commit()
+    db.refresh(db_notification)
+    return db_notification
+
+# Create campaign
+def create_campaign(db: Session, campaign: schemas.CampaignCreate) -> models.Campaign:
+    db_campaign = models.Campaign(**campaign.dict())
+    db.add(db_campaign)
+    db.commit()
+    db.refresh(db_campaign)
+    return db_campaign
+
+# Get campaign by ID
+def get_campaign(db: Session, campaign_id: int) -> Optional[models.Campaign]:
+    return db.query(models.Campaign).filter(models.Campaign.id == campaign_id).first()
+
+# Mark a campaign as loading recipients
+def start_campaign_load(db: Session, campaign_id: int) -> Optional[models.Campaign]:
+    db_campaign = get_campaign(db, campaign_id)
+    if not db_campaign:
+        return None
+    db_campaign.status = "loading"
+    if db_campaign.started_at is None:
+        db_campaign.started_at = datetime.utcnow()
+    db.commit()
+    db.refresh(db_campaign)
+    return db_campaign
+
+# Queue one rendered chunk of a campaign and update its counters in the same transaction
+def add_campaign_chunk(db: Session, campaign_id: int, rows: List[dict], errors: List[str]) -> None:
+    campaign = db.query(models.Campaign).filter(models.Campaign.id == campaign_id).first()
+    if rows:
+        db.execute(insert(models.Notification), [
+            {
+                **row,
+                "campaign_id": campaign_id,
+                "priority": "bulk",
+                "service_source": campaign.service_source,
+                "event_type": campaign.event_type,
+            }
+            for row in rows
+        ])
+        batch = stats.StatsBatch()
+        batch.created(campaign.service_source, campaign.event_type, len(rows))
+        batch.flush(db)
+    db.query(models.Campaign).filter(models.Campaign.id == campaign_id).update({
+        models.Campaign.rendered_count: models.Campaign.rendered_count + len(rows),
+        models.Campaign.failed_count: models.Campaign.failed_count + len(errors),
+        models.Campaign.error_message: errors[-1] if errors else models.Campaign.error_message,
+    }, synchronize_session=False)
+    db.commit()
+
+# Mark a recipient upload as finished
+def finish_campaign_load(db: Session, campaign_id: int, status: str, error_message: Optional[str] = None) -> None:
+    values = {models.Campaign.status: status, models.Campaign.loaded_at: datetime.utcnow()}
+    if error_message:
+        values[models.Campaign.error_message] = error_message
+    db.query(models.Campaign).filter(models.Campaign.id == campaign_id).update(values, synchronize_session=False)
+    db.commit()
+
+# Count campaign notifications not yet sent or failed
+def count_waiting_campaign_notifications(db: Session, campaign_id: int) -> int:
+    return db.query(func.count(models.Notification.id)).filter(
+        models.Notification.campaign_id == campaign_id,
+        models.Notification.status.in_(["pending", "processing"])
+    ).scalar()
+
+# Notification count per status and the time of the last send for a campaign
+def get_campaign_delivery_stats(db: Session, campaign_id: int):
+    rows = db.query(
+        models.Notification.status, func.count(models.Notification.id), func.max(models.Notification.sent_at)
+    ).filter(models.Notification.campaign_id == campaign_id).group_by(models.Notification.status).all()
+    counts = {getattr(status, "value", status): count for status, count, _ in rows}
+    last_sent_at = max((last for _, _, last in rows if last is not None), default=None)
+    return counts, last_sent_at
+
+# Statuses after which a notification is never touched again
+FINAL_STATUSES = ["sent", "failed", "dead_letter"]
+
+_ARCHIVE_COLUMNS = [
+    "id", "recipient_email", "subject", "message", "notification_type", "status",
+    "service_source", "event_type", "created_at", "sent_at", "error_message",
+    "attempts", "campaign_id", "digest_id",
+]
+
+# Move finished notifications older than `older_than` to the archive table,
+# one batch per transaction (the rendered MIME message is not kept)
+def archive_old_notifications(
+    db: Session,
+    older_than: timedelta,
+    batch_size: int = 500,
+    max_batches: Optional[int] = None,
+    pause_seconds: float = 0
+) -> int:
+    cutoff = datetime.utcnow() - older_than
+    Notification = models.Notification
+    moved = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = db.scalars(
+            select(Notification.id).where(
+                Notification.created_at < cutoff,
+                Notification.status.in_(FINAL_STATUSES)
+            ).order_by(Notification.created_at).limit(batch_size).with_for_update(skip_locked=True)
+        ).all()
+        if not ids:
+            break
+        
+        batch = stats.StatsBatch()
+        for source, event, status, count in db.query(
+            Notification.service_source, Notification.event_type, Notification.status, func.count(Notification.id)
+        ).filter(Notification.id.in_(ids)).group_by(
+            Notification.service_source, Notification.event_type, Notification.status
+        ):
+            batch.transition(source, event, status, None, count)
+        batch.flush(db)
+        
+        columns = [getattr(Notification, name) for name in _ARCHIVE_COLUMNS]
+        db.execute(insert(models.ArchivedNotification).from_select(
+            _ARCHIVE_COLUMNS, select(*columns).where(Notification.id.in_(ids))
+        ))
+        db.execute(delete(Notification).where(Notification.id.in_(ids)))
+        db.commit()
+        moved += len(ids)
+        batches += 1
+        if pause_seconds:
+            time.sleep(pause_seconds)
+    return moved
+
+# Delete archived notifications older than `older_than`, in batches
+def delete_archived_notifications(
+    db: Session,
+    older_than: timedelta,
+    batch_size: int = 500,
+    max_batches: Optional[int] = None,
+    pause_seconds: float = 0
+) -> int:
+    cutoff = datetime.utcnow() - older_than
+    Archived = models.ArchivedNotification
+    deleted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = db.scalars(
+            select(Archived.id).where(Archived.archived_at < cutoff).order_by(
+                Archived.archived_at
+            ).limit(batch_size).with_for_update(skip_locked=True)
+        ).all()
+        if not ids:
+            break
+        db.execute(delete(Archived).where(Archived.id.in_(ids)))
+        db.commit()
+        deleted += len(ids)
+        batches += 1
+        if pause_seconds:
+            time.sleep(pause_seconds)
+    return deleted
+
+# Clear idempotency keys past their TTL so the unique index stays small
+def release_expired_idempotency_keys(db: Session, batch_size: int = 500, max_batches: Optional[int] = None) -> int:
+    Notification = models.Notification
+    released = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = db.scalars(
+            select(Notification.id).where(
+                Notification.idempotency_key.isnot(None),
+                Notification.idempotency_expires_at < datetime.utcnow()
+            ).limit(batch_size).with_for_update(skip_locked=True)
+        ).all()
+        if not ids:
+            break
+        db.query(Notification).filter(Notification.id.in_(ids)).update({
+            Notification.idempotency_key: None,
+            Notification.idempotency_expires_at: None,
+        }, synchronize_session=False)
+        db.commit()
+        released += len(ids)
+        batches += 1
+    return released
+
+# Delivery statistics from the incremental counters and rollups (app/stats.py)
+def get_delivery_stats(
+    db: Session,
+    service_source: Optional[str] = None,
+    event_type: Optional[str] = None,
+    granularity: str = "minute",
+    since: Optional[datetime] = None
+) -> dict:
+    Counter, Rollup = models.NotificationCounter, models.NotificationRollup
+    
+    counters = db.query(
+        Counter.service_source, Counter.event_type, Counter.status, func.sum(Counter.count)
+    )
+    rollups = db.query(
+        Rollup.bucket_start,
+        func.sum(Rollup.created), func.sum(Rollup.sent), func.sum(Rollup.failed),
+        func.sum(Rollup.retried), func.sum(Rollup.send_latency_seconds)
+    ).filter(Rollup.granularity == granularity)
+    if service_source is not None:
+        counters = counters.filter(Counter.service_source == service_source)
+        rollups = rollups.filter(Rollup.service_source == service_source)
+    if event_type is not None:
+        counters = counters.filter(Counter.event_type == event_type)
+        rollups = rollups.filter(Rollup.event_type == event_type)
+    if since is not None:
+        rollups = rollups.filter(Rollup.bucket_start >= stats.bucket_start(since, granularity))
+    
+    counter_rows = [
+        {"service_source": source or None, "event_type": event or None, "status": status, "count": int(count)}
+        for source, event, status, count in counters.group_by(
+            Counter.service_source, Counter.event_type, Counter.status
+        ).order_by(Counter.service_source, Counter.event_type, Counter.status)
+        if count
+    ]
+    totals = {}
+    for row in counter_rows:
+        totals[row["status"]] = totals.get(row["status"], 0) + row["count"]
+    
+    buckets = [
+        {
+            "bucket_start": start,
+            "created": int(created),
+            "sent": int(sent),
+            "failed": int(failed),
+            "retried": int(retried),
+            "avg_send_latency_seconds": round(latency / sent, 3) if sent else None,
+        }
+        for start, created, sent, failed, retried, latency in rollups.group_by(
+            Rollup.bucket_start
+        ).order_by(Rollup.bucket_start)
+    ]
+    return {"totals": totals, "counters": counter_rows, "granularity": granularity, "rollups": buckets}
+
+# Delete rollup buckets older than `older_than` for one granularity
+def delete_old_rollups(db: Session, granularity: str, older_than: timedelta) -> int:
+    deleted = db.query(models.NotificationRollup).filter(
+        models.NotificationRollup.granularity == granularity,
+        models.NotificationRollup.bucket_start < datetime.utcnow() - older_than
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+# Subscriptions match on normalized values: stripped, single spaces, lowercase
+def normalize_subscription_value(value: str) -> str:
+    return " ".join(value.split()).lower()
+
+# Subscribe; returns (subscription, created), the existing one if already subscribed
+def create_subscription(db: Session, subscription: schemas.SubscriptionCreate) -> Tuple[models.Subscription, bool]:
+    values = {
+        "recipient_email": subscription.recipient_email.lower(),
+        "topic": subscription.topic.value,
+        "value": normalize_subscription_value(subscription.value),
+    }
+    db_subscription = models.Subscription(**values)
+    db.add(db_subscription)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return db.query(models.Subscription).filter_by(**values).one(), False
+    db.refresh(db_subscription)
+    return db_subscription, True
+
+# List subscriptions
+def get_subscriptions(
+    db: Session,
+    recipient_email: Optional[str] = None,
+    topic: Optional[str] = None,
+    value: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100
+) -> List[models.Subscription]:
+    query = db.query(models.Subscription)
+    if recipient_email:
+        query = query.filter(models.Subscription.recipient_email == recipient_email.lower())
+    if topic:
+        query = query.filter(models.Subscription.topic == topic)
+    if value:
+        query = query.filter(models.Subscription.value == normalize_subscription_value(value))
+    return query.order_by(models.Subscription.id).offset(skip).limit(limit).all()
+
+# Delete subscription
+def delete_subscription(db: Session, subscription_id: int) -> bool:
+    deleted = db.query(models.Subscription).filter(models.Subscription.id == subscription_id).delete()
+    db.commit()
+    return bool(deleted)
+
+# Distinct subscribers of any of the (topic, value) pairs, in recipient
+# order, `chunk_size` at a time. Each chunk is one keyset range scan of the
+# (topic, value, recipient_email) index per pair, merged here, so memory
+# and work per chunk stay bounded however many subscribers there are.
+def iter_subscriber_chunks(
+    db: Session,
+    topics: List[Tuple[str, str]],
+    chunk_size: int
+) -> Iterator[List[str]]:
+    
+    topics = [(topic, normalize_subscription_value(value)) for topic, value in topics if value and value.strip()]
+    after = ""
+    while topics:
+        ranges = [
+            [email for (email,) in db.query(models.Subscription.recipient_email).filter(
+                models.Subscription.topic == topic,
+                models.Subscription.value == value,
+                models.Subscription.recipient_email > after
+            ).order_by(models.Subscription.recipient_email).limit(chunk_size)]
+            for topic, value in topics
+        ]
+        chunk = []
+        for email in heapq.merge(*ranges):
+            if not chunk or chunk[-1] != email:
+                chunk.append(email)
+                if len(chunk) == chunk_size:
+                    break
+        if not chunk:
+            return
+        yield chunk
+        after = chunk[-1]
+
+# Queue the same email for every subscriber: a bulk insert and commit per chunk
+def fan_out_notifications(
+    db: Session,
+    topics: List[Tuple[str, str]],
+    subject: str,
+    message: str,
+    html_message: Optional[str] = None,
+    service_source: Optional[str] = None,
+    event_type: Optional[str] = None,
+    chunk_size: int = 1000
+) -> int:
+    
+    now = datetime.utcnow()
+    digest = _is_digest_event(event_type)
+    base = {
+        "subject": subject,
+        "message": message,
+        "html_message": html_message,
+        "priority": "bulk",
+        "service_source": service_source,
+        "event_type": event_type,
+        "next_attempt_at": now + timedelta(seconds=settings.digest_window_seconds) if digest else now,
+    }
+    queued = 0
+    for chunk in iter_subscriber_chunks(db, topics, chunk_size):
+        rows = [
+            {**base, "recipient_email": email, "digest_key": f"{email}|{event_type or ''}" if digest else None}
+            for email in chunk
+        ]
+        db.execute(insert(models.Notification), rows)
+        batch = stats.StatsBatch()
+        batch.created(service_source, event_type, len(rows), at=now)
+        batch.flush(db)
+        db.commit()
+        queued += len(rows)
+    return queued
+
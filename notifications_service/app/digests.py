@@ -0,0 +1,57 @@
+"""
+Digest coalescing for the delivery worker.
+
+Notifications created with a `digest_key` ("recipient|event_type") wait
+`digest_window_seconds` before they are due. When a worker claims one, it
+also takes every other pending notification with the same key, renders them
+as a single digest email and links them to it (`digest_id`); they leave the
+queue as `digested` and take the digest's final status when it is sent or
+dead-lettered.
+"""
+from collections import defaultdict
+from typing import Dict, List
+
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .config import settings
+from .email import templates
+from .email.sender import build_message
+
+
+def digest_subject(sources: List[models.Notification]) -> str:
+    event = (sources[0].event_type or "").replace("_", " ")
+    return f"{len(sources)} new notifications" + (f": {event}" if event else "")
+
+
+def render_digest(sources: List[models.Notification]):
+    """Returns (subject, plain text message, serialized MIME message)"""
+    subject = digest_subject(sources)
+    items = [{"subject": s.subject, "message": s.message} for s in sources]
+    message = "\n\n".join(f"{item['subject']}\n{item['message']}" for item in items)
+    html = templates.render_digest_template(subject, items)
+    mime = build_message(settings.email_from, sources[0].recipient_email, subject, message, html).as_string()
+    return subject, message, mime
+
+
+def coalesce(db: Session, claimed: List[models.Notification], worker_id: str) -> List[models.Notification]:
+    """
+    Replace claimed digest notifications by digests; returns what to deliver.
+    A digest key with a single notification is delivered as is.
+    """
+    deliver = [n for n in claimed if not n.digest_key]
+    groups: Dict[str, List[models.Notification]] = defaultdict(list)
+    for n in claimed:
+        if n.digest_key:
+            groups[n.digest_key].append(n)
+
+    for digest_key, group in groups.items():
+        others = crud.lock_pending_digest_sources(db, digest_key, [n.id for n in group])
+        sources = sorted(group + others, key=lambda n: n.created_at or n.next_attempt_at)
+        if len(sources) == 1:
+            db.commit()  # Release the (empty) lock transaction
+            deliver.extend(group)
+            continue
+        subject, message, mime = render_digest(sources)
+        deliver.append(crud.create_digest(db, sources, subject, message, mime, worker_id))
+    return deliver
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+import aiosmtplib
+from dotenv import load_dotenv
+
+from .breaker import CircuitOpenError
+from .sender import build_message, smtp_breaker, use_tls_from_env
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+_REFUSED_ERRORS = (aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPSenderRefused, aiosmtplib.SMTPDataError)
+
+
+class AsyncEmailSender:
+    """
+    asyncio-native SMTP sender for request handlers.
+    
+    Uses aiosmtplib (STARTTLS + login, see EMAIL_USE_TLS) so a slow SMTP server only delays the
+    request waiting on it, never the event loop. Concurrent sends per
+    process are capped by EMAIL_ASYNC_CONCURRENCY.
+    """
+    
+    def __init__(self):
+        self.smtp_host = os.getenv("EMAIL_HOST", "smtp.gmail.com")
+        self.smtp_port = int(os.getenv("EMAIL_PORT", 587))
+        self.smtp_user = os.getenv("EMAIL_USER")
+        self.smtp_password = os.getenv("EMAIL_PASSWORD")
+        self.smtp_from = os.getenv("EMAIL_FROM", "noreply@educenter.com")
+        self.timeout = float(os.getenv("EMAIL_TIMEOUT_SECONDS", 30))
+        self.concurrency = int(os.getenv("EMAIL_ASYNC_CONCURRENCY", 10))
+        self.use_tls = use_tls_from_env()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+    
+    async def send_email(
+        self,
+        to_email: str,
+        subject: str,
+        message: str,
+        html_message: Optional[str] = None
+    ) -> bool:
+        """
+        Send an email using SMTP without blocking the event loop
+        
+        Returns:
+            bool: True if email sent successfully, False otherwise
+        
+        Raises CircuitOpenError while the SMTP backend is considered down.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        
+        msg = build_message(self.smtp_from, to_email, subject, message, html_message)
+        admitted = False
+        try:
+            async with self._semaphore:
+                smtp_breaker.before_call()
+                admitted = True
+                # Overall deadline covering connect, STARTTLS, login and DATA
+                await asyncio.wait_for(
+                    aiosmtplib.send(
+                        msg,
+                        hostname=self.smtp_host,
+                        port=self.smtp_port,
+                        username=self.smtp_user or None,
+                        password=self.smtp_password or None,
+                        start_tls=self.use_tls,
+                        timeout=self.timeout
+                    ),
+                    timeout=self.timeout
+                )
+            smtp_breaker.record_success()
+            return True
+        
+        except CircuitOpenError:
+            raise
+        except _REFUSED_ERRORS as e:
+            # The server answered, so the backend is up
+            smtp_breaker.record_success()
+            logger.warning("SMTP server refused email to %s: %s", to_email, e)
+            return False
+        except Exception:
+            smtp_breaker.record_failure()
+            logger.exception("Failed to send email to %s", to_email)
+            return False
+        except BaseException:
+            # Cancelled (client gone, shutdown): no answer to count, but
+            # a half-open probe slot must not stay taken
+            if admitted:
+                smtp_breaker.abandon()
+            raise
+
+# Singleton instance
+async_email_sender = AsyncEmailSender()
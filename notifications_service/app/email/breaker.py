@@ -0,0 +1,146 @@
+"""
+Circuit breaker for the SMTP backend.
+
+While the SMTP host is down every send would wait out a connect timeout.
+The breaker tracks the outcome of SMTP sessions over a sliding window and
+opens when the failure rate reaches `failure_rate` (after at least
+`min_calls` calls). While open, sends fail immediately with
+`CircuitOpenError`; callers leave the notification pending instead of
+using up an attempt. After `open_seconds` it lets `half_open_calls` probe
+sends through: if they succeed it closes again, a failure re-opens it.
+A probe that never reports back (cancelled, or it never reached the
+backend, see `abandon`) stops blocking others after `probe_timeout`.
+"""
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Optional, Tuple
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """The SMTP backend is considered down; retry after `retry_after` seconds"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"SMTP circuit breaker is open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        min_calls: int = 10,
+        window_seconds: float = 60,
+        open_seconds: float = 30,
+        half_open_calls: int = 1,
+        probe_timeout: float = 60,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.probe_timeout = probe_timeout
+        self.clock = clock
+
+        self._state = CLOSED
+        self._calls: Deque[Tuple[float, bool]] = deque()  # (time, succeeded)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._probe_started = 0.0
+        self._times_opened = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go to the backend now"""
+        with self._lock:
+            now = self.clock()
+            if self._state == OPEN:
+                remaining = self._opened_at + self.open_seconds - now
+                if remaining > 0:
+                    self._rejected += 1
+                    raise CircuitOpenError(remaining)
+                self._state, self._probes, self._probe_successes = HALF_OPEN, 0, 0
+            if self._state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    if now - self._probe_started < self.probe_timeout:
+                        # A probe is in flight; its result is known shortly
+                        self._rejected += 1
+                        raise CircuitOpenError(1.0)
+                    # The probes never reported back: let new ones through
+                    self._probes, self._probe_successes = 0, 0
+                self._probes += 1
+                self._probe_started = now
+
+    def abandon(self) -> None:
+        """
+        A call let through by `before_call` ended without an answer from the
+        backend (e.g. cancelled): frees its probe slot, counts nothing
+        """
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > self._probe_successes:
+                self._probes -= 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    self._state = CLOSED
+                    self._calls.clear()
+            elif self._state == CLOSED:
+                self._add(True)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trip()
+            elif self._state == CLOSED:
+                self._add(False)
+                failures = sum(1 for _, ok in self._calls if not ok)
+                if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.failure_rate:
+                    self._trip()
+
+    def _add(self, succeeded: bool) -> None:
+        now = self.clock()
+        self._calls.append((now, succeeded))
+        while self._calls and self._calls[0][0] < now - self.window_seconds:
+            self._calls.popleft()
+
+    def _trip(self) -> None:
+        self._state = OPEN
+        self._opened_at = self.clock()
+        self._times_opened += 1
+        self._calls.clear()
+
+    def is_open(self) -> bool:
+        """True while calls are rejected without a probe"""
+        with self._lock:
+            return self._state == OPEN and self.clock() < self._opened_at + self.open_seconds
+
+    def retry_after(self) -> Optional[float]:
+        with self._lock:
+            if self._state != OPEN:
+                return None
+            return max(0.0, self._opened_at + self.open_seconds - self.clock())
+
+    def stats(self) -> dict:
+        retry_after = self.retry_after()
+        with self._lock:
+            calls = len(self._calls)
+            failures = sum(1 for _, ok in self._calls if not ok)
+            return {
+                "state": HALF_OPEN if self._state == OPEN and not retry_after else self._state,
+                "calls_in_window": calls,
+                "failure_rate": round(failures / calls, 3) if calls else 0.0,
+                "retry_after_seconds": round(retry_after, 1) if retry_after else None,
+                "times_opened": self._times_opened,
+                "rejected_calls": self._rejected,
+            }
@@ -0,0 +1,70 @@
+"""
+Per-recipient rendering for campaigns.
+
+`render_chunk` runs in the campaign process pool: it parses NDJSON lines,
+renders the subject and body templates with each recipient's variables,
+and serializes the complete MIME message, so delivery workers only have to
+hand the bytes to the SMTP server. Campaign templates come from API
+clients, so they run in Jinja's sandbox.
+"""
+import json
+from typing import Dict, List, Tuple
+
+from email_validator import validate_email
+from jinja2 import StrictUndefined, Template
+from jinja2.sandbox import SandboxedEnvironment
+
+from . import templates
+from .sender import build_message
+
+_environment = SandboxedEnvironment(autoescape=False, undefined=StrictUndefined)
+
+# Template source -> compiled template, per render process
+_compiled: Dict[str, Template] = {}
+_MAX_COMPILED = 64
+
+
+def compile_template(source: str) -> Template:
+    """Compile (once per process) a campaign template; raises TemplateSyntaxError"""
+    template = _compiled.get(source)
+    if template is None:
+        if len(_compiled) >= _MAX_COMPILED:
+            _compiled.clear()
+        template = _compiled[source] = _environment.from_string(source)
+    return template
+
+
+def render_chunk(
+    subject_template: str,
+    body_template: str,
+    from_email: str,
+    lines: List[Tuple[int, bytes]]
+) -> Tuple[List[dict], List[str]]:
+    """
+    Render `(line_number, ndjson_line)` pairs. Every line is an object with
+    an "email" key plus template variables.
+
+    Returns notification rows (recipient_email, subject, message,
+    mime_message) and error strings for the lines that failed.
+    """
+    subject_t = compile_template(subject_template)
+    body_t = compile_template(body_template)
+    rows, errors = [], []
+    for line_number, line in lines:
+        try:
+            variables = json.loads(line)
+            if not isinstance(variables, dict):
+                raise ValueError("expected a JSON object")
+            email = validate_email(str(variables.get("email", "")), check_deliverability=False).normalized
+            subject = " ".join(subject_t.render(variables).split())[:255]
+            message = body_t.render(variables)
+            html = templates.render_simple_notification_template(subject, message)
+            rows.append({
+                "recipient_email": email,
+                "subject": subject,
+                "message": message,
+                "mime_message": build_message(from_email, email, subject, message, html).as_string(),
+            })
+        except Exception as e:  # Bad JSON, invalid email, undefined variable, ...
+            errors.append(f"line {line_number}: {e}")
+    return rows, errors
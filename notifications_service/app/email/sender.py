@@ -1,12 +1,293 @@
+import logging
 import smtplib
 import os
+import threading
+import time
+from contextlib import contextmanager
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Dict, List, Optional
+
+from .breaker import CircuitBreaker, CircuitOpenError
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Errors after which the SMTP session is still usable (smtplib already sent RSET)
+_SESSION_OK_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+# The server closed the session; the senders retry once on a fresh connection
+_DISCONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError)
+
+
+class PoolExhaustedError(TimeoutError):
+    """Every pooled session stayed busy for the whole timeout (a local condition, not an SMTP failure)"""
+
+
+class _PooledConnection:
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.messages_sent = 0
+
+
+def build_message(
+    from_email: str,
+    to_email: str,
+    subject: str,
+    message: str,
+    html_message: Optional[str] = None
+) -> MIMEMultipart:
+    """Build the multipart (plain + HTML) email shared by the sync and async senders"""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = from_email
+    msg['To'] = to_email
+    
+    # Add plain text version
+    msg.attach(MIMEText(message, 'plain'))
+    
+    # Add HTML version if provided
+    if html_message:
+        msg.attach(MIMEText(html_message, 'html'))
+    else:
+        # Simple HTML version from plain text
+        html_content = f"<html><body><p>{message.replace(chr(10), '<br>')}</p></body></html>"
+        msg.attach(MIMEText(html_content, 'html'))
+    return msg
+
+
+class SMTPConnectionPool:
+    """
+    Pool of authenticated SMTP sessions shared by all sending threads.
+    
+    Sessions are reused across messages (no TCP/TLS handshake or login per
+    email), checked with NOOP after sitting idle, and closed after
+    `max_messages` messages or `max_idle_seconds` without use.
+    """
+    
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: Optional[str],
+        password: Optional[str],
+        size: int = 4,
+        max_messages: int = 100,
+        max_idle_seconds: float = 60,
+        noop_after_seconds: float = 10,
+        timeout: float = 30,
+        use_tls: bool = True,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = size
+        self.max_messages = max_messages
+        self.max_idle_seconds = max_idle_seconds
+        self.noop_after_seconds = noop_after_seconds
+        self.timeout = timeout
+        self.use_tls = use_tls
+        self.breaker = breaker
+        
+        self._idle: List[_PooledConnection] = []
+        self._open = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "connections_opened": 0,
+            "connections_reused": 0,
+            "connections_closed_max_messages": 0,
+            "connections_closed_idle": 0,
+            "connections_closed_broken": 0,
+            "health_check_failures": 0,
+            "messages_sent": 0,
+        }
+    
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a healthy session; it is returned to the pool afterwards.
+        Raises CircuitOpenError without touching the network while the
+        breaker is open.
+        """
+        if self.breaker:
+            self.breaker.before_call()
+        try:
+            conn = self._acquire()
+        except Exception as e:
+            # A busy pool says nothing about the SMTP backend
+            self._record(None if isinstance(e, PoolExhaustedError) else False)
+            raise
+        except BaseException:
+            self._record(None)
+            raise
+        broken = False
+        answered = True
+        reused = conn.messages_sent > 0
+        try:
+            yield conn.server
+        except _SESSION_OK_ERRORS:
+            raise  # The server answered, so the backend is up
+        except _DISCONNECT_ERRORS:
+            # A reused session dropped by the server (e.g. its idle timeout)
+            # says nothing about the backend; the retry on a fresh one does
+            broken, answered = True, not reused
+            raise
+        except Exception:
+            broken = True
+            raise
+        except BaseException:
+            broken, answered = True, False  # e.g. interrupted mid-exchange
+            raise
+        finally:
+            self._release(conn, broken)
+            self._record(not broken if answered else None)
+    
+    def _record(self, success: Optional[bool]) -> None:
+        """Report a call to the breaker; None: it ended without an answer from the backend"""
+        if self.breaker:
+            if success is None:
+                self.breaker.abandon()
+            elif success:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+    
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                **self._stats,
+                "size": self.size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+            }
+    
+    def close_all(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._quit(conn)
+    
+    def _acquire(self) -> _PooledConnection:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                conn = self._idle.pop() if self._idle else None
+                if conn is None and self._open < self.size:
+                    self._open += 1
+                    create = True
+                else:
+                    create = False
+                if conn is None and not create:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhaustedError("Timed out waiting for a free SMTP connection")
+                    self._cond.wait(remaining)
+                    continue
+            
+            if create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+            
+            if self._usable(conn):
+                self._count("connections_reused")
+                return conn
+            self._discard(conn)
+    
+    def _usable(self, conn: _PooledConnection) -> bool:
+        idle_for = time.monotonic() - conn.last_used
+        if idle_for > self.max_idle_seconds:
+            self._count("connections_closed_idle")
+            self._quit(conn)
+            return False
+        if idle_for > self.noop_after_seconds:
+            try:
+                code, _ = conn.server.noop()
+                if code == 250:
+                    return True
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._count("health_check_failures")
+            self._quit(conn)
+            return False
+        return True
+    
+    def _release(self, conn: _PooledConnection, broken: bool) -> None:
+        conn.last_used = time.monotonic()
+        if not broken:
+            conn.messages_sent += 1
+            self._count("messages_sent")
+        if broken:
+            self._count("connections_closed_broken")
+            self._quit(conn)
+            self._discard(conn)
+        elif conn.messages_sent >= self.max_messages:
+            self._count("connections_closed_max_messages")
+            self._quit(conn)
+            self._discard(conn)
+        else:
+            with self._cond:
+                self._idle.append(conn)
+                self._cond.notify()
+    
+    def _discard(self, conn: _PooledConnection) -> None:
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+    
+    def _connect(self) -> _PooledConnection:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()  # Secure the connection
+            if self.user and self.password:
+                server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._count("connections_opened")
+        return _PooledConnection(server)
+    
+    def _quit(self, conn: _PooledConnection) -> None:
+        try:
+            conn.server.quit()
+        except (smtplib.SMTPException, OSError):
+            conn.server.close()
+    
+    def _count(self, key: str) -> None:
+        with self._cond:
+            self._stats[key] += 1
+
+
+def use_tls_from_env() -> bool:
+    """STARTTLS unless EMAIL_USE_TLS is false (e.g. a local test server)"""
+    return os.getenv("EMAIL_USE_TLS", "true").strip().lower() not in ("0", "false", "no")
+
+
+# Shared by the pooled and the async sender: both talk to the same SMTP host
+smtp_breaker = CircuitBreaker(
+    failure_rate=float(os.getenv("EMAIL_BREAKER_FAILURE_RATE", 0.5)),
+    min_calls=int(os.getenv("EMAIL_BREAKER_MIN_CALLS", 10)),
+    window_seconds=float(os.getenv("EMAIL_BREAKER_WINDOW_SECONDS", 60)),
+    open_seconds=float(os.getenv("EMAIL_BREAKER_OPEN_SECONDS", 30)),
+    half_open_calls=int(os.getenv("EMAIL_BREAKER_HALF_OPEN_CALLS", 1)),
+    probe_timeout=float(os.getenv("EMAIL_BREAKER_PROBE_TIMEOUT_SECONDS", 60))
+)
+
+
 class EmailSender:
     def __init__(self):
         self.smtp_host = os.getenv("EMAIL_HOST", "smtp.gmail.com")
@@ -14,9 +295,22 @@ class EmailSender:
         self.smtp_user = os.getenv("EMAIL_USER")
         self.smtp_password = os.getenv("EMAIL_PASSWORD")
         self.smtp_from = os.getenv("EMAIL_FROM", "noreply@educenter.com")
+        # Without credentials no login is attempted (local relay, benchmarks/fake_smtp.py)
+        self.use_tls = use_tls_from_env()
         
-        if not self.smtp_user or not self.smtp_password:
-            raise ValueError("EMAIL_USER and EMAIL_PASSWORD must be set in environment variables")
+        self.pool = SMTPConnectionPool(
+            self.smtp_host,
+            self.smtp_port,
+            self.smtp_user,
+            self.smtp_password,
+            size=int(os.getenv("EMAIL_POOL_SIZE", 4)),
+            max_messages=int(os.getenv("EMAIL_POOL_MAX_MESSAGES", 100)),
+            max_idle_seconds=float(os.getenv("EMAIL_POOL_MAX_IDLE_SECONDS", 60)),
+            noop_after_seconds=float(os.getenv("EMAIL_POOL_NOOP_AFTER_SECONDS", 10)),
+            timeout=float(os.getenv("EMAIL_TIMEOUT_SECONDS", 30)),
+            use_tls=self.use_tls,
+            breaker=smtp_breaker
+        )
     
     def send_email(
         self,
@@ -30,36 +324,89 @@ class EmailSender:
         
         Returns:
             bool: True if email sent successfully, False otherwise
+        
+        Raises CircuitOpenError while the SMTP backend is considered down.
         """
         try:
-            # Create message
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = self.smtp_from
-            msg['To'] = to_email
+            msg = build_message(self.smtp_from, to_email, subject, message, html_message)
             
-            # Add plain text version
-            msg.attach(MIMEText(message, 'plain'))
+            # Send over a pooled session; if the server dropped it, retry
+            # once on a fresh connection
+            try:
+                with self.pool.connection() as server:
+                    server.send_message(msg)
+            except _DISCONNECT_ERRORS:
+                with self.pool.connection() as server:
+                    server.send_message(msg)
             
-            # Add HTML version if provided
-            if html_message:
-                msg.attach(MIMEText(html_message, 'html'))
-            else:
-                # Simple HTML version from plain text
-                html_content = f"<html><body><p>{message.replace(chr(10), '<br>')}</p></body></html>"
-                msg.attach(MIMEText(html_content, 'html'))
+            return True
             
-            # Connect to SMTP server and send
-            with smtplib.SMTP(self.smtp_host, self.smtp_port) as server:
-                server.starttls()  # Secure the connection
-                server.login(self.smtp_user, self.smtp_password)
-                server.send_message(msg)
+        except CircuitOpenError:
+            raise
+        except _SESSION_OK_ERRORS as e:
+            logger.warning("SMTP server refused email to %s: %s", to_email, e)
+            return False
+        except Exception:
+            logger.exception("Failed to send email to %s", to_email)
+            return False
+    
+    def send_raw(self, to_email: str, raw_message: str) -> bool:
+        """Send an already serialized message (e.g. a rendered campaign email)"""
+        try:
+            try:
+                with self.pool.connection() as server:
+                    server.sendmail(self.smtp_from, [to_email], raw_message.encode("utf-8"))
+            except _DISCONNECT_ERRORS:
+                with self.pool.connection() as server:
+                    server.sendmail(self.smtp_from, [to_email], raw_message.encode("utf-8"))
             
             return True
             
-        except Exception as e:
-            print(f"Failed to send email: {e}")
+        except CircuitOpenError:
+            raise
+        except _SESSION_OK_ERRORS as e:
+            logger.warning("SMTP server refused email to %s: %s", to_email, e)
             return False
+        except Exception:
+            logger.exception("Failed to send email to %s", to_email)
+            return False
+    
+    def send_email_group(
+        self,
+        to_emails: List[str],
+        subject: str,
+        message: str,
+        html_message: Optional[str] = None
+    ) -> Dict[str, str]:
+        """
+        Send one message to several recipients in a single SMTP transaction
+        (one MAIL FROM and DATA, a RCPT TO per recipient). Recipients don't
+        see each other: the To header is "undisclosed-recipients".
+        
+        Returns the recipients that were not accepted, with the reason.
+        """
+        raw = build_message(
+            self.smtp_from, "undisclosed-recipients:;", subject, message, html_message
+        ).as_string().encode("utf-8")
+        try:
+            try:
+                with self.pool.connection() as server:
+                    refused = server.sendmail(self.smtp_from, to_emails, raw)
+            except _DISCONNECT_ERRORS:
+                with self.pool.connection() as server:
+                    refused = server.sendmail(self.smtp_from, to_emails, raw)
+        except smtplib.SMTPRecipientsRefused as e:
+            refused = e.recipients  # Nobody was accepted
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.exception("Failed to send email to %d recipients", len(to_emails))
+            return {to_email: str(e) for to_email in to_emails}
+        
+        return {
+            to_email: f"{code} {reply.decode('utf-8', 'replace') if isinstance(reply, bytes) else reply}"
+            for to_email, (code, reply) in refused.items()
+        }
     
     def send_simple_email(self, to_email: str, subject: str, message: str) -> bool:
         """Simple wrapper for sending plain text emails"""
@@ -1,44 +1,204 @@
-from jinja2 import Template
+"""
+Email templates.
 
-def render_material_created_template(material_title: str, subject: str, created_by: str) -> str:
-    """Render HTML email template for material created event"""
-    html_template = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <style>
-            body { font-family: Arial, sans-serif; line-height: 1.6; }
-            .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-            .header { background-color: #4CAF50; color: white; padding: 10px; text-align: center; }
-            .content { padding: 20px; background-color: #f9f9f9; }
-            .footer { margin-top: 20px; padding: 10px; text-align: center; color: #666; font-size: 12px; }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h2>Educational Center Notification</h2>
-            </div>
-            <div class="content">
-                <h3>{{ subject }}</h3>
-                <p>A new educational material has been added to the system:</p>
-                <div style="background-color: white; padding: 15px; border-left: 4px solid #4CAF50; margin: 15px 0;">
-                    <h4 style="margin-top: 0;">{{ material_title }}</h4>
-                    <p><strong>Created by:</strong> {{ created_by }}</p>
-                </div>
-                <p>You can view this material in the educational portal.</p>
-            </div>
-            <div class="footer">
-                <p>This is an automated notification from Educational Center System.</p>
-                <p>Please do not reply to this email.</p>
+All templates live in one shared Jinja2 environment with autoescaping and
+are compiled once, when this module is imported. Stylesheets are inlined
+into `style` attributes and the markup is minified at the same time, so a
+render is just the compiled template's code.
+
+Templates are looked up by the notification's `event_type`; unknown events
+use the simple notification template:
+
+    html = registry.render("material_created", subject=..., material_title=..., created_by=...)
+"""
+import re
+from typing import Callable, Dict, List, Optional
+
+from jinja2 import DictLoader, Environment, Template, select_autoescape
+from markupsafe import Markup, escape
+
+DEFAULT_TEMPLATE = "simple_notification.html"
+
+# event_type -> template name
+EVENT_TEMPLATES = {
+    "material_created": "material_created.html",
+}
+
+DIGEST_TEMPLATE = "digest.html"
+
+MATERIAL_CREATED_SOURCE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <style>
+        body { font-family: Arial, sans-serif; line-height: 1.6; }
+        .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+        .header { background-color: #4CAF50; color: white; padding: 10px; text-align: center; }
+        .content { padding: 20px; background-color: #f9f9f9; }
+        .footer { margin-top: 20px; padding: 10px; text-align: center; color: #666; font-size: 12px; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h2>Educational Center Notification</h2>
+        </div>
+        <div class="content">
+            <h3>{{ subject }}</h3>
+            <p>A new educational material has been added to the system:</p>
+            <div style="background-color: white; padding: 15px; border-left: 4px solid #4CAF50; margin: 15px 0;">
+                <h4 style="margin-top: 0;">{{ material_title }}</h4>
+                <p><strong>Created by:</strong> {{ created_by }}</p>
             </div>
+            <p>You can view this material in the educational portal.</p>
+        </div>
+        <div class="footer">
+            <p>This is an automated notification from Educational Center System.</p>
+            <p>Please do not reply to this email.</p>
         </div>
-    </body>
-    </html>
+    </div>
+</body>
+</html>
+"""
+
+SIMPLE_NOTIFICATION_SOURCE = """
+<!DOCTYPE html>
+<html>
+<body style="font-family: Arial, sans-serif; line-height: 1.6; padding: 20px;">
+    <div style="max-width: 600px; margin: 0 auto; background-color: #f9f9f9; padding: 20px; border-radius: 5px;">
+        <h2 style="color: #4CAF50; border-bottom: 2px solid #4CAF50; padding-bottom: 10px;">
+            {{ subject }}
+        </h2>
+        <div style="padding: 15px; background-color: white; border-radius: 3px; margin: 15px 0;">
+            {{ message|nl2br }}
+        </div>
+        <div style="margin-top: 20px; padding-top: 10px; border-top: 1px solid #ddd; color: #666; font-size: 12px;">
+            <p>Educational Center System • Automated Notification</p>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+DIGEST_SOURCE = """
+<!DOCTYPE html>
+<html>
+<body style="font-family: Arial, sans-serif; line-height: 1.6; padding: 20px;">
+    <div style="max-width: 600px; margin: 0 auto; background-color: #f9f9f9; padding: 20px; border-radius: 5px;">
+        <h2 style="color: #4CAF50; border-bottom: 2px solid #4CAF50; padding-bottom: 10px;">
+            {{ subject }}
+        </h2>
+        {% for item in items %}
+        <div style="padding: 15px; background-color: white; border-radius: 3px; margin: 15px 0;">
+            <h4 style="margin-top: 0;">{{ item.subject }}</h4>
+            {{ item.message|nl2br }}
+        </div>
+        {% endfor %}
+        <div style="margin-top: 20px; padding-top: 10px; border-top: 1px solid #ddd; color: #666; font-size: 12px;">
+            <p>Educational Center System • Automated Notification</p>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+SOURCES = {
+    "material_created.html": MATERIAL_CREATED_SOURCE,
+    "simple_notification.html": SIMPLE_NOTIFICATION_SOURCE,
+    DIGEST_TEMPLATE: DIGEST_SOURCE,
+}
+
+_STYLE_BLOCK = re.compile(r"<style[^>]*>(.*?)</style>", re.S | re.I)
+_CSS_RULE = re.compile(r"([^{}]+)\{([^}]*)\}")
+_BETWEEN_TAGS = re.compile(r">\s+<")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _minify_declarations(declarations: str) -> str:
+    parts = [d.strip() for d in declarations.split(";") if d.strip()]
+    return "; ".join(re.sub(r"\s*:\s*", ": ", p, count=1) for p in parts) + ";"
+
+
+def inline_css(source: str) -> str:
     """
-    
-    template = Template(html_template)
-    return template.render(
+    Move `<style>` rules for simple selectors (`tag` or `.class`) into
+    `style` attributes; existing inline styles take precedence. Many mail
+    clients ignore `<style>` blocks, so the result renders the same
+    everywhere.
+    """
+    rules: Dict[str, str] = {}
+    for block in _STYLE_BLOCK.findall(source):
+        for selectors, declarations in _CSS_RULE.findall(block):
+            for selector in selectors.split(","):
+                selector = selector.strip()
+                rules[selector] = (rules.get(selector, "") + ";" + declarations).strip(";")
+    source = _STYLE_BLOCK.sub("", source)
+    source = re.sub(r"<head>\s*</head>", "", source, flags=re.I)
+
+    def apply(match: "re.Match") -> str:
+        tag, attrs = match.group(1), match.group(2)
+        declarations = [rules[tag]] if tag in rules else []
+        class_attr = re.search(r'\sclass="([^"]*)"', attrs)
+        if class_attr:
+            declarations += [rules["." + c] for c in class_attr.group(1).split() if "." + c in rules]
+            attrs = attrs.replace(class_attr.group(0), "")
+        if not declarations:
+            return match.group(0)
+        style_attr = re.search(r'\sstyle="([^"]*)"', attrs)
+        if style_attr:
+            declarations.append(style_attr.group(1))
+            attrs = attrs.replace(style_attr.group(0), "")
+        return f'<{tag}{attrs} style="{_minify_declarations(";".join(declarations))}">'
+
+    return re.sub(r"<([a-zA-Z][a-zA-Z0-9]*)((?:\s[^<>]*)?)>", apply, source)
+
+
+def minify_html(source: str) -> str:
+    """Drop whitespace between tags and collapse runs of whitespace"""
+    return _WHITESPACE.sub(" ", _BETWEEN_TAGS.sub("><", source)).strip()
+
+
+def nl2br(value: Optional[str]) -> Markup:
+    """Escape plain text and keep its line breaks"""
+    return Markup("<br>").join(escape(line) for line in str(value or "").split("\n"))
+
+
+class TemplateRegistry:
+    """Shared Jinja2 environment with every template compiled up front"""
+
+    def __init__(self, sources: Dict[str, str], event_templates: Dict[str, str], default: str = DEFAULT_TEMPLATE):
+        self.environment = Environment(
+            loader=DictLoader({name: minify_html(inline_css(src)) for name, src in sources.items()}),
+            autoescape=select_autoescape(default_for_string=True, default=True),
+            auto_reload=False,
+            cache_size=-1
+        )
+        self.environment.filters["nl2br"] = nl2br
+        self.event_templates = dict(event_templates)
+        self.default = default
+        # Compile everything now so no request pays for parsing
+        self.templates: Dict[str, Template] = {
+            name: self.environment.get_template(name) for name in sources
+        }
+
+    def get(self, event_type: Optional[str] = None) -> Template:
+        name = self.event_templates.get(event_type, self.default) if event_type else self.default
+        return self.templates[name]
+
+    def render(self, event_type: Optional[str] = None, **context) -> str:
+        return self.get(event_type).render(**context)
+
+
+registry = TemplateRegistry(SOURCES, EVENT_TEMPLATES)
+
+_render_material_created: Callable[..., str] = registry.templates["material_created.html"].render
+_render_simple_notification: Callable[..., str] = registry.templates[DEFAULT_TEMPLATE].render
+_render_digest: Callable[..., str] = registry.templates[DIGEST_TEMPLATE].render
+
+
+def render_material_created_template(material_title: str, subject: str, created_by: str) -> str:
+    """Render HTML email template for material created event"""
+    return _render_material_created(
         material_title=material_title,
         subject=subject,
         created_by=created_by
@@ -46,24 +206,9 @@ def render_material_created_template(material_title: str, subject: str, created_
 
 def render_simple_notification_template(subject: str, message: str) -> str:
     """Render simple HTML template"""
-    html_template = """
-    <!DOCTYPE html>
-    <html>
-    <body style="font-family: Arial, sans-serif; line-height: 1.6; padding: 20px;">
-        <div style="max-width: 600px; margin: 0 auto; background-color: #f9f9f9; padding: 20px; border-radius: 5px;">
-            <h2 style="color: #4CAF50; border-bottom: 2px solid #4CAF50; padding-bottom: 10px;">
-                {{ subject }}
-            </h2>
-            <div style="padding: 15px; background-color: white; border-radius: 3px; margin: 15px 0;">
-                {{ message|safe }}
-            </div>
-            <div style="margin-top: 20px; padding-top: 10px; border-top: 1px solid #ddd; color: #666; font-size: 12px;">
-                <p>Educational Center System • Automated Notification</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    
-    template = Template(html_template)
-    return template.render(subject=subject, message=message.replace('\n', '<br>'))
\ No newline at end of file
+    return _render_simple_notification(subject=subject, message=message)
+
+def render_digest_template(subject: str, items: List[Dict[str, str]]) -> str:
+    """Render several notifications (dicts with subject and message) as one email"""
+    return _render_digest(subject=subject, items=items)
+
@@ -0,0 +1,57 @@
+"""
+Event fan-out to subscribers.
+
+Services post domain events (POST /notifications/events) instead of one
+notification per recipient. The event is rendered once and queued for
+everyone subscribed to one of its topics (app.crud.iter_subscriber_chunks
+and fan_out_notifications), in chunks, so memory stays bounded for any
+number of subscribers. The copies are byte-identical, so the worker sends
+them in grouped SMTP transactions.
+"""
+from typing import List, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import crud, schemas
+from .config import settings
+from .email import templates
+
+
+def material_created_topics(material: schemas.MaterialCreatedData) -> List[Tuple[str, str]]:
+    """(topic, value) pairs whose subscribers receive the event"""
+    return [
+        (schemas.SubscriptionTopic.SUBJECT.value, material.subject),
+        (schemas.SubscriptionTopic.GRADE_LEVEL.value, material.grade_level),
+        (schemas.SubscriptionTopic.CREATOR.value, material.created_by),
+    ]
+
+
+def material_created_message(material: schemas.MaterialCreatedData) -> str:
+    lines = [f"A new educational material has been added: {material.title}"]
+    if material.subject:
+        lines.append(f"Subject: {material.subject}")
+    if material.grade_level:
+        lines.append(f"Grade level: {material.grade_level}")
+    if material.created_by:
+        lines.append(f"Created by: {material.created_by}")
+    return "\n".join(lines)
+
+
+def fan_out_material_created(db: Session, event: schemas.MaterialCreatedEvent) -> int:
+    """Queue the material_created email for its subscribers; returns how many"""
+    material = event.material
+    subject = f"New material: {material.title}"[:255]
+    return crud.fan_out_notifications(
+        db,
+        material_created_topics(material),
+        subject=subject,
+        message=material_created_message(material),
+        html_message=templates.render_material_created_template(
+            material_title=material.title,
+            subject=subject,
+            created_by=material.created_by or "Unknown"
+        ),
+        service_source=event.service_source,
+        event_type=event.event_type,
+        chunk_size=settings.fanout_chunk_size
+    )
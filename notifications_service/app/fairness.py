@@ -0,0 +1,91 @@
+"""
+Fair sharing of the delivery worker's claims across `service_source`.
+
+Several services queue notifications here; one that queues 100k at once
+must not hold back the others. Within each priority lane (app/lanes.py) the
+worker splits its share of a batch among the sources with queued work, by
+weight (`fair_source_weights`, default 1), and claims each source's part
+with its own range scan of the (status, priority, service_source,
+next_attempt_at) index. When there are more sources than rows to claim,
+the sources take turns (round-robin) from batch to batch.
+
+Queue depths come from the delivery statistics counters (app/stats.py), so
+finding the sources with work never scans pending rows. A source can also
+be capped at `fair_source_max_processing` notifications in flight across
+all workers.
+
+Sources are keyed as in the counters: "" for notifications without one.
+"""
+from typing import Dict, List, Tuple
+
+
+def claimable(
+    depths: Dict[str, Dict[str, int]],
+    max_processing: Dict[str, int]
+) -> Dict[str, int]:
+    """
+    Rows each source may have claimed now: its pending count, limited by
+    the room under its processing cap
+    """
+    result = {}
+    for source, depth in depths.items():
+        count = depth.get("pending", 0)
+        cap = max_processing.get(source)
+        if cap:
+            count = min(count, cap - depth.get("processing", 0))
+        if count > 0:
+            result[source] = count
+    return result
+
+
+def next_turn(offset: int, served: int, sources: int) -> int:
+    """
+    Round-robin position for a lane's next claim: right after the last
+    source served, or one further when every source was served (so the
+    source first in line for unused shares changes too)
+    """
+    return offset + (served if served < sources else 1)
+
+
+def fair_shares(
+    limit: int,
+    available: Dict[str, int],
+    weights: Dict[str, float],
+    default_weight: float = 1.0,
+    offset: int = 0
+) -> List[Tuple[str, int]]:
+    """
+    Split `limit` rows among the sources in `available` (source -> rows it
+    may have claimed) by weight; returns (source, rows) in round-robin order
+    starting at `offset`. Each source taking part gets at least one row and
+    at most what it has; what a source can't use goes to the next ones.
+    """
+    sources = sorted(source for source, count in available.items() if count > 0)
+    if not sources or limit <= 0:
+        return []
+    offset %= len(sources)
+    # More sources than rows: the rest get their turn in the next batches
+    sources = (sources[offset:] + sources[:offset])[:limit]
+
+    weight = {source: max(weights.get(source, default_weight), 0) or default_weight for source in sources}
+    total = sum(weight.values())
+    # One row each first; only what is left is split by weight, so the
+    # floors never push the total past `limit`
+    room = limit - len(sources)
+    ideal = {source: room * weight[source] / total for source in sources}
+    weighted = {source: int(ideal[source]) for source in sources}
+    # Largest remainder: rows lost to rounding go to the largest fractions
+    by_remainder = sorted(sources, key=lambda source: weighted[source] - ideal[source])
+    for source in by_remainder[:room - sum(weighted.values())]:
+        weighted[source] += 1
+    shares = {source: 1 + min(weighted[source], available[source] - 1) for source in sources}
+
+    room = limit - sum(shares.values())
+    for source in sources:
+        if room <= 0:
+            break
+        extra = min(room, available[source] - shares[source])
+        shares[source] += extra
+        room -= extra
+    assert sum(shares.values()) <= limit
+    return [(source, shares[source]) for source in sources]
@@ -0,0 +1,36 @@
+"""
+Priority lanes for the delivery worker.
+
+Every notification has a priority: "high" (e.g. password resets), "normal"
+or "bulk" (campaigns, event fan-out). The worker claims each batch from
+all lanes by weight (`worker_lane_weights`), so a draining campaign can
+take at most its share and high priority rows never queue behind it.
+"""
+from typing import Dict
+
+LANES = ("high", "normal", "bulk")  # Highest priority first
+
+
+def lane_quotas(batch_size: int, weights: Dict[str, int]) -> Dict[str, int]:
+    """
+    Rows to claim from each lane (in LANES order) for one batch, by weight;
+    every lane with a weight gets at least one (the highest priority lanes
+    first when the batch is smaller than that), the rounding remainder goes
+    to the highest priority lane. The quotas never add up to more than
+    `batch_size`.
+    """
+    lanes = [lane for lane in LANES if weights.get(lane, 0) > 0]
+    if not lanes or batch_size <= 0:
+        return {}
+    if batch_size <= len(lanes):
+        return {lane: 1 for lane in lanes[:batch_size]}
+    total = sum(weights[lane] for lane in lanes)
+    quotas = {lane: max(1, batch_size * weights[lane] // total) for lane in lanes}
+    remainder = batch_size - sum(quotas.values())
+    if remainder >= 0:
+        quotas[lanes[0]] += remainder
+    else:
+        # The lanes raised to one took it from the largest share
+        largest = max(quotas, key=quotas.get)
+        quotas[largest] += remainder
+    return quotas
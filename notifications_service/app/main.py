@@ -1,11 +1,18 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import notifications
-from .database import engine
-from . import models
+from .routers import notifications, subscriptions, campaigns as campaigns_router
+from .database import engine, SessionLocal
+from .email.sender import email_sender, smtp_breaker
+from . import crud, campaigns, retention, status_events
+from .config import settings
+from datetime import datetime, timedelta
+import asyncio
+import logging
 
-# Create tables
-models.Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+# The schema is managed by Alembic (migrations/): the image runs
+# `alembic upgrade head` before starting, see docker-entrypoint.sh
 
 app = FastAPI(
     title="Notification Service API",
@@ -26,11 +33,67 @@ app.add_middleware(
 
 # Include routers
 app.include_router(notifications.router)
+app.include_router(campaigns_router.router)
+app.include_router(subscriptions.router)
+
+@app.on_event("shutdown")
+def shutdown_campaign_renderers():
+    campaigns.shutdown_render_pool()
+
+# Background retention purger for old notifications
+@app.on_event("startup")
+async def start_retention_purger():
+    if settings.retention_interval_seconds > 0:
+        app.state.purger_task = asyncio.create_task(retention.run_purger())
+
+@app.on_event("shutdown")
+async def stop_retention_purger():
+    task = getattr(app.state, "purger_task", None)
+    if task is not None:
+        task.cancel()
+
+# Status changes committed by the workers and other API processes (Postgres LISTEN)
+@app.on_event("startup")
+def start_status_listener():
+    if engine.dialect.name == "postgresql":
+        app.state.status_listener = status_events.PostgresListener(engine)
+        app.state.status_listener.start()
+
+@app.on_event("shutdown")
+def stop_status_listener():
+    listener = getattr(app.state, "status_listener", None)
+    if listener is not None:
+        listener.stop()
 
 # Health check
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "service": "notification-service"}
+    breaker = smtp_breaker.stats()
+    # The breakers that guard delivery live in the worker processes
+    workers = None
+    db = SessionLocal()
+    try:
+        since = datetime.utcnow() - timedelta(seconds=3 * settings.worker_heartbeat_seconds)
+        heartbeats = crud.get_worker_heartbeats(db, since)
+        workers = {
+            "live": len(heartbeats),
+            "breaker_open": sum(1 for h in heartbeats if h.breaker_state == "open"),
+        }
+    except Exception:
+        logger.exception("Reading worker heartbeats failed")
+    finally:
+        db.close()
+    # Degraded: the SMTP backend is down, notifications wait in the queue
+    degraded = breaker["state"] == "open" or bool(workers and workers["breaker_open"])
+    return {
+        "status": "degraded" if degraded else "healthy",
+        "service": "notification-service",
+        "smtp_pool": email_sender.pool.stats(),
+        "smtp_breaker": breaker,
+        "workers": workers,
+        "retention": retention.metrics.stats(),
+        "status_stream_subscribers": status_events.broker.subscriber_count()
+    }
 
 @app.get("/")
 def root():
@@ -39,7 +102,12 @@ def root():
         "endpoints": {
             "docs": "/api/docs",
             "send_notification": "/notifications/send",
-            "notifications": "/notifications"
+            "notifications": "/notifications",
+            "campaigns": "/campaigns",
+            "subscriptions": "/subscriptions",
+            "events": "/notifications/events",
+            "status_stream": "/notifications/stream",
+            "queues": "/notifications/queues"
         }
     }
 
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, Index, Enum as SQLEnum
 from sqlalchemy.sql import func
+from datetime import datetime, timezone
 from enum import Enum as PyEnum
 from .database import Base
 
@@ -10,8 +11,41 @@ class NotificationType(str, PyEnum):
 
 class NotificationStatus(str, PyEnum):
     PENDING = "pending"
+    PROCESSING = "processing"  # Claimed by a delivery worker
     SENT = "sent"
     FAILED = "failed"
+    DEAD_LETTER = "dead_letter"  # Every retry failed
+    DIGESTED = "digested"        # Merged into a digest; takes its final status
+
+class NotificationPriority(str, PyEnum):
+    HIGH = "high"      # e.g. password resets; also served by the workers' express lane
+    NORMAL = "normal"
+    BULK = "bulk"      # Campaigns and event fan-out
+
+class CampaignStatus(str, PyEnum):
+    LOADING = "loading"  # Recipients are being rendered and queued
+    QUEUED = "queued"    # Every recipient is rendered; workers are sending
+    FAILED = "failed"
+
+class Campaign(Base):
+    __tablename__ = "campaigns"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(255), nullable=False)
+    subject_template = Column(String(255), nullable=False)
+    body_template = Column(Text, nullable=False)
+    service_source = Column(String(100))
+    event_type = Column(String(100))
+    status = Column(SQLEnum(CampaignStatus), default=CampaignStatus.LOADING)
+    rendered_count = Column(Integer, default=0, nullable=False)  # Queued as notifications
+    failed_count = Column(Integer, default=0, nullable=False)    # Bad lines or render errors
+    error_message = Column(Text)                                 # Last render error
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))  # First recipient upload started
+    loaded_at = Column(DateTime(timezone=True))   # Last recipient upload finished
+    
+    def __repr__(self):
+        return f"<Campaign(id={self.id}, name='{self.name}', status='{self.status}')>"
 
 class Notification(Base):
     __tablename__ = "notify_db"
@@ -22,11 +56,127 @@ class Notification(Base):
     message = Column(Text, nullable=False)
     notification_type = Column(SQLEnum(NotificationType), default=NotificationType.EMAIL)
     status = Column(SQLEnum(NotificationStatus), default=NotificationStatus.PENDING)
+    priority = Column(String(10), nullable=False, default="normal", server_default="normal")  # Delivery lane
     service_source = Column(String(100))  # e.g., "material_service", "user_service"
     event_type = Column(String(100))      # e.g., "material_created", "user_registered"
+    # Set in Python so every row has the format the keyset cursor is bound in
+    # (SQLite keeps server_default values as text without microseconds); aware
+    # UTC, so Postgres doesn't read it in the session's time zone
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True))
+    error_message = Column(Text)
+    claimed_at = Column(DateTime(timezone=True))  # When a worker claimed it for delivery
+    claimed_by = Column(String(100))              # Worker id, e.g. "host:pid"
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), index=True)
+    mime_message = Column(Text)  # Pre-rendered message (campaigns), sent as is
+    html_message = Column(Text)  # Pre-rendered HTML part (event fan-out), sent with `message`
+    attempts = Column(Integer, default=0, nullable=False)  # Delivery attempts so far
+    send_at = Column(DateTime(timezone=True))              # Requested delivery time, if scheduled
+    next_attempt_at = Column(DateTime(timezone=True), default=datetime.utcnow)  # Not claimed before this
+    idempotency_key = Column(String(255), unique=True, index=True)  # Idempotency-Key header
+    idempotency_expires_at = Column(DateTime(timezone=True))         # The key may be reused after this
+    digest_key = Column(String(400), index=True)  # "recipient|event_type" when it may be merged into a digest
+    digest_id = Column(Integer, ForeignKey("notify_db.id", ondelete="SET NULL"), index=True)  # Digest it was merged into
+    
+    # Workers claim pending rows in next_attempt_at order with a range scan,
+    # per priority lane and service_source (or across them for expired claims
+    # and the next due time). Listing pages by (created_at, id) newest first, optionally filtered by
+    # one column; each filter has its own index in that order (see migrations/)
+    __table_args__ = (
+        Index("ix_notify_db_status_next_attempt_at", "status", "next_attempt_at"),
+        Index("ix_notify_db_status_priority_next_attempt_at", "status", "priority", "next_attempt_at"),
+        Index(
+            "ix_notify_db_status_priority_source_next_attempt_at",
+            "status", "priority", "service_source", "next_attempt_at"
+        ),
+        Index("ix_notify_db_created_at", "created_at", "id"),
+        Index("ix_notify_db_recipient_email_created_at", "recipient_email", "created_at", "id"),
+        Index("ix_notify_db_status_created_at", "status", "created_at", "id"),
+        Index("ix_notify_db_service_source_created_at", "service_source", "created_at", "id"),
+    )
+    
+    def __repr__(self):
+        return f"<Notification(id={self.id}, recipient='{self.recipient_email}', status='{self.status}')>"
+
+class SubscriptionTopic(str, PyEnum):
+    SUBJECT = "subject"          # Material subject, e.g. "Mathematics"
+    GRADE_LEVEL = "grade_level"  # e.g. "Grade 10"
+    CREATOR = "creator"          # Material created_by
+
+# Who receives event notifications (POST /notifications/events). `value` is
+# stored normalized (stripped, lowercase) so lookups are exact matches.
+class Subscription(Base):
+    __tablename__ = "subscriptions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    recipient_email = Column(String(255), nullable=False, index=True)
+    topic = Column(String(20), nullable=False)
+    value = Column(String(200), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Fan-out reads subscribers of one (topic, value) in recipient order with
+    # a range scan of this index alone
+    __table_args__ = (
+        Index("uq_subscriptions_topic_value_recipient", "topic", "value", "recipient_email", unique=True),
+    )
+    
+    def __repr__(self):
+        return f"<Subscription(id={self.id}, recipient='{self.recipient_email}', {self.topic}='{self.value}')>"
+
+class ArchivedNotification(Base):
+    __tablename__ = "notify_db_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)  # id from `notify_db`
+    recipient_email = Column(String(255), nullable=False, index=True)
+    subject = Column(String(255), nullable=False)
+    message = Column(Text, nullable=False)
+    notification_type = Column(SQLEnum(NotificationType))
+    status = Column(SQLEnum(NotificationStatus))
+    service_source = Column(String(100))
+    event_type = Column(String(100))
+    created_at = Column(DateTime(timezone=True))
     sent_at = Column(DateTime(timezone=True))
     error_message = Column(Text)
+    attempts = Column(Integer)
+    campaign_id = Column(Integer)
+    digest_id = Column(Integer)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     
     def __repr__(self):
-        return f"<Notification(id={self.id}, recipient='{self.recipient_email}', status='{self.status}')>"
\ No newline at end of file
+        return f"<ArchivedNotification(id={self.id}, recipient='{self.recipient_email}', status='{self.status}')>"
+
+# Delivery statistics (app/stats.py). Keys use "" for a missing
+# service_source/event_type; each key is spread over a few shard rows.
+class NotificationCounter(Base):
+    __tablename__ = "notification_counters"
+    
+    service_source = Column(String(100), primary_key=True)
+    event_type = Column(String(100), primary_key=True)
+    status = Column(String(20), primary_key=True)
+    shard = Column(Integer, primary_key=True, autoincrement=False)
+    count = Column(Integer, nullable=False, default=0)
+
+class NotificationRollup(Base):
+    __tablename__ = "notification_rollups"
+    
+    granularity = Column(String(10), primary_key=True)  # "minute" or "hour"
+    bucket_start = Column(DateTime, primary_key=True)   # UTC
+    service_source = Column(String(100), primary_key=True)
+    event_type = Column(String(100), primary_key=True)
+    shard = Column(Integer, primary_key=True, autoincrement=False)
+    created = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)   # failed or dead_letter
+    retried = Column(Integer, nullable=False, default=0)  # Attempts rescheduled after a failure
+    send_latency_seconds = Column(Float, nullable=False, default=0)  # Sum of created -> sent
+
+
+# Liveness and SMTP circuit breaker state of each delivery worker process,
+# written every `worker_heartbeat_seconds`; /health combines them
+class WorkerHeartbeat(Base):
+    __tablename__ = "worker_heartbeats"
+    
+    worker_id = Column(String(200), primary_key=True)
+    breaker_state = Column(String(20), nullable=False)  # closed, open or half_open
+    failure_rate = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False)        # UTC
@@ -0,0 +1,103 @@
+"""
+Retention for the notification table.
+
+Finished notifications (sent, failed, dead_letter) older than
+`retention_archive_after_days` move to `notify_db_archive`; archived rows
+older than `retention_delete_after_days` are deleted, expired
+idempotency keys are released and old statistics rollups are dropped. Every step works in small batches with
+SELECT ... FOR UPDATE SKIP LOCKED and one commit per batch, so it never
+holds many locks and several processes may run it at once.
+"""
+import asyncio
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from starlette.concurrency import run_in_threadpool
+
+from . import crud
+from .config import settings
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.archived_total = 0
+        self.deleted_total = 0
+        self.keys_released_total = 0
+        self.last_run_seconds = None
+        self.last_run_at = None
+        self.last_error = None
+
+    def record(self, archived: int, deleted: int, released: int, seconds: float) -> None:
+        with self._lock:
+            self.runs += 1
+            self.archived_total += archived
+            self.deleted_total += deleted
+            self.keys_released_total += released
+            self.last_run_seconds = round(seconds, 3)
+            self.last_run_at = time.time()
+            self.last_error = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "archived_total": self.archived_total,
+                "deleted_total": self.deleted_total,
+                "idempotency_keys_released_total": self.keys_released_total,
+                "last_run_seconds": self.last_run_seconds,
+                "last_run_at": self.last_run_at,
+                "last_error": self.last_error,
+            }
+
+
+metrics = RetentionMetrics()
+
+
+def purge_once() -> dict:
+    """Run one retention pass and return what it did"""
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        batch = dict(
+            batch_size=settings.retention_batch_size,
+            max_batches=settings.retention_max_batches,
+        )
+        archived = crud.archive_old_notifications(
+            db, timedelta(days=settings.retention_archive_after_days),
+            pause_seconds=settings.retention_batch_pause_seconds, **batch
+        )
+        deleted = crud.delete_archived_notifications(
+            db, timedelta(days=settings.retention_delete_after_days),
+            pause_seconds=settings.retention_batch_pause_seconds, **batch
+        )
+        released = crud.release_expired_idempotency_keys(db, **batch)
+        crud.delete_old_rollups(db, "minute", timedelta(hours=settings.stats_minute_rollup_retention_hours))
+        crud.delete_old_rollups(db, "hour", timedelta(days=settings.stats_hour_rollup_retention_days))
+    finally:
+        db.close()
+    seconds = time.perf_counter() - started
+    metrics.record(archived, deleted, released, seconds)
+    return {"archived": archived, "deleted": deleted, "idempotency_keys_released": released, "seconds": seconds}
+
+
+async def run_purger() -> None:
+    """Background loop started with the app"""
+    while True:
+        await asyncio.sleep(settings.retention_interval_seconds)
+        try:
+            result = await run_in_threadpool(purge_once)
+            if result["archived"] or result["deleted"] or result["idempotency_keys_released"]:
+                logger.info(
+                    "Retention: archived %(archived)d, deleted %(deleted)d, "
+                    "released %(idempotency_keys_released)d keys in %(seconds).2fs", result
+                )
+        except Exception as e:
+            metrics.last_error = str(e)
+            logger.exception("Notification retention pass failed")
@@ -0,0 +1,30 @@
+"""
+Retry policy for failed deliveries.
+
+A failed attempt is rescheduled `backoff_delay(attempt)` seconds later by
+setting `next_attempt_at`; after `max_retry_attempts` retries the
+notification is moved to `dead_letter`. Delays double with every attempt,
+up to `retry_max_delay_seconds`, with "equal jitter": a random delay between
+half and all of the exponential delay, so notifications that failed
+together (e.g. during an SMTP outage) don't retry together.
+"""
+import random
+from typing import Callable
+
+from .config import settings
+
+
+def backoff_delay(
+    attempt: int,
+    base: float = settings.retry_delay_seconds,
+    cap: float = settings.retry_max_delay_seconds,
+    rand: Callable[[], float] = random.random
+) -> float:
+    """Seconds to wait after failed attempt number `attempt` (1-based)"""
+    delay = min(cap, base * 2 ** max(attempt - 1, 0))
+    return delay / 2 + rand() * delay / 2
+
+
+def retries_exhausted(attempts: int, max_retry_attempts: int = settings.max_retry_attempts) -> bool:
+    """True once the first attempt and every allowed retry have failed"""
+    return attempts > max_retry_attempts
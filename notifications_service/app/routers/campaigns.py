@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from jinja2 import TemplateSyntaxError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .. import campaigns, crud, schemas
+from ..database import get_db
+from ..email.mailmerge import compile_template
+
+router = APIRouter(prefix="/campaigns", tags=["campaigns"])
+
+# Create campaign
+@router.post("/", response_model=schemas.CampaignResponse, status_code=status.HTTP_201_CREATED)
+def create_campaign(
+    campaign: schemas.CampaignCreate,
+    db: Session = Depends(get_db)
+):
+    """
+    Create a mail-merge campaign.
+    
+    `subject_template` and `body_template` use Jinja syntax, e.g.
+    "Hello {{ first_name }}". Upload recipients with
+    POST /campaigns/{id}/recipients.
+    """
+    for field in ("subject_template", "body_template"):
+        try:
+            compile_template(getattr(campaign, field))
+        except TemplateSyntaxError as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Invalid {field}: {e.message} (line {e.lineno})"
+            )
+    return crud.create_campaign(db, campaign)
+
+# Upload recipients
+@router.post("/{campaign_id}/recipients", response_model=schemas.CampaignProgress)
+async def upload_campaign_recipients(campaign_id: int, request: Request):
+    """
+    Stream recipients as NDJSON (`application/x-ndjson`), one object per
+    line with "email" and the template variables:
+    
+        {"email": "student@school.edu", "first_name": "Ann"}
+    
+    Recipients are rendered in a process pool and queued for the delivery
+    workers while the body is still uploading. Lines that fail to parse or
+    render are counted in `failed_count`. Can be called more than once to
+    add recipients.
+    """
+    campaign = await run_in_threadpool(campaigns.with_session, crud.start_campaign_load, campaign_id)
+    if not campaign:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Campaign not found")
+    
+    await campaigns.load_recipients(campaign, request.stream())
+    return await run_in_threadpool(campaigns.with_session, _progress, campaign_id)
+
+# Campaign progress
+@router.get("/{campaign_id}", response_model=schemas.CampaignProgress)
+def get_campaign_progress(campaign_id: int, db: Session = Depends(get_db)):
+    """Rendering and delivery progress and throughput of a campaign"""
+    progress = _progress(db, campaign_id)
+    if progress is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Campaign not found")
+    return progress
+
+def _progress(db: Session, campaign_id: int):
+    campaign = crud.get_campaign(db, campaign_id)
+    if not campaign:
+        return None
+    return campaigns.campaign_progress(db, campaign)
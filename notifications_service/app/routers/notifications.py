@@ -1,98 +1,355 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status, Query
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
+from datetime import datetime, timedelta
 import asyncio
+import json
 
-from .. import crud, schemas
+from .. import crud, events, schemas, status_events
+from ..config import settings
 from ..database import get_db
-from ..email.sender import email_sender
+from ..email.async_sender import async_email_sender
 from ..email import templates as email_templates
+from ..email.breaker import CircuitOpenError
 
 router = APIRouter(prefix="/notifications", tags=["notifications"])
 
+# Claim owner for notifications sent inline by /send-now
+SEND_NOW_CLAIM = "send-now"
+
+# Create a notification, honouring an Idempotency-Key header.
+# Returns (notification, created); a replay sets status 200 and a header.
+def _create_notification(
+    db: Session,
+    notification: schemas.NotificationCreate,
+    idempotency_key: Optional[str],
+    response: Response,
+    claimed_by: Optional[str] = None
+):
+    if not idempotency_key:
+        return crud.create_notification(db, notification, claimed_by=claimed_by), True
+    
+    db_notification, created = crud.create_notification_idempotent(
+        db, notification, idempotency_key, settings.idempotency_key_ttl_seconds, claimed_by=claimed_by
+    )
+    if not created:
+        if (db_notification.recipient_email, db_notification.subject, db_notification.message) != (
+            notification.recipient_email, notification.subject, notification.message
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Idempotency-Key was already used for a different notification"
+            )
+        response.status_code = status.HTTP_200_OK
+        response.headers["Idempotent-Replayed"] = "true"
+    return db_notification, created
+
 # Send notification (main endpoint)
 @router.post("/send", response_model=schemas.NotificationResponse, status_code=status.HTTP_201_CREATED)
-async def send_notification(
+def send_notification(
     notification: schemas.NotificationCreate,
-    background_tasks: BackgroundTasks,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     db: Session = Depends(get_db)
 ):
     """
     Send a notification (email).
     
-    The email will be sent in the background.
+    The notification is stored as `pending` and delivered by the worker
+    processes (`python -m app.worker`).
     Returns immediately with notification record.
-    """
-    # Create notification record
-    db_notification = crud.create_notification(db=db, notification=notification)
-    
-    # Schedule email sending in background
-    background_tasks.add_task(
-        send_email_background,
-        db_notification.id,
-        db_notification.recipient_email,
-        db_notification.subject,
-        db_notification.message,
-        db
-    )
     
+    With an `Idempotency-Key` header, repeating the request (e.g. a client
+    retry after a timeout) returns the original notification with status
+    200 instead of queuing another email.
+    """
+    db_notification, _ = _create_notification(db, notification, idempotency_key, response)
     return db_notification
 
+# Send many notifications at once
+@router.post("/send-batch", response_model=schemas.NotificationBatchResponse, status_code=status.HTTP_201_CREATED)
+def send_notification_batch(
+    batch: schemas.NotificationBatchCreate,
+    db: Session = Depends(get_db)
+):
+    """
+    Queue many notifications in one request.
+    
+    Valid items are inserted with multi-row inserts in a single
+    transaction and picked up by the delivery workers. Invalid items are
+    reported in `errors` by their index (items first, then recipients).
+    """
+    shared = {
+        "subject": batch.subject,
+        "message": batch.message,
+        "notification_type": batch.notification_type,
+        "priority": batch.priority,
+        "service_source": batch.service_source,
+        "event_type": batch.event_type,
+        "send_at": batch.send_at,
+        "digest": batch.digest,
+    }
+    candidates = list(batch.items) + [
+        {**shared, "recipient_email": recipient} for recipient in batch.recipients
+    ]
+    
+    valid, indexes, errors = [], [], []
+    for index, item in enumerate(candidates):
+        try:
+            valid.append(schemas.NotificationCreate(**item))
+            indexes.append(index)
+        except ValidationError as e:
+            errors.append(schemas.NotificationBatchItemError(
+                index=index,
+                errors=[f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()]
+            ))
+    
+    ids = crud.create_notifications_bulk(db, valid)
+    return schemas.NotificationBatchResponse(
+        created=[schemas.NotificationBatchItemResult(index=i, id=id_) for i, id_ in zip(indexes, ids)],
+        errors=errors
+    )
+
+# Fan an event out to its subscribers
+@router.post("/events", response_model=schemas.EventFanOutResponse, status_code=status.HTTP_202_ACCEPTED)
+def publish_event(
+    event: schemas.MaterialCreatedEvent,
+    db: Session = Depends(get_db)
+):
+    """
+    Queue an event's email for every subscriber of its topics (see
+    /subscriptions). A `material_created` event reaches whoever subscribed
+    to the material's subject, grade level or creator, once each.
+    """
+    recipients = events.fan_out_material_created(db, event)
+    return schemas.EventFanOutResponse(event_type=event.event_type, recipients=recipients)
+
 # Send notification immediately (synchronous)
 @router.post("/send-now", response_model=schemas.NotificationResponse)
 async def send_notification_now(
     notification: schemas.NotificationCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     db: Session = Depends(get_db)
 ):
     """
     Send a notification immediately and wait for result.
     
     Use this for testing or when you need to know if email was sent.
+    The SMTP exchange is async and the DB calls run in the threadpool, so
+    a slow mail server never blocks the event loop.
+    A repeated `Idempotency-Key` returns the original record without
+    sending again.
+    
+    While the SMTP backend is down (circuit breaker open) it answers 202
+    at once and the notification stays `pending` for the workers, in the
+    high priority lane unless a `priority` was given.
     """
-    # Create notification record
-    db_notification = crud.create_notification(db=db, notification=notification)
+    if "priority" not in notification.model_fields_set:
+        notification = notification.model_copy(update={"priority": schemas.NotificationPriority.HIGH})
+    # Create notification record, claimed so the workers don't send it too
+    db_notification, created = await run_in_threadpool(
+        _create_notification, db, notification, idempotency_key, response, SEND_NOW_CLAIM
+    )
+    if not created:
+        return db_notification
     
     # Send email immediately
-    success = email_sender.send_email(
-        to_email=db_notification.recipient_email,
-        subject=db_notification.subject,
-        message=db_notification.message,
-        html_message=email_templates.render_simple_notification_template(
-            db_notification.subject,
-            db_notification.message
+    try:
+        success = await async_email_sender.send_email(
+            to_email=db_notification.recipient_email,
+            subject=db_notification.subject,
+            message=db_notification.message,
+            html_message=email_templates.render_simple_notification_template(
+                db_notification.subject,
+                db_notification.message
+            )
         )
-    )
+    except CircuitOpenError as e:
+        # SMTP is down: leave it pending for the workers, attempts untouched
+        await run_in_threadpool(
+            crud.defer_notifications, db, {db_notification.id: e.retry_after}, SEND_NOW_CLAIM
+        )
+        await run_in_threadpool(db.refresh, db_notification)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return db_notification
     
-    # Update status
-    if success:
-        crud.update_notification_status(db, db_notification.id, "sent")
-    else:
-        crud.update_notification_status(db, db_notification.id, "failed", "Failed to send email")
+    # Update status; a failed send is retried by the workers with backoff
+    await run_in_threadpool(
+        crud.record_delivery_result, db, db_notification.id, success,
+        None if success else "Failed to send email", SEND_NOW_CLAIM
+    )
     
     # Refresh and return
-    db.refresh(db_notification)
+    await run_in_threadpool(db.refresh, db_notification)
     return db_notification
 
 # Get all notifications
 @router.get("/", response_model=List[schemas.NotificationResponse])
 def read_notifications(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     recipient_email: Optional[str] = None,
     status: Optional[str] = None,
     service_source: Optional[str] = None,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
+    """
+    List notifications, newest first.
+    
+    For paging, pass the `X-Next-Cursor` response header back as `cursor`;
+    it stays fast at any depth, unlike `skip` (ignored when `cursor` is
+    given). The header is absent on the last page.
+    """
+    try:
+        decoded_cursor = crud.decode_cursor(cursor) if cursor else None
+    except ValueError:
+        # `status` is a query parameter here, shadowing fastapi.status
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
     notifications = crud.get_notifications(
         db=db,
         skip=skip,
         limit=limit,
         recipient_email=recipient_email,
         status=status,
-        service_source=service_source
+        service_source=service_source,
+        cursor=decoded_cursor
     )
+    if len(notifications) == limit:
+        response.headers["X-Next-Cursor"] = crud.encode_cursor(notifications[-1])
     return notifications
 
+# Delivery statistics (declared before /{notification_id})
+@router.get("/stats", response_model=schemas.DeliveryStats)
+def read_delivery_stats(
+    service_source: Optional[str] = None,
+    event_type: Optional[str] = None,
+    granularity: schemas.StatsGranularity = schemas.StatsGranularity.MINUTE,
+    window_minutes: int = Query(60, ge=1, le=60 * 24 * 90),
+    db: Session = Depends(get_db)
+):
+    """
+    Notification counts per status (optionally per `service_source` and
+    `event_type`) and per-minute or per-hour buckets of created, sent,
+    failed and retried notifications with the average time to send, for
+    the last `window_minutes`.
+    
+    Served from counters maintained on every status change; it never scans
+    the notification table.
+    """
+    return crud.get_delivery_stats(
+        db,
+        service_source=service_source,
+        event_type=event_type,
+        granularity=granularity.value,
+        since=datetime.utcnow() - timedelta(minutes=window_minutes)
+    )
+
+# Delivery queue depth per service_source (declared before /{notification_id})
+@router.get("/queues", response_model=List[schemas.QueueDepth])
+def read_queue_depths(db: Session = Depends(get_db)):
+    """
+    Notifications waiting (`pending`, including scheduled sends and
+    retries) and in flight (`processing`) per service_source, with the
+    fair-share weight and cap the workers apply to it. Read from the
+    statistics counters; it never scans the notification table.
+    """
+    return [
+        schemas.QueueDepth(
+            service_source=source or None,
+            pending=depth["pending"],
+            processing=depth["processing"],
+            weight=settings.fair_source_weights.get(source, 1.0),
+            max_processing=settings.fair_source_max_processing.get(source) or None
+        )
+        for source, depth in sorted(crud.get_queue_depths(db).items())
+    ]
+
+def _sse(event: str, data: dict, event_id: Optional[str] = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+# Live status changes, as server-sent events (declared before /{notification_id})
+@router.get("/stream")
+async def stream_status_changes(
+    request: Request,
+    notification_id: Optional[int] = None,
+    recipient_email: Optional[str] = None,
+    service_source: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Stream the status changes of one notification, of a recipient's
+    notifications or of a service's notifications (exactly one filter),
+    as `status` events. A notification stream starts with its current
+    status.
+    
+    Each client has a bounded buffer (`sse_queue_size`); when it falls
+    behind, the oldest events are dropped and an `overflow` event says how
+    many, so the client can re-read what it missed.
+    """
+    filters = [
+        ("id", str(notification_id) if notification_id is not None else None),
+        ("recipient_email", recipient_email.lower() if recipient_email else None),
+        ("service_source", service_source),
+    ]
+    keys = [(name, value) for name, value in filters if value]
+    if len(keys) != 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Pass exactly one of notification_id, recipient_email, service_source"
+        )
+    
+    # Subscribe before reading the current status, so no change falls in between
+    subscription = status_events.broker.subscribe(keys[0], settings.sse_queue_size)
+    initial = None
+    try:
+        if notification_id is not None:
+            db_notification = await run_in_threadpool(crud.get_notification, db, notification_id)
+            if db_notification is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Notification with ID {notification_id} not found"
+                )
+            initial = status_events.status_event(db_notification)
+    except BaseException:
+        status_events.broker.unsubscribe(subscription)
+        raise
+    finally:
+        # Don't hold a connection for the lifetime of the stream
+        db.close()
+    
+    async def events():
+        try:
+            if initial is not None:
+                yield _sse("status", initial, str(initial["id"]))
+            while not await request.is_disconnected():
+                event = await subscription.get(settings.sse_heartbeat_seconds)
+                dropped = subscription.take_dropped()
+                if dropped:
+                    yield _sse("overflow", {"dropped": dropped})
+                if event is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield _sse("status", event, str(event["id"]))
+        finally:
+            status_events.broker.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Get notification by ID
 @router.get("/{notification_id}", response_model=schemas.NotificationResponse)
 def read_notification(notification_id: int, db: Session = Depends(get_db)):
@@ -106,9 +363,8 @@ def read_notification(notification_id: int, db: Session = Depends(get_db)):
 
 # Retry failed notification
 @router.post("/{notification_id}/retry", response_model=schemas.NotificationResponse)
-async def retry_notification(
+def retry_notification(
     notification_id: int,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     db_notification = crud.get_notification(db, notification_id=notification_id)
@@ -118,29 +374,14 @@ async def retry_notification(
             detail=f"Notification with ID {notification_id} not found"
         )
     
-    if db_notification.status != "failed":
+    if db_notification.status not in ("failed", "dead_letter"):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Can only retry failed notifications"
+            detail="Can only retry failed or dead-lettered notifications"
         )
     
-    # Reset to pending
-    db_notification.status = "pending"
-    db_notification.error_message = None
-    db.commit()
-    db.refresh(db_notification)
-    
-    # Retry in background
-    background_tasks.add_task(
-        send_email_background,
-        db_notification.id,
-        db_notification.recipient_email,
-        db_notification.subject,
-        db_notification.message,
-        db
-    )
-    
-    return db_notification
+    # Reset to pending with a fresh set of retries; a worker picks it up again
+    return crud.requeue_notification(db, db_notification)
 
 # Send test email
 @router.post("/test-email", status_code=status.HTTP_200_OK)
@@ -152,12 +393,19 @@ async def send_test_email(
     test_subject = "Test Email from Notification Service"
     test_message = "This is a test email to verify the notification service is working correctly."
     
-    success = email_sender.send_email(
-        to_email=email,
-        subject=test_subject,
-        message=test_message,
-        html_message=email_templates.render_simple_notification_template(test_subject, test_message)
-    )
+    try:
+        success = await async_email_sender.send_email(
+            to_email=email,
+            subject=test_subject,
+            message=test_message,
+            html_message=email_templates.render_simple_notification_template(test_subject, test_message)
+        )
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="SMTP server is unavailable (circuit breaker open)",
+            headers={"Retry-After": str(int(e.retry_after) + 1)}
+        )
     
     if success:
         return {"message": f"Test email sent successfully to {email}"}
@@ -166,25 +414,3 @@ async def send_test_email(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to send test email. Check SMTP configuration."
         )
-
-# Background task function
-async def send_email_background(notification_id: int, recipient_email: str, subject: str, message: str, db: Session):
-    """Background task to send email and update status"""
-    try:
-        # Send email
-        success = email_sender.send_email(
-            to_email=recipient_email,
-            subject=subject,
-            message=message,
-            html_message=email_templates.render_simple_notification_template(subject, message)
-        )
-        
-        # Update status in database
-        if success:
-            crud.update_notification_status(db, notification_id, "sent")
-        else:
-            crud.update_notification_status(db, notification_id, "failed", "Failed to send email")
-            
-    except Exception as e:
-        # Log error and update status
-        crud.update_notification_status(db, notification_id, "failed", str(e))
\ No newline at end of file
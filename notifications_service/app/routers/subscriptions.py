@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from .. import crud, schemas
+from ..database import get_db
+
+router = APIRouter(prefix="/subscriptions", tags=["subscriptions"])
+
+# Subscribe to a topic
+@router.post("/", response_model=schemas.SubscriptionResponse, status_code=status.HTTP_201_CREATED)
+def create_subscription(
+    subscription: schemas.SubscriptionCreate,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """
+    Subscribe a recipient to events for a subject, grade level or creator,
+    e.g. `{"recipient_email": "ann@school.edu", "topic": "subject", "value": "Mathematics"}`.
+    Subscribing again returns the existing subscription with status 200.
+    """
+    db_subscription, created = crud.create_subscription(db, subscription)
+    if not created:
+        response.status_code = status.HTTP_200_OK
+    return db_subscription
+
+# List subscriptions
+@router.get("/", response_model=List[schemas.SubscriptionResponse])
+def read_subscriptions(
+    recipient_email: Optional[str] = None,
+    topic: Optional[schemas.SubscriptionTopic] = None,
+    value: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    return crud.get_subscriptions(
+        db,
+        recipient_email=recipient_email,
+        topic=topic.value if topic else None,
+        value=value,
+        skip=skip,
+        limit=limit
+    )
+
+# Unsubscribe
+@router.delete("/{subscription_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_subscription(subscription_id: int, db: Session = Depends(get_db)):
+    if not crud.delete_subscription(db, subscription_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Subscription with ID {subscription_id} not found"
+        )
@@ -1,8 +1,11 @@
 from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, List, Literal, Optional
 from enum import Enum
 
+# Upper bound on items per /send-batch request
+MAX_BATCH_SIZE = 5000
+
 class NotificationType(str, Enum):
     EMAIL = "email"
     SMS = "sms"
@@ -10,8 +13,16 @@ class NotificationType(str, Enum):
 
 class NotificationStatus(str, Enum):
     PENDING = "pending"
+    PROCESSING = "processing"
     SENT = "sent"
     FAILED = "failed"
+    DEAD_LETTER = "dead_letter"
+    DIGESTED = "digested"
+
+class NotificationPriority(str, Enum):
+    HIGH = "high"
+    NORMAL = "normal"
+    BULK = "bulk"
 
 # Base schema
 class NotificationBase(BaseModel):
@@ -19,12 +30,14 @@ class NotificationBase(BaseModel):
     subject: str = Field(..., min_length=1, max_length=255)
     message: str = Field(..., min_length=1)
     notification_type: NotificationType = NotificationType.EMAIL
+    priority: NotificationPriority = NotificationPriority.NORMAL  # Delivery lane
     service_source: Optional[str] = None
     event_type: Optional[str] = None
 
 # Schema for sending notification
 class NotificationCreate(NotificationBase):
-    pass
+    send_at: Optional[datetime] = None  # Deliver no earlier than this (UTC if naive)
+    digest: Optional[bool] = None       # Merge into a digest; default from DIGEST_EVENT_TYPES
 
 # Schema for response
 class NotificationResponse(NotificationBase):
@@ -33,6 +46,10 @@ class NotificationResponse(NotificationBase):
     created_at: datetime
     sent_at: Optional[datetime] = None
     error_message: Optional[str] = None
+    attempts: int = 0
+    send_at: Optional[datetime] = None
+    next_attempt_at: Optional[datetime] = None
+    digest_id: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -44,4 +61,131 @@ class NotificationUpdate(BaseModel):
 
 # Schema for retry
 class NotificationRetry(BaseModel):
-    pass
\ No newline at end of file
+    pass
+
+# Schema for batch sending: either `items` (each a NotificationCreate) or
+# one message for a list of `recipients`, or both. Items are validated one
+# by one so a bad item doesn't reject the whole batch.
+class NotificationBatchCreate(BaseModel):
+    items: List[Dict[str, Any]] = Field(default_factory=list, max_length=MAX_BATCH_SIZE)
+    recipients: List[str] = Field(default_factory=list, max_length=MAX_BATCH_SIZE)
+    subject: Optional[str] = None
+    message: Optional[str] = None
+    notification_type: NotificationType = NotificationType.EMAIL
+    priority: NotificationPriority = NotificationPriority.NORMAL
+    service_source: Optional[str] = None
+    event_type: Optional[str] = None
+    send_at: Optional[datetime] = None
+    digest: Optional[bool] = None
+
+class NotificationBatchItemResult(BaseModel):
+    index: int  # Position in items + recipients
+    id: int
+
+class NotificationBatchItemError(BaseModel):
+    index: int
+    errors: List[str]
+
+class NotificationBatchResponse(BaseModel):
+    created: List[NotificationBatchItemResult]
+    errors: List[NotificationBatchItemError]
+
+class CampaignStatus(str, Enum):
+    LOADING = "loading"
+    QUEUED = "queued"
+    FAILED = "failed"
+
+# Schema for creating a campaign; templates use Jinja syntax and get the
+# recipient's variables, e.g. "Hello {{ first_name }}"
+class CampaignCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=255)
+    subject_template: str = Field(..., min_length=1, max_length=255)
+    body_template: str = Field(..., min_length=1)
+    service_source: Optional[str] = None
+    event_type: Optional[str] = None
+
+class CampaignResponse(CampaignCreate):
+    id: int
+    status: CampaignStatus
+    rendered_count: int
+    failed_count: int
+    error_message: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    loaded_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+class CampaignProgress(BaseModel):
+    campaign: CampaignResponse
+    delivery: Dict[str, int]                 # Notification count per status
+    rendered_per_second: Optional[float] = None
+    sent_per_second: Optional[float] = None
+    done: bool                               # Loaded and nothing left to send
+
+class StatsGranularity(str, Enum):
+    MINUTE = "minute"
+    HOUR = "hour"
+
+class QueueDepth(BaseModel):
+    service_source: Optional[str] = None
+    pending: int
+    processing: int
+    weight: float                          # Share of each claimed batch (FAIR_SOURCE_WEIGHTS)
+    max_processing: Optional[int] = None   # Cap on notifications in flight (FAIR_SOURCE_MAX_PROCESSING)
+
+class DeliveryStatsCounter(BaseModel):
+    service_source: Optional[str] = None
+    event_type: Optional[str] = None
+    status: str
+    count: int
+
+class DeliveryStatsBucket(BaseModel):
+    bucket_start: datetime  # UTC
+    created: int
+    sent: int
+    failed: int
+    retried: int
+    avg_send_latency_seconds: Optional[float] = None  # created -> sent
+
+class DeliveryStats(BaseModel):
+    totals: Dict[str, int]                # Notifications per status
+    counters: List[DeliveryStatsCounter]  # Per service_source, event_type and status
+    granularity: StatsGranularity
+    rollups: List[DeliveryStatsBucket]
+
+class SubscriptionTopic(str, Enum):
+    SUBJECT = "subject"
+    GRADE_LEVEL = "grade_level"
+    CREATOR = "creator"
+
+class SubscriptionCreate(BaseModel):
+    recipient_email: EmailStr
+    topic: SubscriptionTopic
+    value: str = Field(..., min_length=1, max_length=200)  # Matched case-insensitively
+
+class SubscriptionResponse(SubscriptionCreate):
+    id: int
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class MaterialCreatedData(BaseModel):
+    material_id: Optional[int] = None
+    title: str = Field(..., min_length=1, max_length=200)
+    subject: Optional[str] = None
+    grade_level: Optional[str] = None
+    created_by: Optional[str] = None
+
+# Event for POST /notifications/events, fanned out to subscribers
+class MaterialCreatedEvent(BaseModel):
+    event_type: Literal["material_created"] = "material_created"
+    service_source: Optional[str] = "material_service"
+    material: MaterialCreatedData
+
+class EventFanOutResponse(BaseModel):
+    event_type: str
+    recipients: int  # Notifications queued
+
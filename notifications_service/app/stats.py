@@ -0,0 +1,159 @@
+"""
+Incremental delivery statistics.
+
+`notification_counters` holds how many notifications currently exist per
+(service_source, event_type, status). Every status change in crud.py moves
+counts from the old status to the new one in the same transaction, so the
+counters never drift from the table and reading them never scans it.
+
+`notification_rollups` holds per-minute and per-hour buckets of created,
+sent, failed and retried notifications plus the summed time from creation
+to send, for throughput and latency graphs.
+
+Each key is spread over `stats_counter_shards` rows picked at random, so
+concurrent workers rarely wait on the same row lock; readers sum the shards.
+Postgres and SQLite add to the rows with one upsert; other databases update
+each row and insert it when it doesn't exist yet.
+"""
+import random
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+
+GRANULARITIES = ("minute", "hour")
+
+FINAL_FAILED = ("failed", "dead_letter")
+
+
+def _key(value) -> str:
+    value = getattr(value, "value", value)
+    return value or ""
+
+
+def _utc_naive(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def bucket_start(at: datetime, granularity: str) -> datetime:
+    at = _utc_naive(at)
+    if granularity == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(second=0, microsecond=0)
+
+
+def _insert(db: Session, table):
+    """INSERT with ON CONFLICT support, or None when the dialect has none"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    return None
+
+
+def _add_to_rows(db: Session, model, keys: Tuple[str, ...], fields: Tuple[str, ...], rows) -> None:
+    """Add each row's `fields` to the stored row with the same `keys`, creating it if needed"""
+    stmt = _insert(db, model)
+    if stmt is not None:
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={field: getattr(model, field) + stmt.excluded[field] for field in fields}
+        ), rows)
+        return
+    for row in rows:
+        while True:
+            updated = db.execute(
+                update(model)
+                .where(*(getattr(model, key) == row[key] for key in keys))
+                .values({field: getattr(model, field) + row[field] for field in fields})
+            ).rowcount
+            if updated:
+                break
+            try:
+                with db.begin_nested():
+                    db.execute(insert(model), [row])
+                break
+            except IntegrityError:
+                pass  # Another transaction created the row first: add to it
+
+
+class StatsBatch:
+    """Collects the statistics changes of one transaction; `flush` before commit"""
+
+    def __init__(self):
+        self.counters: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self.rollups: Dict[Tuple[str, datetime, str, str], Dict[str, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+
+    def transition(self, service_source, event_type, old_status, new_status, count: int = 1) -> None:
+        """Move `count` rows from old_status to new_status (None = row created/removed)"""
+        old_status, new_status = _key(old_status) or None, _key(new_status) or None
+        if old_status == new_status or not count:
+            return
+        if old_status:
+            self.counters[(_key(service_source), _key(event_type), old_status)] -= count
+        if new_status:
+            self.counters[(_key(service_source), _key(event_type), new_status)] += count
+
+    def _bump(self, service_source, event_type, at: datetime, field: str, amount: float) -> None:
+        for granularity in GRANULARITIES:
+            key = (granularity, bucket_start(at, granularity), _key(service_source), _key(event_type))
+            self.rollups[key][field] += amount
+
+    def created(self, service_source, event_type, count: int = 1, at: Optional[datetime] = None) -> None:
+        self.transition(service_source, event_type, None, "pending", count)
+        self._bump(service_source, event_type, at or datetime.utcnow(), "created", count)
+
+    def attempt_finished(self, service_source, event_type, status, created_at: Optional[datetime], at: datetime) -> None:
+        """Record the outcome of a delivery attempt in the rollups"""
+        status = _key(status)
+        if status == "sent":
+            self._bump(service_source, event_type, at, "sent", 1)
+            if created_at is not None:
+                latency = max(0.0, (_utc_naive(at) - _utc_naive(created_at)).total_seconds())
+                self._bump(service_source, event_type, at, "send_latency_seconds", latency)
+        elif status in FINAL_FAILED:
+            self._bump(service_source, event_type, at, "failed", 1)
+        elif status == "pending":
+            self._bump(service_source, event_type, at, "retried", 1)
+
+    def flush(self, db: Session) -> None:
+        shards = max(1, settings.stats_counter_shards)
+        # Rows in key order so concurrent transactions lock them in the same order
+        counter_rows = [
+            {"service_source": source, "event_type": event, "status": status,
+             "shard": random.randrange(shards), "count": delta}
+            for (source, event, status), delta in sorted(self.counters.items()) if delta
+        ]
+        if counter_rows:
+            _add_to_rows(
+                db, models.NotificationCounter,
+                ("service_source", "event_type", "status", "shard"), ("count",), counter_rows
+            )
+
+        fields = ("created", "sent", "failed", "retried", "send_latency_seconds")
+        rollup_rows = [
+            {"granularity": granularity, "bucket_start": start, "service_source": source,
+             "event_type": event, "shard": random.randrange(shards),
+             **{field: values.get(field, 0) for field in fields}}
+            for (granularity, start, source, event), values in sorted(self.rollups.items())
+        ]
+        if rollup_rows:
+            _add_to_rows(
+                db, models.NotificationRollup,
+                ("granularity", "bucket_start", "service_source", "event_type", "shard"), fields, rollup_rows
+            )
+
+        self.counters.clear()
+        self.rollups.clear()
@@ -0,0 +1,254 @@
+"""
+Notification status changes, pushed to clients (GET /notifications/stream).
+
+crud.py calls `publish(db, notifications)` when it changes statuses; the
+events are delivered after the transaction commits:
+
+- to this process's `broker` right away;
+- on Postgres, through `pg_notify` sent inside the write transaction (so
+  only committed changes are heard), to every API process, whose
+  `PostgresListener` feeds its own broker. That is how transitions made by
+  the delivery workers reach the API.
+
+NOTIFY takes a database-wide lock at commit, which would serialize the
+workers' commits, so it is only sent while some API process has stream
+subscribers: their listeners hold a shared advisory lock (`PRESENCE_LOCK`)
+and writers look for it in pg_locks, at most every
+`sse_presence_check_seconds`. A client may miss the first changes made in
+that interval; a notification stream starts with the current status.
+
+Rows queued in bulk by campaigns and event fan-out (unbounded) publish no
+creation event; their changes are published from the first claim on.
+
+The broker keeps a bounded queue per subscriber. A client that doesn't keep
+up loses the oldest events and is told how many were dropped, so it can
+re-read the notifications it cares about.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event, func, select as sql_select, text
+from sqlalchemy.orm import Session
+
+from common import pg_listen
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "notification_status"
+
+# pg_notify payloads are limited to 8000 bytes
+MAX_EVENTS_PER_MESSAGE = 30
+
+# Advisory lock key held (shared) by API processes with stream subscribers
+PRESENCE_LOCK = 48_048
+
+# Process id in messages, so a process skips its own (already delivered) events.
+# Per pid: gunicorn's preload_app imports this module before forking the workers
+_origin: Tuple[int, str] = (0, "")
+
+
+def origin() -> str:
+    global _origin
+    if _origin[0] != os.getpid():
+        _origin = (os.getpid(), uuid.uuid4().hex)
+    return _origin[1]
+
+# Subscription filters: ("id", "42"), ("recipient_email", "ann@school.edu"), ("service_source", "...")
+FilterKey = Tuple[str, str]
+
+
+def _value(value):
+    return getattr(value, "value", value)
+
+
+def status_event(notification, status: Optional[str] = None) -> dict:
+    return {
+        "id": notification.id,
+        "recipient_email": notification.recipient_email,
+        "service_source": notification.service_source,
+        "event_type": notification.event_type,
+        "status": status or _value(notification.status),
+        "attempts": notification.attempts,
+        "error_message": notification.error_message,
+        "at": datetime.utcnow().isoformat(),
+    }
+
+
+def filter_keys(event: dict) -> List[FilterKey]:
+    keys = [("id", str(event["id"]))]
+    if event.get("recipient_email"):
+        keys.append(("recipient_email", event["recipient_email"].lower()))
+    if event.get("service_source"):
+        keys.append(("service_source", event["service_source"]))
+    return keys
+
+
+class Subscription:
+    """One client's bounded event queue, filled from any thread"""
+
+    def __init__(self, key: FilterKey, maxsize: int):
+        self.key = key
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(max(1, maxsize))
+        self.dropped = 0
+
+    def _offer(self, event: dict) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()  # Drop the oldest
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def take_dropped(self) -> int:
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+class StatusBroker:
+    """In-process pub/sub of status events, indexed by filter key"""
+
+    def __init__(self):
+        self._subscribers: Dict[FilterKey, Set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, key: FilterKey, maxsize: int) -> Subscription:
+        subscription = Subscription(key, maxsize)
+        with self._lock:
+            self._subscribers[key].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.key)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.key]
+
+    def mark_lost(self) -> None:
+        """Events may have been missed (e.g. the listener reconnected); tell every subscriber"""
+        with self._lock:
+            subscriptions = [s for subscribers in self._subscribers.values() for s in subscribers]
+        for subscription in subscriptions:
+            subscription.dropped += 1
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    def publish(self, events: Iterable[dict]) -> None:
+        """Deliver to matching subscribers; safe to call from any thread"""
+        with self._lock:
+            if not self._subscribers:
+                return
+            targets = [
+                (subscription, event)
+                for event in events
+                for key in filter_keys(event)
+                for subscription in self._subscribers.get(key, ())
+            ]
+        for subscription, event in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._offer, event)
+            except RuntimeError:  # Its event loop is closed
+                self.unsubscribe(subscription)
+
+
+broker = StatusBroker()
+
+# Last answer of _listeners_present: (monotonic time, present)
+_presence = (float("-inf"), False)
+
+
+def _listeners_present(db: Session) -> bool:
+    """Whether any API process has stream subscribers (Postgres), cached briefly"""
+    global _presence
+    checked_at, present = _presence
+    now = time.monotonic()
+    if now - checked_at >= settings.sse_presence_check_seconds:
+        present = bool(db.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory'"
+            " AND classid = 0 AND objid = :key AND objsubid = 1 AND granted)"
+        ), {"key": PRESENCE_LOCK}).scalar())
+        _presence = (now, present)
+    return present
+
+
+def publish(db: Session, notifications: Iterable, status: Optional[str] = None) -> None:
+    """
+    Stage status events for `notifications` (their current status, or
+    `status`); they are delivered when `db` commits
+    """
+    events = [status_event(n, status) for n in notifications]
+    if not events:
+        return
+    if db.get_bind().dialect.name == "postgresql" and _listeners_present(db):
+        for i in range(0, len(events), MAX_EVENTS_PER_MESSAGE):
+            payload = json.dumps({"o": origin(), "events": events[i:i + MAX_EVENTS_PER_MESSAGE]})
+            # Queued by Postgres and sent only if and when this transaction commits
+            db.execute(sql_select(func.pg_notify(CHANNEL, payload)))
+    db.info.setdefault("pending_status_events", []).extend(events)
+
+
+@event.listens_for(Session, "after_commit")
+def _deliver_committed(session: Session) -> None:
+    events = session.info.pop("pending_status_events", None)
+    if events:
+        broker.publish(events)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back(session: Session, previous_transaction) -> None:
+    if not session.in_transaction():
+        session.info.pop("pending_status_events", None)
+
+
+class PostgresListener(pg_listen.PostgresListener):
+    """Feeds `broker` with events committed by other processes (LISTEN)"""
+
+    def __init__(self, engine, channel: str = CHANNEL, reconnect_delay: float = 1.0):
+        super().__init__(
+            engine, channel,
+            on_notify=self._received,
+            on_connect=self._connected,
+            before_wait=self._sync_presence,
+            name="status-listener",
+            reconnect_delay=reconnect_delay
+        )
+        self._present = False  # Holding PRESENCE_LOCK on the current connection
+
+    def _connected(self, conn, reconnected: bool) -> None:
+        self._present = False
+        if reconnected:
+            broker.mark_lost()
+
+    def _received(self, payload: str) -> None:
+        message = json.loads(payload)
+        if message["o"] != origin():
+            broker.publish(message["events"])
+
+    def _sync_presence(self, conn) -> None:
+        """Hold PRESENCE_LOCK while this process has subscribers, so writers send NOTIFY"""
+        wanted = broker.subscriber_count() > 0
+        if wanted != self._present:
+            with conn.cursor() as cursor:
+                if wanted:
+                    cursor.execute("SELECT pg_advisory_lock_shared(%s)", (PRESENCE_LOCK,))
+                else:
+                    cursor.execute("SELECT pg_advisory_unlock_shared(%s)", (PRESENCE_LOCK,))
+            self._present = wanted
@@ -0,0 +1,136 @@
+"""
+Per-recipient-domain rate limits for the delivery worker.
+
+Mailbox providers throttle senders that burst. Each recipient domain gets a
+token bucket (`rate` sends per second, up to `burst` at once) and a cap on
+concurrent sends, configured per domain in `domain_limits`, e.g.
+
+    DOMAIN_LIMITS='{"gmail.com": {"rate": 5, "burst": 10, "concurrency": 2}}'
+
+A limit for "example.com" also covers its subdomains; domains without one
+use the `domain_default_*` settings (0 = unlimited). Limits apply per worker
+process.
+
+The worker only asks `acquire`: a send to a throttled domain waits (or goes
+back to the queue) while sends to every other domain carry on.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from .config import settings
+
+
+@dataclass
+class DomainLimit:
+    rate: float = 0         # Sends per second, 0 = unlimited
+    burst: float = 0        # Bucket size, defaults to max(1, rate)
+    concurrency: int = 0    # Sends in flight, 0 = unlimited
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float = 0, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = max(1.0, burst or rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def take(self) -> float:
+        """Take a token; returns 0 on success, otherwise the seconds until one is available"""
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+def recipient_domain(email: str) -> str:
+    return email.rpartition("@")[2].strip().lower()
+
+
+class DomainLimiter:
+    """Token buckets and concurrency caps per recipient domain (thread-safe)"""
+
+    def __init__(
+        self,
+        limits: Dict[str, DomainLimit],
+        default: DomainLimit = DomainLimit(),
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.limits = {domain.lower(): limit for domain, limit in limits.items()}
+        self.default = default
+        self.clock = clock
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._releases = 0  # Sends released so far, see wait_for_release
+
+    def _limit(self, domain: str):
+        """(bucket key, limit) for a domain: its own, a parent domain's, or the default"""
+        parts = domain.split(".")
+        for i in range(len(parts) - 1):
+            parent = ".".join(parts[i:])
+            if parent in self.limits:
+                return parent, self.limits[parent]
+        return domain, self.default
+
+    def acquire(self, domain: str) -> Optional[float]:
+        """
+        None if a send to `domain` may start now (call `release` when it is
+        done); otherwise the seconds to wait for a token, or 0 when the
+        domain is at its concurrency cap until a running send finishes.
+        """
+        key, limit = self._limit(domain)
+        with self._lock:
+            if limit.concurrency and self._in_flight.get(key, 0) >= limit.concurrency:
+                return 0.0
+            if limit.rate:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = TokenBucket(limit.rate, limit.burst, self.clock)
+                wait = bucket.take()
+                if wait:
+                    return wait
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+            return None
+
+    def interval(self, domain: str) -> float:
+        """Seconds between sends to `domain` at its steady rate (0 = unlimited)"""
+        _, limit = self._limit(domain)
+        return 1 / limit.rate if limit.rate else 0.0
+
+    def release(self, domain: str) -> None:
+        key, _ = self._limit(domain)
+        with self._lock:
+            self._in_flight[key] = max(0, self._in_flight.get(key, 0) - 1)
+            self._releases += 1
+            self._released.notify_all()
+
+    def releases(self) -> int:
+        with self._lock:
+            return self._releases
+
+    def wait_for_release(self, seen: int, timeout: Optional[float]) -> bool:
+        """
+        Block until a send is released after `releases()` returned `seen`
+        (e.g. by another thread sharing this limiter), or the timeout;
+        returns whether one was
+        """
+        with self._released:
+            return self._released.wait_for(lambda: self._releases != seen, timeout)
+
+
+def limiter_from_settings() -> DomainLimiter:
+    return DomainLimiter(
+        {domain: DomainLimit(**limit) for domain, limit in settings.domain_limits.items()},
+        DomainLimit(
+            rate=settings.domain_default_rate,
+            burst=settings.domain_default_burst,
+            concurrency=settings.domain_default_concurrency
+        )
+    )
@@ -0,0 +1,510 @@
+"""
+Delivery worker for queued notifications.
+
+The web service only inserts `pending` rows; this process claims them in
+batches with SELECT ... FOR UPDATE SKIP LOCKED and sends them. Run as many
+processes (and pods) as needed:
+
+    python -m app.worker                # one process
+    python -m app.worker --processes 4  # four processes on this host
+
+While the queue is busy the next batch is claimed as soon as fewer sends
+are outstanding than there are delivery threads, so one slow send never
+leaves the other threads idle until its batch is done.
+
+Rows whose claim is older than the visibility timeout (e.g. the worker
+crashed mid-batch) are claimed again by the next worker that polls. Each
+takeover counts as an attempt, so a notification that keeps a worker from
+finishing is dead-lettered once the retries are used up.
+Only rows whose `next_attempt_at` has passed are claimed, which covers both
+scheduled sends (`send_at`) and retries after a failure (app/retry.py).
+
+Notifications with identical content (subject, message and HTML part) and
+the same recipient domain are sent as one SMTP transaction with a RCPT TO per recipient (up to
+`worker_group_max_recipients`); each recipient's acceptance is recorded on
+its own row.
+
+Sends are rate limited per recipient domain (app/throttle.py); a grouped
+transaction counts as one send. A claimed notification whose domain is
+throttled waits up to `throttle_max_hold_seconds` while the rest of the
+batch is sent; if it would have to wait longer it goes back to the queue
+without using up an attempt.
+
+While the SMTP circuit breaker (app/email/breaker.py) is open the worker
+claims nothing, and sends rejected by it return to the queue, again without
+using up an attempt. Each process reports its breaker state to the
+worker_heartbeats table every `worker_heartbeat_seconds`, for /health.
+
+Notifications are claimed per priority lane (high, normal, bulk): each
+batch is shared among the lanes by `worker_lane_weights`, so a draining
+campaign never takes a whole batch, and a lane with fewer due rows leaves
+its share to the others. An express lane with its own
+`worker_express_concurrency` threads polls the high priority lane every
+`worker_express_poll_interval_seconds`, so high priority notifications go
+out within seconds even while the main loop is busy with a bulk batch.
+
+Within a lane, rows are shared fairly among the service_sources with queued
+work (app/fairness.py), each claimed with its own indexed scan.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import crud, digests, fairness, throttle
+from .lanes import LANES, lane_quotas
+from .config import settings
+from .database import SessionLocal
+from .email.breaker import CircuitOpenError
+from .email.sender import email_sender, smtp_breaker
+from .email import templates as email_templates
+
+logger = logging.getLogger(__name__)
+
+MIN_HOLD_WAIT = 0.05  # Seconds; held sends never poll the limiter faster
+
+
+def deliver_notification(
+    notification_id: int,
+    recipient_email: str,
+    subject: str,
+    message: str,
+    mime_message: Optional[str],
+    html_message: Optional[str],
+    worker_id: str
+) -> bool:
+    """Send one claimed notification and record the result"""
+    db = SessionLocal()
+    try:
+        try:
+            if mime_message:
+                # Rendered ahead of time by a campaign
+                success = email_sender.send_raw(recipient_email, mime_message)
+            else:
+                success = email_sender.send_email(
+                    to_email=recipient_email,
+                    subject=subject,
+                    message=message,
+                    html_message=html_message or email_templates.render_simple_notification_template(subject, message)
+                )
+            error = None if success else "Failed to send email"
+        except CircuitOpenError as e:
+            # SMTP is down: back to the queue without using up an attempt
+            crud.defer_notifications(db, {notification_id: e.retry_after}, claimed_by=worker_id)
+            return False
+        except Exception as e:
+            success, error = False, str(e)
+
+        # Failures are rescheduled with backoff or dead-lettered
+        crud.record_delivery_result(db, notification_id, success, error, claimed_by=worker_id)
+        return success
+    finally:
+        db.close()
+
+
+def deliver_group(items: List[tuple], worker_id: str) -> int:
+    """
+    Send claimed notifications with identical content in one SMTP
+    transaction and record each recipient's result; returns how many were
+    accepted.
+    """
+    _, _, subject, message, _, html_message = items[0]
+    try:
+        refused = email_sender.send_email_group(
+            [item[1] for item in items],
+            subject,
+            message,
+            html_message=html_message or email_templates.render_simple_notification_template(subject, message)
+        )
+    except CircuitOpenError as e:
+        db = SessionLocal()
+        try:
+            crud.defer_notifications(db, {item[0]: e.retry_after for item in items}, claimed_by=worker_id)
+        finally:
+            db.close()
+        return 0
+    except Exception as e:
+        refused = {item[1]: str(e) for item in items}
+
+    db = SessionLocal()
+    try:
+        for notification_id, recipient_email, *_ in items:
+            error = refused.get(recipient_email)
+            crud.record_delivery_result(db, notification_id, error is None, error, claimed_by=worker_id)
+    finally:
+        db.close()
+    return sum(1 for item in items if item[1] not in refused)
+
+
+def group_identical(items: List[tuple], max_recipients: int) -> List[List[tuple]]:
+    """
+    Split claimed (id, recipient, subject, message, mime_message,
+    html_message) items into jobs: items with the same recipient domain and
+    content share a job of up to `max_recipients`; everything else is sent
+    on its own.
+    Pre-rendered MIME messages (campaigns, digests) are addressed to one
+    recipient and never grouped.
+    """
+    jobs: List[List[tuple]] = []
+    open_groups: Dict[tuple, List[tuple]] = {}
+    for item in items:
+        if max_recipients <= 1 or item[4]:
+            jobs.append([item])
+            continue
+        key = (throttle.recipient_domain(item[1]), item[2], item[3], item[5])
+        group = open_groups.get(key)
+        if group is None or len(group) >= max_recipients:
+            group = open_groups[key] = []
+            jobs.append(group)
+        group.append(item)
+    return jobs
+
+
+class NotificationWorker:
+    def __init__(
+        self,
+        worker_id: Optional[str] = None,
+        concurrency: int = settings.worker_concurrency,
+        batch_size: int = settings.worker_batch_size,
+        poll_interval: float = settings.worker_poll_interval_seconds,
+        visibility_timeout: int = settings.worker_visibility_timeout_seconds,
+        group_max_recipients: int = settings.worker_group_max_recipients,
+        limiter: Optional[throttle.DomainLimiter] = None,
+        max_hold: float = settings.throttle_max_hold_seconds,
+        lane_weights: Optional[Dict[str, int]] = None,
+        source_weights: Optional[Dict[str, float]] = None,
+        source_max_processing: Optional[Dict[str, int]] = None,
+        express_concurrency: int = settings.worker_express_concurrency,
+        express_poll_interval: float = settings.worker_express_poll_interval_seconds
+    ):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.group_max_recipients = group_max_recipients
+        self.limiter = limiter or throttle.limiter_from_settings()
+        self.max_hold = max_hold
+        self.lane_weights = settings.worker_lane_weights if lane_weights is None else lane_weights
+        self.source_weights = settings.fair_source_weights if source_weights is None else source_weights
+        self.source_max_processing = (
+            settings.fair_source_max_processing if source_max_processing is None else source_max_processing
+        )
+        self._source_turns: Dict[str, int] = {}  # Round-robin position per lane
+        self._turn_lock = threading.Lock()          # The express lane claims "high" too
+        self.express_concurrency = express_concurrency
+        self.express_poll_interval = express_poll_interval
+        self.stopped = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="deliver")
+        self._express_pool = (
+            ThreadPoolExecutor(max_workers=express_concurrency, thread_name_prefix="express")
+            if express_concurrency > 0 else None
+        )
+
+    def claim(self, db, lane: Optional[str] = None) -> list:
+        """Claim up to batch_size rows from `lane`, or from every lane by weight"""
+        depths = crud.get_queue_depths(db)
+        if lane is not None:
+            return self._claim(db, lane, self.batch_size, depths)
+        quotas = lane_quotas(self.batch_size, self.lane_weights)
+        claimed, exhausted = [], set()
+        for lane, quota in quotas.items():
+            rows = self._claim(db, lane, quota, depths)
+            claimed.extend(rows)
+            if len(rows) < quota:
+                exhausted.add(lane)
+        # Lanes with fewer due rows than their share leave room for the others
+        for lane in LANES:
+            room = self.batch_size - len(claimed)
+            if room <= 0:
+                break
+            if lane not in exhausted:
+                claimed.extend(self._claim(db, lane, room, depths))
+        return claimed
+
+    def _claim(self, db, lane: str, limit: int, depths: Dict[str, Dict[str, int]]) -> list:
+        """
+        Claim up to `limit` rows of a lane, shared fairly among the sources
+        with queued work; `depths` (crud.get_queue_depths) is updated with
+        what was claimed
+        """
+        available = fairness.claimable(depths, self.source_max_processing)
+        with self._turn_lock:
+            turn = self._source_turns.get(lane, 0)
+            shares = fairness.fair_shares(limit, available, self.source_weights, offset=turn)
+            self._source_turns[lane] = fairness.next_turn(turn, len(shares), len(available))
+        claimed = crud.claim_pending_by_source(
+            db,
+            worker_id=self.worker_id,
+            shares=shares,
+            visibility_timeout_seconds=self.visibility_timeout,
+            priority=lane
+        ) if shares else []
+        for n in claimed:
+            depth = depths.setdefault(n.service_source or "", {"pending": 0, "processing": 0})
+            depth["pending"] = max(0, depth["pending"] - 1)
+            depth["processing"] += 1
+
+        # Rows the counters don't point to (expired claims) and room left by
+        # the sources above, except for sources at their processing cap
+        room = limit - len(claimed)
+        if room > 0:
+            capped = [
+                source for source, cap in self.source_max_processing.items()
+                if cap and depths.get(source, {}).get("processing", 0) >= cap
+            ]
+            claimed += crud.claim_pending_notifications(
+                db,
+                worker_id=self.worker_id,
+                limit=room,
+                visibility_timeout_seconds=self.visibility_timeout,
+                priority=lane,
+                exclude_sources=capped
+            )
+        return claimed
+
+    def run_once(
+        self,
+        lane: Optional[str] = None,
+        pool: Optional[ThreadPoolExecutor] = None,
+        concurrency: Optional[int] = None
+    ) -> int:
+        """
+        Claim a batch and deliver it, claiming the next batch whenever the
+        pool (`concurrency` threads) is about to run out of sends, until a
+        claim comes back short; returns the number of claimed rows
+        """
+        claimed_count, jobs = self._claim_jobs(lane)
+
+        def refill() -> Tuple[List[List[tuple]], bool]:
+            nonlocal claimed_count
+            if self.stopped.is_set():
+                return [], False
+            try:
+                count, more = self._claim_jobs(lane)
+            except Exception:
+                # The sends in flight still finish; the caller polls again
+                logger.exception("Claiming notifications failed")
+                return [], False
+            claimed_count += count
+            # A short batch means the queue is drained for now
+            return more, count >= self.batch_size
+
+        full = claimed_count >= self.batch_size
+        self.dispatch(jobs, pool, refill=refill if full else None, concurrency=concurrency or self.concurrency)
+        return claimed_count
+
+    def _claim_jobs(self, lane: Optional[str]) -> Tuple[int, List[List[tuple]]]:
+        """Claim a batch; returns the number of claimed rows and their send jobs"""
+        if smtp_breaker.is_open():
+            return 0, []  # Nothing could be sent; leave the queue to the other workers
+        db = SessionLocal()
+        try:
+            claimed = self.claim(db, lane)
+            deliver = digests.coalesce(db, claimed, self.worker_id)
+            batch = [(n.id, n.recipient_email, n.subject, n.message, n.mime_message, n.html_message) for n in deliver]
+        finally:
+            db.close()
+        return len(claimed), group_identical(batch, self.group_max_recipients)
+
+    def _deliver(self, domain: str, job: List[tuple]) -> None:
+        try:
+            if len(job) == 1:
+                deliver_notification(*job[0], self.worker_id)
+            else:
+                deliver_group(job, self.worker_id)
+        finally:
+            self.limiter.release(domain)
+
+    def dispatch(
+        self,
+        jobs: List[List[tuple]],
+        pool: Optional[ThreadPoolExecutor] = None,
+        refill: Optional[Callable[[], Tuple[List[List[tuple]], bool]]] = None,
+        concurrency: Optional[int] = None
+    ) -> None:
+        """
+        Send jobs (one SMTP transaction each, see `group_identical`) within
+        the per-domain limits. Jobs for domains with room start right away;
+        the others wait for a token or a free slot, or are deferred when the
+        wait exceeds `max_hold`.
+        With `refill`, fewer outstanding jobs than the pool's `concurrency`
+        threads calls it for more (jobs, whether to keep refilling), so one
+        slow send doesn't leave the other threads idle until it finishes.
+        """
+        pool = pool or self._pool
+        concurrency = concurrency or self.concurrency
+        waiting, running = list(jobs), set()
+        while True:
+            while refill is not None and len(waiting) + len(running) < concurrency:
+                more, again = refill()
+                waiting.extend(more)
+                if not again:
+                    refill = None
+            if not (waiting or running):
+                break
+            released = self.limiter.releases()
+            held, deferred, next_token = [], {}, None
+            queued: Dict[str, int] = {}
+            for job in waiting:
+                domain = throttle.recipient_domain(job[0][1])
+                delay = self.limiter.acquire(domain)
+                if delay is None:
+                    running.add(pool.submit(self._deliver, domain, job))
+                    continue
+                # Behind the other held sends to the same domain
+                eta = delay + queued.get(domain, 0) * self.limiter.interval(domain)
+                if eta > self.max_hold or self.stopped.is_set():
+                    deferred.update((item[0], eta) for item in job)
+                else:
+                    queued[domain] = queued.get(domain, 0) + 1
+                    held.append(job)
+                    if delay > 0:
+                        next_token = delay if next_token is None else min(next_token, delay)
+            waiting = held
+            if deferred:
+                self._defer(deferred)
+
+            if running:
+                # Until a send finishes (frees a slot) or the next token is due
+                done, running = wait(running, timeout=next_token, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        future.result()
+                    except Exception:
+                        logger.exception("Delivery failed")
+            elif waiting:
+                # Held by sends of other threads (e.g. the express lane): until
+                # one of them is released or the next token is due
+                self.limiter.wait_for_release(released, max(MIN_HOLD_WAIT, next_token or self.max_hold))
+
+    def _defer(self, delays: Dict[int, float]) -> None:
+        db = SessionLocal()
+        try:
+            crud.defer_notifications(db, delays, claimed_by=self.worker_id)
+        except Exception:
+            # The claims expire after the visibility timeout
+            logger.exception("Deferring throttled notifications failed")
+        finally:
+            db.close()
+
+    def run_express_lane(self) -> None:
+        """Deliver high priority notifications on the reserved threads"""
+        while not self.stopped.is_set():
+            try:
+                claimed = self.run_once(lane="high", pool=self._express_pool, concurrency=self.express_concurrency)
+            except Exception:
+                logger.exception("Claiming high priority notifications failed")
+                claimed = 0
+            if claimed < self.batch_size:
+                self.stopped.wait(self.express_poll_interval)
+
+    def run_forever(self) -> None:
+        logger.info(
+            "Worker %s started (concurrency=%d, express=%d)",
+            self.worker_id, self.concurrency, self.express_concurrency
+        )
+        express = None
+        if self._express_pool is not None:
+            express = threading.Thread(target=self.run_express_lane, name="express-lane", daemon=True)
+            express.start()
+        heartbeat = threading.Thread(target=self.run_heartbeat, name="heartbeat", daemon=True)
+        heartbeat.start()
+        while not self.stopped.is_set():
+            try:
+                claimed = self.run_once()
+            except Exception:
+                logger.exception("Claiming notifications failed")
+                claimed = 0
+            # Keep draining while the queue is busy, otherwise sleep until
+            # the next scheduled send or retry is due (at most poll_interval,
+            # to pick up newly queued notifications)
+            if claimed < self.batch_size:
+                self.stopped.wait(self.idle_wait())
+        if express is not None:
+            express.join()
+            self._express_pool.shutdown(wait=True)
+        self._pool.shutdown(wait=True)
+        heartbeat.join()
+        logger.info("Worker %s stopped", self.worker_id)
+
+    def run_heartbeat(self) -> None:
+        """Report this process's SMTP breaker for /health until stopped, then remove the report"""
+        while True:
+            db = SessionLocal()
+            try:
+                if self.stopped.is_set():
+                    crud.delete_worker_heartbeat(db, self.worker_id)
+                    return
+                crud.record_worker_heartbeat(db, self.worker_id, smtp_breaker.stats())
+            except Exception:
+                logger.exception("Recording the worker heartbeat failed")
+                if self.stopped.is_set():
+                    return
+            finally:
+                db.close()
+            self.stopped.wait(settings.worker_heartbeat_seconds)
+
+    def idle_wait(self) -> float:
+        """Seconds until the earliest pending notification is due, capped at poll_interval"""
+        db = SessionLocal()
+        try:
+            next_due = crud.get_next_due_time(db)
+        except Exception:
+            logger.exception("Reading the next due time failed")
+            return self.poll_interval
+        finally:
+            db.close()
+        if next_due is None:
+            return self.poll_interval
+        if next_due.tzinfo is not None:
+            next_due = next_due.astimezone(timezone.utc).replace(tzinfo=None)
+        return min(self.poll_interval, max(0.0, (next_due - datetime.utcnow()).total_seconds()))
+
+    def stop(self, *_) -> None:
+        self.stopped.set()
+
+
+def _run_process() -> None:
+    worker = NotificationWorker()
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Notification delivery worker")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("WORKER_PROCESSES", 1)))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+
+    if args.processes <= 1:
+        _run_process()
+        return
+
+    processes = [
+        multiprocessing.Process(target=_run_process, name=f"worker-{i}")
+        for i in range(args.processes)
+    ]
+    for p in processes:
+        p.start()
+
+    def forward(signum, _frame):
+        for p in processes:
+            if p.is_alive():
+                os.kill(p.pid, signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for p in processes:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
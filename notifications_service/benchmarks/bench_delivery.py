@@ -0,0 +1,190 @@
+"""
+End-to-end delivery throughput against the fake SMTP server.
+
+Starts benchmarks/fake_smtp.py in this process, the API (uvicorn) and the
+delivery worker as subprocesses, pushes `--notifications` through
+POST /notifications/send with `--concurrency` clients, and waits until the
+fake server has accepted every recipient. Reports enqueue and delivery
+rates, enqueue-to-sent latency percentiles (from the moment /send returned
+to the moment the server accepted the message) and the SMTP connections
+and transactions it took:
+
+    python benchmarks/bench_delivery.py --notifications 2000
+    DATABASE_URL=postgresql://... python benchmarks/bench_delivery.py --worker-processes 4
+    python benchmarks/bench_delivery.py --latency 0.05 --failure-rate 0.02 --throttle-rate 200
+
+`--identical` gives every notification the same subject and message, so the
+worker can group them into multi-recipient transactions. Worker settings
+are read from the environment as usual (WORKER_CONCURRENCY,
+DOMAIN_LIMITS, RETRY_DELAY_SECONDS, ...).
+
+Without DATABASE_URL a throwaway SQLite file is used. That is only a smoke
+test: SQLite has a single writer lock (some /send requests may fail with
+"database is locked" under concurrency; they are counted) and no SKIP
+LOCKED, so only one worker process runs. Use an empty database.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_smtp import FakeSMTPServer  # noqa: E402
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def start_services(args, smtp_port: int):
+    env = {
+        **os.environ,
+        "DATABASE_URL": args.database_url,
+        "EMAIL_HOST": "127.0.0.1",
+        "EMAIL_PORT": str(smtp_port),
+        "EMAIL_USE_TLS": "false",
+        "EMAIL_USER": "",
+        "EMAIL_PASSWORD": "",
+        "RETENTION_INTERVAL_SECONDS": "0",
+    }
+    env.setdefault("WORKER_POLL_INTERVAL_SECONDS", "0.1")
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.api_port), "--log-level", "warning"],
+        cwd=SERVICE_DIR, env=env
+    )
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            if httpx.get(f"{api_url}/health").status_code == 200:
+                break
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline or api.poll() is not None:
+            api.terminate()
+            raise RuntimeError("API did not start")
+        time.sleep(0.2)
+    worker = subprocess.Popen(
+        [sys.executable, "-m", "app.worker", "--processes", str(args.worker_processes)],
+        cwd=SERVICE_DIR, env=env
+    )
+    return api, worker, api_url
+
+
+async def enqueue(api_url: str, count: int, concurrency: int, identical: bool, domains: int):
+    """
+    POST /notifications/send `count` times; returns (recipient -> time the
+    API answered, number of failed requests)
+    """
+    enqueued: Dict[str, float] = {}
+    failed = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=api_url, limits=limits, timeout=60) as client:
+        async def send(i: int) -> None:
+            recipient = f"user{i}@domain{i % domains}.example.com"
+            body = {
+                "recipient_email": recipient,
+                "subject": "Benchmark" if identical else f"Benchmark {i}",
+                "message": "Same message for everyone" if identical else f"Message number {i}",
+                "service_source": "benchmark",
+                "event_type": "bench_delivery",
+            }
+            nonlocal failed
+            async with semaphore:
+                response = await client.post("/notifications/send", json=body)
+            if response.status_code == 201:
+                enqueued[recipient] = time.monotonic()
+            else:
+                failed += 1
+
+        await asyncio.gather(*(send(i) for i in range(count)))
+    return enqueued, failed
+
+
+def wait_until_settled(api_url: str, timeout: float) -> dict:
+    """Delivery statistics once nothing is pending or processing (or at the timeout)"""
+    deadline = time.monotonic() + timeout
+    while True:
+        stats = httpx.get(f"{api_url}/notifications/stats", params={"service_source": "benchmark"}).json()
+        totals = stats.get("totals", {})
+        if not totals.get("pending") and not totals.get("processing") or time.monotonic() > deadline:
+            return totals
+        time.sleep(0.1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notifications", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent HTTP clients")
+    parser.add_argument("--worker-processes", type=int, default=1)
+    parser.add_argument("--domains", type=int, default=10, help="Distinct recipient domains")
+    parser.add_argument("--identical", action="store_true", help="Same subject and message for every notification")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake SMTP: seconds before answering DATA")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fake SMTP: share of messages failed with 451")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fake SMTP: recipients accepted per second")
+    parser.add_argument("--api-port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for delivery")
+    parser.add_argument(
+        "--database-url",
+        default=os.getenv("DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    )
+    args = parser.parse_args()
+    if args.database_url.startswith("sqlite") and args.worker_processes > 1:
+        print("SQLite: running a single worker process")
+        args.worker_processes = 1
+
+    smtp = FakeSMTPServer(
+        latency=args.latency, failure_rate=args.failure_rate, throttle_rate=args.throttle_rate, seed=1
+    ).start_in_thread()
+    api, worker, api_url = start_services(args, smtp.port)
+    try:
+        started = time.monotonic()
+        enqueued, enqueue_failed = asyncio.run(
+            enqueue(api_url, args.notifications, args.concurrency, args.identical, args.domains)
+        )
+        enqueue_seconds = time.monotonic() - started
+
+        deadline = time.monotonic() + args.timeout
+        while len(smtp.received) < len(enqueued) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        received = dict(smtp.received)
+        totals = wait_until_settled(api_url, timeout=5)
+    finally:
+        worker.terminate()
+        api.terminate()
+        worker.wait()
+        api.wait()
+        smtp.stop()
+
+    latencies = [received[r] - enqueued[r] for r in received if r in enqueued]
+    print(f"notifications:      {args.notifications} ({args.worker_processes} worker process(es), "
+          f"{args.domains} domains{', identical content' if args.identical else ''})")
+    print(f"enqueue:            {len(enqueued) / enqueue_seconds:,.0f}/s over {enqueue_seconds:.2f}s"
+          + (f", {enqueue_failed} requests failed" if enqueue_failed else ""))
+    if not latencies:
+        print("delivered:          0")
+        return
+    delivery_seconds = max(received.values()) - started
+    print(f"delivered:          {len(received)} in {delivery_seconds:.2f}s -> {len(received) / delivery_seconds:,.0f} emails/s")
+    print("enqueue->sent:      p50 {:.3f}s  p90 {:.3f}s  p99 {:.3f}s  max {:.3f}s".format(
+        percentile(latencies, 50), percentile(latencies, 90), percentile(latencies, 99), max(latencies)
+    ))
+    print(f"smtp:               {smtp.stats['connections']} connections, {smtp.stats['transactions']} transactions, "
+          f"{smtp.stats['failed_transactions']} failed, {smtp.stats['throttled_recipients']} throttled recipients")
+    print(f"final statuses:     {totals}")
+
+
+if __name__ == "__main__":
+    main()
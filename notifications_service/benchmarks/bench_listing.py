@@ -0,0 +1,115 @@
+"""
+Notification listing: offset pagination vs. keyset cursors.
+
+Seeds `--rows` notifications (a few million by default) into DATABASE_URL,
+then times one page at increasing depths with `skip` and with the cursor
+that GET /notifications returns in X-Next-Cursor, unfiltered and filtered
+by status, service_source and recipient_email:
+
+    DATABASE_URL=postgresql://... python benchmarks/bench_listing.py --rows 3000000
+    python benchmarks/bench_listing.py --rows 500000   # throwaway SQLite file
+
+Run `alembic upgrade head` (or start the app once) first on Postgres so the
+listing indexes exist. Use an empty database: the notify_db table is
+truncated before seeding unless --no-seed is given.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import text  # noqa: E402
+
+from app import crud, models  # noqa: E402
+from app.database import SessionLocal, engine  # noqa: E402
+
+SOURCES = ["material_service", "user_service", "schedule_service", "grading_service"]
+STATUSES = ["SENT", "SENT", "SENT", "FAILED", "PENDING"]
+
+
+def seed(rows: int) -> None:
+    models.Base.metadata.create_all(bind=engine)
+    sources = "ARRAY[" + ",".join(f"'{s}'" for s in SOURCES) + "]"
+    statuses = "ARRAY[" + ",".join(f"'{s}'" for s in STATUSES) + "]"
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM notify_db"))
+        if engine.dialect.name == "postgresql":
+            conn.execute(text(f"""
+                INSERT INTO notify_db (recipient_email, subject, message, notification_type, status,
+                                       service_source, event_type, created_at, attempts, next_attempt_at)
+                SELECT 'student' || (i % 50000) || '@school.edu', 'Subject ' || i, 'Message body ' || i,
+                       'EMAIL', ({statuses})[1 + i % {len(STATUSES)}]::notificationstatus,
+                       ({sources})[1 + i % {len(SOURCES)}], 'material_created',
+                       now() - (i * interval '1 second'), 0, now()
+                FROM generate_series(1, :rows) AS i
+            """), {"rows": rows})
+            conn.execute(text("ANALYZE notify_db"))
+        else:
+            status_case = " ".join(f"WHEN {n} THEN '{s}'" for n, s in enumerate(STATUSES))
+            source_case = " ".join(f"WHEN {n} THEN '{s}'" for n, s in enumerate(SOURCES))
+            conn.execute(text(f"""
+                WITH RECURSIVE seq(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM seq WHERE i < :rows)
+                INSERT INTO notify_db (recipient_email, subject, message, notification_type, status,
+                                       service_source, event_type, created_at, attempts, next_attempt_at)
+                SELECT 'student' || (i % 50000) || '@school.edu', 'Subject ' || i, 'Message body ' || i,
+                       'EMAIL', CASE i % {len(STATUSES)} {status_case} END,
+                       CASE i % {len(SOURCES)} {source_case} END, 'material_created',
+                       strftime('%Y-%m-%d %H:%M:%f', 'now', '-' || i || ' seconds'), 0,
+                       strftime('%Y-%m-%d %H:%M:%f', 'now')
+                FROM seq
+            """), {"rows": rows})
+            conn.execute(text("ANALYZE"))
+
+
+def timed(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--depths", type=int, nargs="+", default=[0, 1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-seed", action="store_true")
+    args = parser.parse_args()
+
+    if not args.no_seed:
+        started = time.perf_counter()
+        seed(args.rows)
+        print(f"seeded {args.rows} rows in {time.perf_counter() - started:.1f}s ({engine.dialect.name})")
+
+    filters = {
+        "all": {},
+        "status": {"status": "sent"},
+        "service_source": {"service_source": "material_service"},
+        "recipient_email": {"recipient_email": "student42@school.edu"},
+    }
+    db = SessionLocal()
+    try:
+        print(f"{'filter':<16} {'depth':>9} {'offset ms':>10} {'cursor ms':>10}")
+        for name, where in filters.items():
+            for depth in args.depths:
+                # The row just before the page, i.e. what the previous page's cursor points at
+                anchor = crud.get_notifications(db, skip=max(depth - 1, 0), limit=1, **where) if depth else []
+                if depth and not anchor:
+                    break
+                cursor = crud.decode_cursor(crud.encode_cursor(anchor[0])) if anchor else None
+                offset_ms = timed(lambda: crud.get_notifications(db, skip=depth, limit=args.limit, **where), args.repeat)
+                cursor_ms = timed(lambda: crud.get_notifications(db, cursor=cursor, limit=args.limit, **where), args.repeat)
+                print(f"{name:<16} {depth:>9} {offset_ms:>10.2f} {cursor_ms:>10.2f}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
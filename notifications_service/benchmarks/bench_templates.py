@@ -0,0 +1,69 @@
+"""
+Per-email template rendering cost, before and after the template registry.
+
+"before" builds a jinja2.Template from source on every call, as the old
+render functions did; "after" renders the precompiled registry template.
+
+    python benchmarks/bench_templates.py --iterations 5000
+"""
+import argparse
+import os
+import sys
+import time
+
+from jinja2 import Template
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.email import templates  # noqa: E402
+
+SUBJECT = "New material: Python Basics"
+MESSAGE = "A new material has been added.\nOpen the portal to read it.\n" * 5
+
+
+def render_before_simple() -> str:
+    return Template(templates.SIMPLE_NOTIFICATION_SOURCE.replace("|nl2br", "|safe")).render(
+        subject=SUBJECT, message=MESSAGE.replace("\n", "<br>")
+    )
+
+
+def render_before_material() -> str:
+    return Template(templates.MATERIAL_CREATED_SOURCE).render(
+        material_title="Python Basics", subject=SUBJECT, created_by="teacher@school.edu"
+    )
+
+
+def render_after_simple() -> str:
+    return templates.render_simple_notification_template(SUBJECT, MESSAGE)
+
+
+def render_after_material() -> str:
+    return templates.render_material_created_template("Python Basics", SUBJECT, "teacher@school.edu")
+
+
+def measure(func, iterations: int) -> float:
+    func()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'template':<22} {'before us':>10} {'after us':>10} {'speedup':>8} {'bytes':>12}")
+    for name, before, after in (
+        ("simple_notification", render_before_simple, render_after_simple),
+        ("material_created", render_before_material, render_after_material),
+    ):
+        t_before = measure(before, args.iterations)
+        t_after = measure(after, args.iterations)
+        size = f"{len(before().encode())}->{len(after().encode())}"
+        print(f"{name:<22} {t_before:>10.1f} {t_after:>10.1f} {t_before / t_after:>7.1f}x {size:>12}")
+
+
+if __name__ == "__main__":
+    main()
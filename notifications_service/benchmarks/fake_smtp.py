@@ -0,0 +1,197 @@
+"""
+Fake SMTP server for local delivery benchmarks and manual testing.
+
+Speaks enough SMTP (EHLO/HELO, AUTH PLAIN, MAIL, RCPT, DATA, RSET, NOOP,
+QUIT) for smtplib and aiosmtplib, without TLS, and discards the messages.
+It can simulate a slow or unreliable provider:
+
+- `latency`: seconds before answering DATA;
+- `failure_rate`: share of messages answered with a temporary 451;
+- `throttle_rate`: recipients accepted per second (token bucket), the rest
+  get 450 "rate limited".
+
+Run it on its own and point the service at it:
+
+    python benchmarks/fake_smtp.py --port 2525 --latency 0.05
+    EMAIL_HOST=127.0.0.1 EMAIL_PORT=2525 EMAIL_USE_TLS=false EMAIL_USER= python -m app.worker
+
+or embed it with `FakeSMTPServer(...).start_in_thread()` (bench_delivery.py).
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+CRLF = b"\r\n"
+
+
+class FakeSMTPServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+
+        # recipient -> time.monotonic() when its message was accepted
+        self.received: Dict[str, float] = {}
+        self.stats = {
+            "connections": 0,
+            "transactions": 0,
+            "recipients": 0,
+            "failed_transactions": 0,
+            "throttled_recipients": 0,
+        }
+        self._tokens = max(1.0, throttle_rate)
+        self._tokens_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def _take_token(self) -> bool:
+        if not self.throttle_rate:
+            return True
+        now = time.monotonic()
+        self._tokens = min(max(1.0, self.throttle_rate), self._tokens + (now - self._tokens_at) * self.throttle_rate)
+        self._tokens_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += amount
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._count("connections")
+
+        def reply(*lines: str) -> None:
+            for i, line in enumerate(lines):
+                separator = "-" if i < len(lines) - 1 else " "
+                writer.write(f"{line[:3]}{separator}{line[4:]}".encode() + CRLF)
+
+        reply("220 fake-smtp ready")
+        recipients = []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                verb = line[:4].decode("ascii", "replace").upper()
+                if verb == "EHLO":
+                    reply("250 fake-smtp", "250 AUTH PLAIN", "250 8BITMIME", "250 PIPELINING")
+                elif verb == "HELO":
+                    reply("250 fake-smtp")
+                elif verb == "AUTH":
+                    reply("235 2.7.0 Authentication successful")
+                elif verb == "MAIL":
+                    recipients = []
+                    reply("250 2.1.0 OK")
+                elif verb == "RCPT":
+                    if self._take_token():
+                        address = line.decode("utf-8", "replace").partition(":")[2].strip().split()[0].strip("<>")
+                        recipients.append(address)
+                        reply("250 2.1.5 OK")
+                    else:
+                        self._count("throttled_recipients")
+                        reply("450 4.7.1 Rate limited, try again later")
+                elif verb == "DATA":
+                    if not recipients:
+                        reply("503 5.5.1 No valid recipients")
+                        continue
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    while (await reader.readline()) not in (b".\r\n", b".\n", b""):
+                        pass
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    self._count("transactions")
+                    if self.random.random() < self.failure_rate:
+                        self._count("failed_transactions")
+                        reply("451 4.3.0 Temporary failure")
+                    else:
+                        now = time.monotonic()
+                        with self._lock:
+                            self.stats["recipients"] += len(recipients)
+                            for address in recipients:
+                                self.received.setdefault(address, now)
+                        reply("250 2.0.0 Queued")
+                    recipients = []
+                elif verb == "RSET":
+                    recipients = []
+                    reply("250 2.0.0 OK")
+                elif verb == "NOOP":
+                    reply("250 2.0.0 OK")
+                elif verb == "QUIT":
+                    reply("221 2.0.0 Bye")
+                    await writer.drain()
+                    break
+                else:
+                    reply("502 5.5.2 Command not recognized")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def start_in_thread(self) -> "FakeSMTPServer":
+        """Serve on a background event loop; returns once the port is bound"""
+        ready = threading.Event()
+
+        def run() -> None:
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=run, name="fake-smtp", daemon=True).start()
+        ready.wait()
+        return self
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake SMTP server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before answering DATA")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of messages answered with 451")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Recipients accepted per second, 0 = no limit")
+    args = parser.parse_args()
+
+    server = FakeSMTPServer(args.host, args.port, args.latency, args.failure_rate, args.throttle_rate)
+
+    async def serve() -> None:
+        await server.start()
+        print(f"Fake SMTP server on {server.host}:{server.port}")
+        while True:
+            await asyncio.sleep(10)
+            print(server.stats)
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+#!/bin/sh
+# Bring the schema up to date, then run the container's command (the API
+# server by default, or `python -m app.worker`). Every container may run
+# this at once: migrations/env.py serializes them with an advisory lock.
+# Set SKIP_MIGRATIONS=1 where `alembic upgrade head` runs as a release step.
+set -e
+
+if [ "${SKIP_MIGRATIONS:-0}" != "1" ]; then
+    alembic upgrade head
+fi
+
+exec "$@"
@@ -0,0 +1,45 @@
+from logging.config import fileConfig
+
+import sqlalchemy as sa
+from alembic import context
+
+from app.database import engine
+from app import models
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = models.Base.metadata
+
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=str(engine.url),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+# Held for the whole run, so containers starting together migrate one at a time
+MIGRATION_LOCK_ID = 724_100_501
+
+
+def run_migrations_online() -> None:
+    with engine.connect() as connection:
+        if connection.dialect.name == "postgresql":
+            # Session-level: survives the commits of autocommit_block()
+            connection.execute(sa.text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            connection.commit()
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,187 @@
+"""Catch up databases created before migrations existed
+
+Brings a notify_db created by `create_all` from the original models up to
+the current schema: delivery worker claims, campaigns, retries and
+scheduling, idempotency keys, digests and the archive table. Every step
+checks what is already there, so it is a no-op on a database that
+`create_all` built from the current models, and an empty database gets
+the original table first.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# SQLEnum stores member names
+NOTIFICATION_STATUSES = ("PENDING", "PROCESSING", "SENT", "FAILED", "DEAD_LETTER", "DIGESTED")
+NOTIFICATION_TYPES = ("EMAIL", "SMS", "PUSH")
+CAMPAIGN_STATUSES = ("LOADING", "QUEUED", "FAILED")
+
+
+def _enum(name, values, existing=True):
+    # Existing Postgres types must not be created again by create_table
+    return sa.Enum(*values, name=name).with_variant(
+        postgresql.ENUM(*values, name=name, create_type=not existing), "postgresql"
+    )
+
+
+def _columns(inspector, table):
+    return {column["name"] for column in inspector.get_columns(table)}
+
+
+def _indexes(inspector, table):
+    return {index["name"] for index in inspector.get_indexes(table)}
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+
+    if "notify_db" not in tables:
+        # Fresh database: start from the original table, then catch up below
+        op.create_table(
+            "notify_db",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("recipient_email", sa.String(255), nullable=False),
+            sa.Column("subject", sa.String(255), nullable=False),
+            sa.Column("message", sa.Text(), nullable=False),
+            sa.Column("notification_type", _enum("notificationtype", NOTIFICATION_TYPES, existing=False)),
+            sa.Column("status", _enum("notificationstatus", NOTIFICATION_STATUSES, existing=False)),
+            sa.Column("service_source", sa.String(100)),
+            sa.Column("event_type", sa.String(100)),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("sent_at", sa.DateTime(timezone=True)),
+            sa.Column("error_message", sa.Text()),
+        )
+        op.create_index("ix_notify_db_id", "notify_db", ["id"])
+        op.create_index("ix_notify_db_recipient_email", "notify_db", ["recipient_email"])
+    elif bind.dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            for value in NOTIFICATION_STATUSES:
+                op.execute(f"ALTER TYPE notificationstatus ADD VALUE IF NOT EXISTS '{value}'")
+
+    if "campaigns" not in tables:
+        op.create_table(
+            "campaigns",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("name", sa.String(255), nullable=False),
+            sa.Column("subject_template", sa.String(255), nullable=False),
+            sa.Column("body_template", sa.Text(), nullable=False),
+            sa.Column("service_source", sa.String(100)),
+            sa.Column("event_type", sa.String(100)),
+            sa.Column("status", _enum("campaignstatus", CAMPAIGN_STATUSES, existing=False)),
+            sa.Column("rendered_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("failed_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("error_message", sa.Text()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("started_at", sa.DateTime(timezone=True)),
+            sa.Column("loaded_at", sa.DateTime(timezone=True)),
+        )
+        op.create_index("ix_campaigns_id", "campaigns", ["id"])
+
+    existing = _columns(inspector, "notify_db")
+    new_columns = [
+        sa.Column("claimed_at", sa.DateTime(timezone=True)),
+        sa.Column("claimed_by", sa.String(100)),
+        sa.Column("campaign_id", sa.Integer(), sa.ForeignKey("campaigns.id", name="fk_notify_db_campaign_id")),
+        sa.Column("mime_message", sa.Text()),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("send_at", sa.DateTime(timezone=True)),
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True)),
+        sa.Column("idempotency_key", sa.String(255)),
+        sa.Column("idempotency_expires_at", sa.DateTime(timezone=True)),
+        sa.Column("digest_key", sa.String(400)),
+        sa.Column("digest_id", sa.Integer(), sa.ForeignKey("notify_db.id", name="fk_notify_db_digest_id", ondelete="SET NULL")),
+    ]
+    with op.batch_alter_table("notify_db") as batch:
+        for column in new_columns:
+            if column.name not in existing:
+                batch.add_column(column)
+
+    # Rows queued before scheduling existed are due now
+    op.execute("UPDATE notify_db SET next_attempt_at = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE next_attempt_at IS NULL")
+
+    indexes = _indexes(sa.inspect(bind), "notify_db")
+    for name, columns, unique in (
+        ("ix_notify_db_campaign_id", ["campaign_id"], False),
+        ("ix_notify_db_idempotency_key", ["idempotency_key"], True),
+        ("ix_notify_db_digest_key", ["digest_key"], False),
+        ("ix_notify_db_digest_id", ["digest_id"], False),
+        ("ix_notify_db_status_next_attempt_at", ["status", "next_attempt_at"], False),
+    ):
+        if name not in indexes:
+            op.create_index(name, "notify_db", columns, unique=unique)
+
+    if "notify_db_archive" not in tables:
+        op.create_table(
+            "notify_db_archive",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=False),
+            sa.Column("recipient_email", sa.String(255), nullable=False),
+            sa.Column("subject", sa.String(255), nullable=False),
+            sa.Column("message", sa.Text(), nullable=False),
+            sa.Column("notification_type", _enum("notificationtype", NOTIFICATION_TYPES)),
+            sa.Column("status", _enum("notificationstatus", NOTIFICATION_STATUSES)),
+            sa.Column("service_source", sa.String(100)),
+            sa.Column("event_type", sa.String(100)),
+            sa.Column("created_at", sa.DateTime(timezone=True)),
+            sa.Column("sent_at", sa.DateTime(timezone=True)),
+            sa.Column("error_message", sa.Text()),
+            sa.Column("attempts", sa.Integer()),
+            sa.Column("campaign_id", sa.Integer()),
+            sa.Column("digest_id", sa.Integer()),
+            sa.Column("archived_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_notify_db_archive_recipient_email", "notify_db_archive", ["recipient_email"])
+        op.create_index("ix_notify_db_archive_archived_at", "notify_db_archive", ["archived_at"])
+
+
+# Added by upgrade(), in the order they are dropped again
+ADDED_INDEXES = (
+    "ix_notify_db_status_next_attempt_at",
+    "ix_notify_db_digest_id",
+    "ix_notify_db_digest_key",
+    "ix_notify_db_idempotency_key",
+    "ix_notify_db_campaign_id",
+)
+ADDED_COLUMNS = (
+    "digest_id", "digest_key", "idempotency_expires_at", "idempotency_key", "next_attempt_at",
+    "send_at", "attempts", "mime_message", "campaign_id", "claimed_by", "claimed_at",
+)
+
+
+def downgrade() -> None:
+    # Back to the original create_all schema: notify_db stays, with its data.
+    # Postgres can't drop enum values, so PROCESSING, DEAD_LETTER and DIGESTED
+    # stay in notificationstatus; the original code never writes them.
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+
+    if "notify_db_archive" in tables:
+        op.drop_table("notify_db_archive")
+
+    indexes = _indexes(inspector, "notify_db")
+    for name in ADDED_INDEXES:
+        if name in indexes:
+            op.drop_index(name, table_name="notify_db")
+
+    existing = _columns(inspector, "notify_db")
+    with op.batch_alter_table("notify_db") as batch:
+        for name in ADDED_COLUMNS:
+            if name in existing:
+                batch.drop_column(name)
+
+    if "campaigns" in tables:
+        op.drop_table("campaigns")
+        if bind.dialect.name == "postgresql":
+            op.execute("DROP TYPE IF EXISTS campaignstatus")
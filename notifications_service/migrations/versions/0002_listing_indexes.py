@@ -0,0 +1,48 @@
+"""Composite indexes for keyset-paginated notification listing
+
+GET /notifications pages by (created_at, id) newest first, optionally
+filtered by recipient_email, status or service_source. Each index below
+serves one of those queries as a single range scan. On Postgres they are
+built CONCURRENTLY so the table stays writable.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ("ix_notify_db_created_at", ["created_at", "id"]),
+    ("ix_notify_db_recipient_email_created_at", ["recipient_email", "created_at", "id"]),
+    ("ix_notify_db_status_created_at", ["status", "created_at", "id"]),
+    ("ix_notify_db_service_source_created_at", ["service_source", "created_at", "id"]),
+)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    existing = {index["name"]: index["column_names"] for index in sa.inspect(bind).get_indexes("notify_db")}
+    postgres = bind.dialect.name == "postgresql"
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            if existing.get(name) == columns:
+                continue
+            if name in existing:
+                # e.g. an older single-column ix_notify_db_created_at
+                op.drop_index(name, table_name="notify_db", postgresql_concurrently=postgres)
+            op.create_index(name, "notify_db", columns, postgresql_concurrently=postgres)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    postgres = bind.dialect.name == "postgresql"
+    with op.get_context().autocommit_block():
+        for name, _ in INDEXES:
+            op.drop_index(name, table_name="notify_db", postgresql_concurrently=postgres)
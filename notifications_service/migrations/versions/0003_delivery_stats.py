@@ -0,0 +1,66 @@
+"""Counters and rollups for delivery statistics
+
+Creates notification_counters and notification_rollups (see app/stats.py)
+and seeds the counters from the existing rows with one GROUP BY, after
+which the application keeps them up to date. Rollups start empty: past
+send times were not recorded per bucket.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    tables = set(sa.inspect(bind).get_table_names())
+
+    if "notification_counters" not in tables:
+        op.create_table(
+            "notification_counters",
+            sa.Column("service_source", sa.String(100), primary_key=True),
+            sa.Column("event_type", sa.String(100), primary_key=True),
+            sa.Column("status", sa.String(20), primary_key=True),
+            sa.Column("shard", sa.Integer(), primary_key=True, autoincrement=False),
+            sa.Column("count", sa.Integer(), nullable=False),
+        )
+    if "notification_rollups" not in tables:
+        op.create_table(
+            "notification_rollups",
+            sa.Column("granularity", sa.String(10), primary_key=True),
+            sa.Column("bucket_start", sa.DateTime(), primary_key=True),
+            sa.Column("service_source", sa.String(100), primary_key=True),
+            sa.Column("event_type", sa.String(100), primary_key=True),
+            sa.Column("shard", sa.Integer(), primary_key=True, autoincrement=False),
+            sa.Column("created", sa.Integer(), nullable=False),
+            sa.Column("sent", sa.Integer(), nullable=False),
+            sa.Column("failed", sa.Integer(), nullable=False),
+            sa.Column("retried", sa.Integer(), nullable=False),
+            sa.Column("send_latency_seconds", sa.Float(), nullable=False),
+        )
+
+    # Seed once; the application maintains the counters from here on.
+    # SQLEnum stores member names, the counters use the lowercase values.
+    if bind.execute(sa.text("SELECT COUNT(*) FROM notification_counters")).scalar() == 0:
+        op.execute(
+            """
+            INSERT INTO notification_counters (service_source, event_type, status, shard, count)
+            SELECT COALESCE(service_source, ''), COALESCE(event_type, ''),
+                   LOWER(CAST(status AS VARCHAR(20))), 0, COUNT(*)
+            FROM notify_db
+            GROUP BY COALESCE(service_source, ''), COALESCE(event_type, ''), LOWER(CAST(status AS VARCHAR(20)))
+            """
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("notification_rollups")
+    op.drop_table("notification_counters")
@@ -0,0 +1,49 @@
+"""Subscriptions for event fan-out
+
+Adds the subscriptions table, whose unique (topic, value, recipient_email)
+index serves the fan-out range scans, and notify_db.html_message for the
+HTML part rendered once per event.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if "subscriptions" not in inspector.get_table_names():
+        op.create_table(
+            "subscriptions",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("recipient_email", sa.String(255), nullable=False),
+            sa.Column("topic", sa.String(20), nullable=False),
+            sa.Column("value", sa.String(200), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_subscriptions_id", "subscriptions", ["id"])
+        op.create_index("ix_subscriptions_recipient_email", "subscriptions", ["recipient_email"])
+        op.create_index(
+            "uq_subscriptions_topic_value_recipient", "subscriptions",
+            ["topic", "value", "recipient_email"], unique=True
+        )
+
+    if "html_message" not in {column["name"] for column in inspector.get_columns("notify_db")}:
+        with op.batch_alter_table("notify_db") as batch:
+            batch.add_column(sa.Column("html_message", sa.Text()))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("notify_db") as batch:
+        batch.drop_column("html_message")
+    op.drop_table("subscriptions")
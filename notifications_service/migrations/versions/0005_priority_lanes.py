@@ -0,0 +1,47 @@
+"""Priority lanes
+
+Adds notify_db.priority ("high", "normal" or "bulk") and the
+(status, priority, next_attempt_at) index the workers claim each lane
+with (built CONCURRENTLY on Postgres). Existing campaign notifications go
+to the bulk lane.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+INDEX = "ix_notify_db_status_priority_next_attempt_at"
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if "priority" not in {column["name"] for column in inspector.get_columns("notify_db")}:
+        with op.batch_alter_table("notify_db") as batch:
+            batch.add_column(sa.Column("priority", sa.String(10), nullable=False, server_default="normal"))
+        op.execute("UPDATE notify_db SET priority = 'bulk' WHERE campaign_id IS NOT NULL")
+
+    existing = {index["name"] for index in sa.inspect(bind).get_indexes("notify_db")}
+    if INDEX not in existing:
+        with op.get_context().autocommit_block():
+            op.create_index(
+                INDEX, "notify_db", ["status", "priority", "next_attempt_at"],
+                postgresql_concurrently=bind.dialect.name == "postgresql"
+            )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    with op.get_context().autocommit_block():
+        op.drop_index(INDEX, table_name="notify_db", postgresql_concurrently=bind.dialect.name == "postgresql")
+    with op.batch_alter_table("notify_db") as batch:
+        batch.drop_column("priority")
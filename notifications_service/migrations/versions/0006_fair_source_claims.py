@@ -0,0 +1,37 @@
+"""Per-source claim index
+
+Adds (status, priority, service_source, next_attempt_at) on notify_db so
+the workers claim each service_source's share of a lane with its own range
+scan (app/fairness.py). Built CONCURRENTLY on Postgres.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+INDEX = "ix_notify_db_status_priority_source_next_attempt_at"
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    existing = {index["name"] for index in sa.inspect(bind).get_indexes("notify_db")}
+    if INDEX not in existing:
+        with op.get_context().autocommit_block():
+            op.create_index(
+                INDEX, "notify_db", ["status", "priority", "service_source", "next_attempt_at"],
+                postgresql_concurrently=bind.dialect.name == "postgresql"
+            )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    with op.get_context().autocommit_block():
+        op.drop_index(INDEX, table_name="notify_db", postgresql_concurrently=bind.dialect.name == "postgresql")
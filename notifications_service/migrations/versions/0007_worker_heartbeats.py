@@ -0,0 +1,32 @@
+"""Worker heartbeats
+
+Adds worker_heartbeats, where each delivery worker process reports its
+SMTP circuit breaker state for /health.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if "worker_heartbeats" not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            "worker_heartbeats",
+            sa.Column("worker_id", sa.String(200), primary_key=True),
+            sa.Column("breaker_state", sa.String(20), nullable=False),
+            sa.Column("failure_rate", sa.Float(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("worker_heartbeats")
@@ -435,4 +435,973 @@ def test_configuration_loading_mock():
         assert config.email_host == 'smtp.gmail.com'
         assert config.email_port == 587
         assert config.email_user == 'test@example.com'
-        assert config.email_password == 'secret'
\ No newline at end of file
+        assert config.email_password == 'secret'
+
+# ============================================================================
+# Test 11: SMTP Connection Pool
+# ============================================================================
+
+def _import_sender():
+    with patch.dict('os.environ', {'EMAIL_USER': 'test@example.com', 'EMAIL_PASSWORD': 'secret'}):
+        from app.email import sender
+    return sender
+
+def test_smtp_pool_reuses_authenticated_session():
+    """Test that several emails share one SMTP connection and login"""
+    sender = _import_sender()
+    with patch('smtplib.SMTP') as mock_smtp_class:
+        pool = sender.SMTPConnectionPool("smtp.test", 587, "user", "pass", size=2)
+        
+        for _ in range(3):
+            with pool.connection() as server:
+                server.send_message("msg")
+        
+        assert mock_smtp_class.call_count == 1
+        assert mock_smtp_class.return_value.login.call_count == 1
+        assert mock_smtp_class.return_value.send_message.call_count == 3
+        assert pool.stats()["connections_reused"] == 2
+        assert pool.stats()["idle"] == 1
+
+def test_smtp_pool_replaces_broken_and_exhausted_sessions():
+    """Test reconnect after a dropped session and after max messages"""
+    sender = _import_sender()
+    with patch('smtplib.SMTP') as mock_smtp_class:
+        pool = sender.SMTPConnectionPool("smtp.test", 587, "user", "pass", size=1, max_messages=2)
+        
+        # Server drops the connection mid-send
+        with pytest.raises(ConnectionError):
+            with pool.connection():
+                raise ConnectionError("connection reset")
+        assert pool.stats()["connections_closed_broken"] == 1
+        
+        # Two messages on a fresh session, then it is retired
+        for _ in range(2):
+            with pool.connection() as server:
+                server.send_message("msg")
+        
+        assert mock_smtp_class.call_count == 2
+        assert pool.stats()["connections_closed_max_messages"] == 1
+        assert pool.stats()["open"] == 0
+
+# ============================================================================
+# Test 12: Template Registry
+# ============================================================================
+
+def test_template_registry_escapes_and_inlines_css():
+    """Test precompiled templates: lookup by event, autoescape, inlined CSS"""
+    from app.email import templates
+    
+    html = templates.render_simple_notification_template("Hi & welcome", "line 1\n<script>x</script>")
+    assert "Hi &amp; welcome" in html
+    assert "line 1<br>&lt;script&gt;" in html
+    
+    html = templates.registry.render("material_created", subject="New", material_title="Python", created_by="t")
+    assert "<style" not in html and "class=" not in html
+    assert 'style="background-color: #4CAF50; color: white;' in html
+    assert templates.registry.get("unknown_event").name == templates.DEFAULT_TEMPLATE
+
+# ============================================================================
+# Test 13: Campaign Rendering
+# ============================================================================
+
+def test_campaign_render_chunk_mock():
+    """Test mail-merge rendering of NDJSON recipients into MIME messages"""
+    _import_sender()
+    from app.email import mailmerge
+    
+    lines = [
+        (1, b'{"email": "ann@school.edu", "first_name": "Ann"}'),
+        (2, b'not json'),
+        (3, b'{"email": "bob@school.edu"}'),
+    ]
+    rows, errors = mailmerge.render_chunk("Welcome {{ first_name }}", "Hi {{ first_name }}", "noreply@test", lines)
+    
+    assert [row["recipient_email"] for row in rows] == ["ann@school.edu"]
+    assert rows[0]["subject"] == "Welcome Ann"
+    assert "To: ann@school.edu" in rows[0]["mime_message"]
+    assert [e.split(":")[0] for e in errors] == ["line 2", "line 3"]
+
+# ============================================================================
+# Test 14: Retry Backoff
+# ============================================================================
+
+def test_retry_backoff_with_jitter():
+    """Test exponential backoff bounds, the cap and dead-letter threshold"""
+    from app import retry
+    
+    assert retry.backoff_delay(1, base=60, cap=3600, rand=lambda: 0.0) == 30
+    assert retry.backoff_delay(1, base=60, cap=3600, rand=lambda: 1.0) == 60
+    assert retry.backoff_delay(3, base=60, cap=3600, rand=lambda: 1.0) == 240
+    assert retry.backoff_delay(20, base=60, cap=3600, rand=lambda: 1.0) == 3600
+    
+    assert not retry.retries_exhausted(3, max_retry_attempts=3)
+    assert retry.retries_exhausted(4, max_retry_attempts=3)
+
+# ============================================================================
+# Test 15: Digest Rendering
+# ============================================================================
+
+def test_digest_template_renders_every_item():
+    """Test that one digest email lists every merged notification, escaped"""
+    from app.email import templates
+    
+    html = templates.render_digest_template("3 new notifications", [
+        {"subject": "Python Basics", "message": "Chapter 1\nChapter 2"},
+        {"subject": "SQL <Intro>", "message": "Joins"},
+        {"subject": "Docker", "message": "Images"},
+    ])
+    
+    assert html.count("<h4") == 3
+    assert "Chapter 1<br>Chapter 2" in html
+    assert "SQL &lt;Intro&gt;" in html
+
+# ============================================================================
+# Test 16: Per-Domain Rate Limits
+# ============================================================================
+
+def test_domain_limiter_throttles_one_domain_only():
+    """Test token buckets and concurrency caps are applied per recipient domain"""
+    from app import throttle
+    
+    now = [0.0]
+    limiter = throttle.DomainLimiter(
+        {"example.com": throttle.DomainLimit(rate=2, burst=2), "school.edu": throttle.DomainLimit(concurrency=1)},
+        clock=lambda: now[0]
+    )
+    
+    assert limiter.acquire("example.com") is None
+    assert limiter.acquire("mail.example.com") is None  # Shares the parent's bucket
+    assert limiter.acquire("example.com") == pytest.approx(0.5)
+    assert limiter.acquire("other.org") is None  # Unlimited by default
+    
+    now[0] = 0.5
+    assert limiter.acquire("example.com") is None
+    
+    assert limiter.acquire("school.edu") is None
+    assert limiter.acquire("school.edu") == 0.0  # At its concurrency cap
+    limiter.release("school.edu")
+    assert limiter.acquire("school.edu") is None
+
+# ============================================================================
+# Test 17: Grouped SMTP Transactions
+# ============================================================================
+
+def test_send_email_group_reports_refused_recipients():
+    """Test one transaction for many recipients, with per-recipient results"""
+    sender = _import_sender()
+    with patch('smtplib.SMTP') as mock_smtp_class, \
+            patch.dict('os.environ', {'EMAIL_USER': 'test@example.com', 'EMAIL_PASSWORD': 'secret'}):
+        email_sender = sender.EmailSender()
+        server = mock_smtp_class.return_value
+        server.sendmail.return_value = {"b@school.edu": (550, b"No such user")}
+        
+        refused = email_sender.send_email_group(["a@school.edu", "b@school.edu"], "Hi", "Same text")
+        
+        assert refused == {"b@school.edu": "550 No such user"}
+        assert server.sendmail.call_count == 1
+        _, recipients, raw = server.sendmail.call_args[0]
+        assert recipients == ["a@school.edu", "b@school.edu"]
+        assert b"To: undisclosed-recipients:;" in raw
+        
+        server.sendmail.side_effect = ConnectionError("down")
+        refused = email_sender.send_email_group(["a@school.edu", "b@school.edu"], "Hi", "Same text")
+        assert set(refused) == {"a@school.edu", "b@school.edu"}
+
+# ============================================================================
+# Test 18: SMTP Circuit Breaker
+# ============================================================================
+
+def test_circuit_breaker_opens_probes_and_closes():
+    """Test failure-rate tripping, fast-fail while open and half-open probing"""
+    from app.email import breaker
+    
+    now = [0.0]
+    cb = breaker.CircuitBreaker(failure_rate=0.5, min_calls=4, open_seconds=30, clock=lambda: now[0])
+    
+    for ok in (True, False, True, False):
+        cb.before_call()
+        cb.record_success() if ok else cb.record_failure()
+    assert cb.stats()["state"] == "open"
+    
+    with pytest.raises(breaker.CircuitOpenError) as exc:
+        cb.before_call()
+    assert exc.value.retry_after == pytest.approx(30)
+    
+    # One probe after the open period; a failed probe re-opens
+    now[0] = 31
+    cb.before_call()
+    with pytest.raises(breaker.CircuitOpenError):
+        cb.before_call()
+    cb.record_failure()
+    assert cb.is_open()
+    
+    now[0] = 62
+    cb.before_call()
+    cb.record_success()
+    assert cb.stats()["state"] == "closed"
+    assert cb.stats()["times_opened"] == 2
+
+# ============================================================================
+# Test 19: Status Change Stream Broker
+# ============================================================================
+
+def test_status_broker_filters_and_bounds_subscribers():
+    """Test routing by filter key and dropping the oldest events when full"""
+    import asyncio
+    from app import status_events
+    
+    def event(notification_id, status):
+        return {"id": notification_id, "recipient_email": "Ann@School.edu", "service_source": "materials", "status": status}
+    
+    async def scenario():
+        broker = status_events.StatusBroker()
+        by_id = broker.subscribe(("id", "1"), maxsize=2)
+        by_recipient = broker.subscribe(("recipient_email", "ann@school.edu"), maxsize=10)
+        other = broker.subscribe(("service_source", "auth"), maxsize=10)
+        
+        broker.publish([event(1, "processing"), event(1, "pending"), event(1, "sent"), event(2, "sent")])
+        await asyncio.sleep(0)
+        
+        assert by_id.take_dropped() == 1
+        assert [(await by_id.get(0.1))["status"] for _ in range(2)] == ["pending", "sent"]
+        assert by_recipient.queue.qsize() == 4
+        assert await other.get(0.01) is None
+        
+        broker.unsubscribe(by_id)
+        assert broker.subscriber_count() == 2
+    
+    asyncio.run(scenario())
+
+# ============================================================================
+# Test 20: Priority Lane Quotas
+# ============================================================================
+
+def test_lane_quotas_share_batches_by_weight():
+    """Test each lane's share of a claimed batch"""
+    from app.lanes import lane_quotas
+    
+    assert lane_quotas(50, {"high": 6, "normal": 3, "bulk": 1}) == {"high": 30, "normal": 15, "bulk": 5}
+    # Rounding remainder goes to the high lane
+    assert lane_quotas(10, {"high": 1, "normal": 1, "bulk": 1}) == {"high": 4, "normal": 3, "bulk": 3}
+    # Never more than the batch: the highest priority lanes first, the largest share gives way
+    assert lane_quotas(2, {"high": 6, "normal": 3, "bulk": 1}) == {"high": 1, "normal": 1}
+    assert lane_quotas(4, {"high": 1, "normal": 1, "bulk": 1000}) == {"high": 1, "normal": 1, "bulk": 2}
+    # Lanes without a weight are only served from unused shares
+    assert lane_quotas(10, {"high": 1, "bulk": 0}) == {"high": 10}
+    assert lane_quotas(10, {}) == {}
+
+# ============================================================================
+# Test 21: Fair Share Across Service Sources
+# ============================================================================
+
+def test_fair_shares_across_sources():
+    """Test weighted shares, caps and round-robin turns among service sources"""
+    from app import fairness
+    
+    available = fairness.claimable(
+        {
+            "noisy": {"pending": 10000, "processing": 40},
+            "auth": {"pending": 3, "processing": 0},
+            "materials": {"pending": 500, "processing": 0},
+            "idle": {"pending": 0, "processing": 2},
+        },
+        max_processing={"noisy": 50}
+    )
+    assert available == {"noisy": 10, "auth": 3, "materials": 500}
+    
+    # One row each, then 27 split 6.75/13.5/6.75 by weight; auth has only 3, what it leaves goes to the next source
+    shares = fairness.fair_shares(30, available, weights={"materials": 2})
+    assert shares == [("auth", 3), ("materials", 19), ("noisy", 8)]
+    
+    # More sources than rows: each batch starts with the next source
+    many = {f"svc{i}": 100 for i in range(5)}
+    assert fairness.fair_shares(2, many, {}, offset=0) == [("svc0", 1), ("svc1", 1)]
+    assert fairness.fair_shares(2, many, {}, offset=3) == [("svc3", 1), ("svc4", 1)]
+    assert fairness.fair_shares(0, many, {}) == []
+
+# ============================================================================
+# SQLite-backed helpers for the crud tests below
+# ============================================================================
+
+def _sqlite_session(tmp_path):
+    """
+    A session on a fresh SQLite database with the service's tables; call it
+    before importing app modules that need app.database
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    with patch.dict('os.environ', {'DATABASE_URL': f"sqlite:///{tmp_path}/import.db"}):
+        from app import models
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    models.Base.metadata.create_all(engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+def _new_notification(**overrides):
+    from app import schemas
+    values = {"recipient_email": "teacher@school.edu", "subject": "New Material Added", "message": "Python Basics"}
+    values.update(overrides)
+    return schemas.NotificationCreate(**values)
+
+# ============================================================================
+# Test 22: Keyset Cursor Paging
+# ============================================================================
+
+def test_cursor_paging_visits_every_row_once(tmp_path):
+    """Test paging by cursor through rows created within the same second"""
+    db = _sqlite_session(tmp_path)
+    from app import crud
+    
+    # Given 5 notifications, some with the exact same created_at
+    for i in range(3):
+        crud.create_notification(db, _new_notification(recipient_email=f"user{i}@school.edu"))
+    crud.create_notifications_bulk(db, [_new_notification(recipient_email=f"bulk{i}@school.edu") for i in range(2)])
+    
+    # When paging 2 at a time with the cursor of each page's last row
+    seen, cursor = [], None
+    for _ in range(10):
+        page = crud.get_notifications(db, limit=2, cursor=cursor)
+        if not page:
+            break
+        seen.extend(n.id for n in page)
+        cursor = crud.decode_cursor(crud.encode_cursor(page[-1]))
+    
+    # Then every row comes once, newest first
+    assert seen == [5, 4, 3, 2, 1]
+
+# ============================================================================
+# Test 23: Status Events Only NOTIFY While Someone Listens
+# ============================================================================
+
+def test_status_events_notify_only_with_subscribers():
+    """Test that writers skip pg_notify unless an API process holds the presence lock"""
+    from app import status_events
+    
+    db = MagicMock()
+    db.info = {}
+    db.get_bind.return_value.dialect.name = "postgresql"
+    row = Mock(id=7, recipient_email="ann@school.edu", service_source="materials", event_type="e",
+               status="sent", attempts=1, error_message=None)
+    
+    with patch.object(status_events.settings, "sse_presence_check_seconds", 0):
+        # Given no API process with subscribers
+        db.execute.return_value.scalar.return_value = False
+        status_events.publish(db, [row])
+        # Then only the presence check ran, and the event is still staged for this process
+        assert db.execute.call_count == 1
+        assert len(db.info["pending_status_events"]) == 1
+        
+        # Given a subscriber somewhere, the event is sent with NOTIFY too
+        db.execute.return_value.scalar.return_value = True
+        status_events.publish(db, [row])
+        assert db.execute.call_count == 3
+        assert "pg_notify" in str(db.execute.call_args[0][0])
+
+# ============================================================================
+# Test 24: Held Sends Wait For A Free Slot
+# ============================================================================
+
+def test_dispatch_waits_for_slot_held_by_another_thread(tmp_path):
+    """Test that a send at its domain's concurrency cap sleeps until the slot is released"""
+    import threading
+    _sqlite_session(tmp_path)
+    from app import throttle, worker
+    
+    # Given school.edu's only slot taken by another thread (e.g. the express lane)
+    limiter = throttle.DomainLimiter({"school.edu": throttle.DomainLimit(concurrency=1)})
+    assert limiter.acquire("school.edu") is None
+    acquire = Mock(side_effect=limiter.acquire)
+    limiter.acquire = acquire
+    w = worker.NotificationWorker(worker_id="w1", concurrency=1, express_concurrency=0, limiter=limiter)
+    threading.Timer(0.3, limiter.release, args=("school.edu",)).start()
+    
+    # When dispatching a send to that domain
+    with patch.object(worker, "deliver_notification") as deliver:
+        w.dispatch([[(1, "ann@school.edu", "Hi", "Text", None, None)]])
+    
+    # Then it is sent after the release, without spinning on the limiter meanwhile
+    deliver.assert_called_once()
+    assert acquire.call_count == 2
+    w._pool.shutdown()
+
+# ============================================================================
+# Test 25: Every Source Gets A Turn
+# ============================================================================
+
+def test_worker_claims_rotate_through_more_sources_than_quota(tmp_path):
+    """Test round-robin claiming when a lane's quota is smaller than the number of sources"""
+    db = _sqlite_session(tmp_path)
+    from app import crud, worker
+    
+    # Given 6 services with queued notifications and batches of 2
+    crud.create_notifications_bulk(db, [
+        _new_notification(recipient_email=f"user{i}@school.edu", service_source=f"svc{i % 6}")
+        for i in range(60)
+    ])
+    w = worker.NotificationWorker(
+        worker_id="w1", batch_size=2, express_concurrency=0,
+        lane_weights={"high": 1, "normal": 1}, source_weights={}, source_max_processing={}
+    )
+    
+    # When claiming three batches
+    served = [sorted(n.service_source for n in w.claim(db)) for _ in range(3)]
+    
+    # Then each service got exactly one turn
+    assert sorted(s for batch in served for s in batch) == [f"svc{i}" for i in range(6)]
+    w._pool.shutdown()
+
+# ============================================================================
+# Test 26: Lost Probes And Busy Pools Don't Wedge The Breaker
+# ============================================================================
+
+def test_breaker_recovers_from_lost_probe_and_ignores_busy_pool():
+    """Test probe expiry, abandoned calls and pool exhaustion"""
+    import asyncio
+    from app.email import breaker
+    sender = _import_sender()
+    
+    now = [0.0]
+    cb = breaker.CircuitBreaker(failure_rate=0.5, min_calls=1, open_seconds=10, probe_timeout=30, clock=lambda: now[0])
+    cb.before_call()
+    cb.record_failure()
+    
+    # Given a half-open probe that never reports back
+    now[0] = 11
+    cb.before_call()
+    with pytest.raises(breaker.CircuitOpenError):
+        cb.before_call()
+    # Then another probe may go once it expired
+    now[0] = 42
+    cb.before_call()
+    # And an abandoned probe frees its slot right away
+    cb.abandon()
+    cb.before_call()
+    cb.record_success()
+    assert cb.stats()["state"] == "closed"
+    
+    # Given a pool whose only session is busy
+    with patch('smtplib.SMTP'):
+        pool = sender.SMTPConnectionPool("smtp.test", 587, "user", "pass", size=1, timeout=0.01, breaker=cb)
+        with pool.connection():
+            for _ in range(3):
+                with pytest.raises(sender.PoolExhaustedError):
+                    with pool.connection():
+                        pass
+    # Then waiting for it counts as neither success nor failure
+    assert cb.stats()["calls_in_window"] == 1
+    assert cb.stats()["failure_rate"] == 0.0
+    
+    # A cancelled async send leaves no probe slot taken
+    with patch.dict('os.environ', {'EMAIL_USER': 'test@example.com', 'EMAIL_PASSWORD': 'secret'}):
+        from app.email import async_sender
+    probe = breaker.CircuitBreaker(min_calls=1, open_seconds=10, clock=lambda: now[0])
+    probe.before_call()
+    probe.record_failure()
+    now[0] = 60
+    
+    async def cancelled_send():
+        with patch.object(async_sender, "smtp_breaker", probe), \
+                patch.object(async_sender.aiosmtplib, "send", side_effect=asyncio.CancelledError):
+            with pytest.raises(asyncio.CancelledError):
+                await async_sender.AsyncEmailSender().send_email("ann@school.edu", "Hi", "Text")
+    
+    asyncio.run(cancelled_send())
+    probe.before_call()  # Not rejected: the cancelled probe gave its slot back
+
+# ============================================================================
+# Test 27: Sharded Counters Under Concurrency
+# ============================================================================
+
+@pytest.mark.parametrize("upsert", [True, False], ids=["on_conflict", "update_then_insert"])
+def test_sharded_counters_sum_concurrent_increments(tmp_path, upsert):
+    """Test that concurrent counter increments sum exactly over their shards"""
+    import contextlib
+    import threading
+    db = _sqlite_session(tmp_path)
+    from app import models, stats
+    from sqlalchemy.orm import sessionmaker
+    Session = sessionmaker(bind=db.get_bind())
+    
+    # Given 4 threads each queuing 25 notifications in their own transactions
+    def queue_notifications():
+        for _ in range(25):
+            with Session() as session:
+                batch = stats.StatsBatch()
+                batch.created("materials", "material_created")
+                batch.flush(session)
+                session.commit()
+    
+    # When they flush their counters at the same time (upsert or generic fallback)
+    fallback = contextlib.nullcontext() if upsert else patch.object(stats, "_insert", return_value=None)
+    with fallback, patch.object(stats.settings, "stats_counter_shards", 4):
+        threads = [threading.Thread(target=queue_notifications) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    
+    # Then the shards add up to every increment, with no shard row duplicated
+    counters = db.query(models.NotificationCounter).filter_by(status="pending").all()
+    assert sum(c.count for c in counters) == 100
+    assert 1 < len(counters) <= 4
+    assert len({c.shard for c in counters}) == len(counters)
+    rollups = db.query(models.NotificationRollup).filter_by(granularity="hour").all()
+    assert sum(r.created for r in rollups) == 100
+
+# ============================================================================
+# Test 28: Campaign Queue Room Counted In Memory
+# ============================================================================
+
+def test_campaign_queue_room_counts_only_at_the_limit(tmp_path):
+    """Test that loading a campaign re-counts waiting rows only when the bound is reached"""
+    import asyncio
+    _sqlite_session(tmp_path)
+    from app import campaigns
+    
+    # Given a limit of 10 waiting notifications and a queue the workers drain to 3
+    counts = iter([0, 3])
+    count_calls = []
+    
+    def count_waiting(func, campaign_id):
+        count_calls.append(campaign_id)
+        return next(counts)
+    
+    async def load():
+        room = campaigns.QueueRoom(7)
+        await room.wait()
+        # When chunks are queued until the upper bound reaches the limit
+        for _ in range(2):
+            room.queued(4)
+            await room.wait()
+        calls_below_limit = len(count_calls)
+        room.queued(4)
+        await room.wait()
+        return room, calls_below_limit
+    
+    with patch.object(campaigns, "with_session", count_waiting), \
+            patch.object(campaigns.settings, "campaign_max_queued", 10):
+        room, calls_below_limit = asyncio.run(load())
+    
+    # Then the database is counted once up front and once at the limit
+    assert calls_below_limit == 1
+    assert count_calls == [7, 7]
+    assert room.waiting == 3
+
+# ============================================================================
+# Test 29: Claiming From The Durable Queue
+# ============================================================================
+
+def test_claims_skip_locked_rows_and_reclaim_expired_ones(tmp_path):
+    """Test that workers claim disjoint batches with SKIP LOCKED and take over expired claims"""
+    from datetime import timedelta
+    from sqlalchemy import event
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.orm import Session
+    db = _sqlite_session(tmp_path)
+    from app import crud, models
+    
+    # Given five due notifications
+    for i in range(5):
+        crud.create_notification(db, _new_notification(recipient_email=f"user{i}@school.edu"))
+    statements = []
+    
+    def capture(state):
+        statements.append(state.statement)
+    
+    # When two workers claim in turn, capturing the SQL they run
+    event.listen(Session, "do_orm_execute", capture)
+    try:
+        first = crud.claim_pending_notifications(db, "worker-a", limit=3, visibility_timeout_seconds=60)
+        second = crud.claim_pending_notifications(db, "worker-b", limit=3, visibility_timeout_seconds=60)
+    finally:
+        event.remove(Session, "do_orm_execute", capture)
+    
+    # Then on Postgres the selects skip rows another worker has locked
+    compiled = [str(s.compile(dialect=postgresql.dialect())) for s in statements if s.is_select]
+    assert any("FOR UPDATE SKIP LOCKED" in sql for sql in compiled)
+    # And the batches don't overlap: claimed rows are no longer pending
+    assert len(first) == 3 and len(second) == 2
+    assert not {n.id for n in first} & {n.id for n in second}
+    assert {n.claimed_by for n in first} == {"worker-a"}
+    assert crud.claim_pending_notifications(db, "worker-c", limit=5, visibility_timeout_seconds=60) == []
+    
+    # When worker-a stops answering past the visibility timeout
+    db.query(models.Notification).filter(models.Notification.claimed_by == "worker-a").update(
+        {models.Notification.claimed_at: datetime.utcnow() - timedelta(minutes=5)}, synchronize_session=False
+    )
+    db.commit()
+    reclaimed = crud.claim_pending_notifications(db, "worker-c", limit=5, visibility_timeout_seconds=60)
+    
+    # Then only its notifications are claimed again, by the new worker
+    assert sorted(n.id for n in reclaimed) == sorted(n.id for n in first)
+    assert {n.claimed_by for n in reclaimed} == {"worker-c"}
+
+# ============================================================================
+# Test 30: Send-Now With An Idempotency Key
+# ============================================================================
+
+def test_send_now_sends_once_per_idempotency_key(tmp_path):
+    """Test that /send-now sends, records the result, and replays a repeated key without sending"""
+    import asyncio
+    from unittest.mock import AsyncMock
+    from fastapi import HTTPException, Response
+    db = _sqlite_session(tmp_path)
+    with patch.dict('os.environ', {'EMAIL_USER': 'test@example.com', 'EMAIL_PASSWORD': 'secret'}):
+        from app.routers import notifications as router
+    
+    async def inline(func, *args, **kwargs):
+        return func(*args, **kwargs)  # One thread: the SQLite test session isn't shared across threads
+    
+    async def send_now(notification, key):
+        response = Response()
+        result = await router.send_notification_now(notification, response, idempotency_key=key, db=db)
+        return result, response
+    
+    send_email = AsyncMock(return_value=True)
+    with patch.object(router, "run_in_threadpool", inline), \
+            patch.object(router.async_email_sender, "send_email", send_email):
+        # Given a first request with an Idempotency-Key
+        first, first_response = asyncio.run(send_now(_new_notification(), "order-42"))
+        # When the client retries it with the same key
+        replay, replay_response = asyncio.run(send_now(_new_notification(), "order-42"))
+        # And reuses the key for a different notification
+        with pytest.raises(HTTPException) as conflict:
+            asyncio.run(send_now(_new_notification(subject="Other"), "order-42"))
+    
+    # Then the email went out once and the notification is recorded as sent
+    send_email.assert_awaited_once()
+    assert first.status == "sent"
+    assert first.sent_at is not None
+    assert first.priority == "high"
+    # And the retry returns the same record, marked as a replay
+    assert replay.id == first.id
+    assert replay_response.status_code == 200
+    assert replay_response.headers["Idempotent-Replayed"] == "true"
+    assert conflict.value.status_code == 409
+
+# ============================================================================
+# Test 31: Retention Archives And Purges In Small Batches
+# ============================================================================
+
+def test_retention_archives_and_purges_in_batches(tmp_path):
+    """Test that old finished notifications move to the archive, then get purged, batch by batch"""
+    from datetime import timedelta
+    db = _sqlite_session(tmp_path)
+    from app import crud, models
+    
+    # Given five sent notifications from last year, one still pending and one sent today
+    old = [crud.create_notification(db, _new_notification(recipient_email=f"old{i}@school.edu")) for i in range(5)]
+    pending = crud.create_notification(db, _new_notification(recipient_email="pending@school.edu"))
+    recent = crud.create_notification(db, _new_notification(recipient_email="recent@school.edu"))
+    old_ids, pending_id, recent_id = [n.id for n in old], pending.id, recent.id
+    for id_ in old_ids + [recent_id]:
+        crud.record_delivery_result(db, id_, True)
+    db.query(models.Notification).filter(models.Notification.id.in_(old_ids + [pending_id])).update(
+        {models.Notification.created_at: datetime.utcnow() - timedelta(days=365)}, synchronize_session=False
+    )
+    db.commit()
+    
+    # When the archiver runs with two-row batches, at most two batches per pass
+    first_pass = crud.archive_old_notifications(db, timedelta(days=30), batch_size=2, max_batches=2)
+    second_pass = crud.archive_old_notifications(db, timedelta(days=30), batch_size=2, max_batches=2)
+    
+    # Then each pass stops after its batches and only finished, old rows move
+    assert (first_pass, second_pass) == (4, 1)
+    remaining = sorted(n.id for n in db.query(models.Notification))
+    assert remaining == sorted([pending_id, recent_id])
+    assert sorted(a.id for a in db.query(models.ArchivedNotification)) == old_ids
+    # And the status counters no longer count the archived rows
+    sent = db.query(models.NotificationCounter).filter_by(status="sent").all()
+    assert sum(c.count for c in sent) == 1
+    
+    # When the purge runs past the archive's retention, two rows at a time
+    assert crud.delete_archived_notifications(db, timedelta(days=30), batch_size=2) == 0
+    purged = crud.delete_archived_notifications(db, timedelta(seconds=-60), batch_size=2, max_batches=2)
+    purged += crud.delete_archived_notifications(db, timedelta(seconds=-60), batch_size=2)
+    
+    # Then every archived row is gone, the hot table untouched
+    assert purged == 5
+    assert db.query(models.ArchivedNotification).count() == 0
+    assert db.query(models.Notification).count() == 2
+
+# ============================================================================
+# Test 32: Event Fan-Out To Subscribers
+# ============================================================================
+
+def test_material_event_fans_out_once_per_subscriber(tmp_path):
+    """Test that a material event queues one email per distinct subscriber, chunk by chunk"""
+    db = _sqlite_session(tmp_path)
+    from app import crud, events, models, schemas
+    
+    # Given subscribers of the material's subject (in any case), grade and creator, and one of another subject
+    for email, topic, value in [
+        ("ann@school.edu", "subject", "Math"),
+        ("bob@school.edu", "subject", "  math "),
+        ("cid@school.edu", "grade_level", "Grade 7"),
+        ("ann@school.edu", "grade_level", "Grade 7"),
+        ("dan@school.edu", "creator", "Ms. Lee"),
+        ("eve@school.edu", "subject", "History"),
+    ]:
+        crud.create_subscription(db, schemas.SubscriptionCreate(recipient_email=email, topic=topic, value=value))
+    _, created = crud.create_subscription(db, schemas.SubscriptionCreate(
+        recipient_email="Ann@School.edu", topic="subject", value="MATH"
+    ))
+    assert created is False
+    event = schemas.MaterialCreatedEvent(material=schemas.MaterialCreatedData(
+        title="Algebra 7", subject="Math", grade_level="Grade 7", created_by="Ms. Lee"
+    ))
+    
+    # When the event fans out two recipients per chunk
+    with patch.object(events.settings, "fanout_chunk_size", 2):
+        queued = events.fan_out_material_created(db, event)
+    
+    # Then every matching subscriber gets exactly one bulk copy of the same email
+    rows = db.query(models.Notification).order_by(models.Notification.recipient_email).all()
+    assert queued == 4
+    assert [n.recipient_email for n in rows] == [
+        "ann@school.edu", "bob@school.edu", "cid@school.edu", "dan@school.edu"
+    ]
+    assert {(n.subject, n.message, n.priority, n.event_type) for n in rows} == {
+        ("New material: Algebra 7", events.material_created_message(event.material), "bulk", "material_created")
+    }
+    # And the queue counters include them
+    pending = db.query(models.NotificationCounter).filter_by(status="pending").all()
+    assert sum(c.count for c in pending) == 4
+
+# ============================================================================
+# Test 33: Fair Shares Never Exceed The Limit
+# ============================================================================
+
+def test_fair_shares_with_one_heavy_source_stay_within_limit():
+    """Test that the one-row floors come out of the weighted split, not on top of it"""
+    import random
+    from app import fairness
+    
+    # Given one heavy source among many light ones
+    light = {f"svc{i}": 100 for i in range(1, 9)}
+    
+    # When the batch has barely more rows than sources
+    tight = dict(fairness.fair_shares(10, {"svc0": 100, **light}, {"svc0": 50}))
+    roomy = dict(fairness.fair_shares(20, {"svc0": 100, **light}, {"svc0": 100}))
+    
+    # Then every source still gets its row and the heavy one the rest, never more than the limit
+    assert tight == {"svc0": 2, **{source: 1 for source in light}}
+    assert roomy == {"svc0": 12, **{source: 1 for source in light}}
+    assert sum(dict(fairness.fair_shares(3, {"a": 100, "b": 100, "c": 100}, {"a": 100})).values()) == 3
+    
+    # And the same holds for any mix of limits, weights and caps
+    rng = random.Random(50)
+    for _ in range(2000):
+        available = {f"s{i}": rng.randint(1, 20) for i in range(rng.randint(1, 12))}
+        weights = {source: rng.choice([0.1, 1, 5, 1000]) for source in available}
+        limit = rng.randint(1, 40)
+        shares = fairness.fair_shares(limit, available, weights, offset=rng.randint(0, 11))
+        assert sum(count for _, count in shares) == min(limit, sum(available.values()))
+        assert all(1 <= count <= available[source] for source, count in shares)
+
+# ============================================================================
+# Test 34: Health Reports The Workers' Circuit Breakers
+# ============================================================================
+
+def test_health_is_degraded_while_a_worker_breaker_is_open(tmp_path):
+    """Test that /health combines the breaker states the workers report"""
+    import threading
+    import time
+    db = _sqlite_session(tmp_path)
+    with patch.dict('os.environ', {'EMAIL_USER': 'test@example.com', 'EMAIL_PASSWORD': 'secret'}):
+        from app import main, models, worker as worker_module
+    from sqlalchemy.orm import sessionmaker
+    Session = sessionmaker(bind=db.get_bind())
+    open_breaker = Mock()
+    open_breaker.stats.return_value = {"state": "open", "failure_rate": 1.0}
+    
+    with patch.object(worker_module, "SessionLocal", Session), \
+            patch.object(worker_module, "smtp_breaker", open_breaker), \
+            patch.object(main, "SessionLocal", Session):
+        # Given a healthy API process and no workers yet
+        assert main.health_check()["status"] == "healthy"
+        
+        # When a worker whose breaker is open reports in
+        worker = worker_module.NotificationWorker(worker_id="host:1", express_concurrency=0)
+        heartbeat = threading.Thread(target=worker.run_heartbeat)
+        heartbeat.start()
+        deadline = time.time() + 5
+        while not db.query(models.WorkerHeartbeat).count() and time.time() < deadline:
+            time.sleep(0.01)
+        health = main.health_check()
+        
+        # Then /health is degraded and says which workers fail fast
+        assert health["status"] == "degraded"
+        assert health["workers"] == {"live": 1, "breaker_open": 1}
+        
+        # When the worker stops, its report goes with it
+        worker.stop()
+        heartbeat.join(timeout=5)
+        db.expire_all()
+        assert db.query(models.WorkerHeartbeat).count() == 0
+        assert main.health_check()["status"] == "healthy"
+
+# ============================================================================
+# Test 35: Idle Sessions Dropped By The Server Don't Trip The Breaker
+# ============================================================================
+
+def test_dropped_idle_session_is_not_a_breaker_failure():
+    """Test that a reused session the server closed is retried without counting a failure"""
+    import smtplib
+    sender = _import_sender()
+    from app.email import breaker
+    cb = breaker.CircuitBreaker(failure_rate=0.5, min_calls=1, open_seconds=30)
+    sessions = []
+    
+    def new_session(*args, **kwargs):
+        sessions.append(MagicMock())
+        return sessions[-1]
+    
+    with patch('smtplib.SMTP', side_effect=new_session):
+        pool = sender.SMTPConnectionPool("smtp.test", 587, "user", "pass", size=1, breaker=cb)
+        # Given a pooled session that already sent a message
+        with pool.connection() as server:
+            server.send_message("first")
+        # When the server has dropped it by the next send, and the retry on a fresh one works
+        sessions[0].send_message.side_effect = smtplib.SMTPServerDisconnected("idle timeout")
+        try:
+            with pool.connection() as server:
+                server.send_message("second")
+        except smtplib.SMTPServerDisconnected:
+            with pool.connection() as server:
+                server.send_message("second")
+        
+        # Then the breaker saw two successes and no failure
+        assert len(sessions) == 2
+        assert cb.stats()["state"] == "closed"
+        assert cb.stats()["calls_in_window"] == 2
+        assert cb.stats()["failure_rate"] == 0.0
+        
+        # But a fresh session that is dropped at once does count
+        pool.close_all()
+        sessions.clear()
+        with pytest.raises(smtplib.SMTPServerDisconnected):
+            with pool.connection() as server:
+                sessions[0].send_message.side_effect = smtplib.SMTPServerDisconnected("bye")
+                server.send_message("third")
+        assert cb.stats()["failure_rate"] > 0
+
+# ============================================================================
+# Test 36: A Notification That Keeps Killing Workers Is Dead-Lettered
+# ============================================================================
+
+def test_expired_claims_use_up_attempts(tmp_path):
+    """Test that taking over an expired claim counts as an attempt, up to dead_letter"""
+    from datetime import timedelta
+    db = _sqlite_session(tmp_path)
+    from app import crud, models
+    from app.config import settings
+    
+    # Given a notification whose worker dies while sending it, over and over
+    notification = crud.create_notification(db, _new_notification())
+    claimed = crud.claim_pending_notifications(db, "worker-0", limit=1, visibility_timeout_seconds=60)
+    assert claimed[0].attempts == 0
+    
+    def expire_claim():
+        db.query(models.Notification).update(
+            {models.Notification.claimed_at: datetime.utcnow() - timedelta(minutes=5)}, synchronize_session=False
+        )
+        db.commit()
+    
+    # When other workers take over each expired claim
+    for attempt in range(1, settings.max_retry_attempts + 1):
+        expire_claim()
+        reclaimed = crud.claim_pending_notifications(db, f"worker-{attempt}", limit=1, visibility_timeout_seconds=60)
+        # Then each takeover uses up an attempt
+        assert [n.attempts for n in reclaimed] == [attempt]
+    
+    # And once the retries are used up it is dead-lettered instead of claimed again
+    expire_claim()
+    assert crud.claim_pending_notifications(db, "worker-last", limit=1, visibility_timeout_seconds=60) == []
+    db.refresh(notification)
+    assert notification.status == "dead_letter"
+    assert notification.attempts == settings.max_retry_attempts + 1
+    assert notification.claimed_by is None
+    assert "visibility timeout" in notification.error_message
+    expire_claim()
+    assert crud.claim_pending_notifications(db, "worker-last", limit=1, visibility_timeout_seconds=60) == []
+
+# ============================================================================
+# Test 37: A Slow Send Doesn't Hold Up The Queue
+# ============================================================================
+
+def test_worker_keeps_claiming_while_a_send_is_slow(tmp_path):
+    """Test that free delivery threads get the next batch before a slow send finishes"""
+    import threading
+    db = _sqlite_session(tmp_path)
+    with patch.dict('os.environ', {'EMAIL_USER': 'test@example.com', 'EMAIL_PASSWORD': 'secret'}):
+        from app import crud, throttle, worker as worker_module
+    from sqlalchemy.orm import sessionmaker
+    Session = sessionmaker(bind=db.get_bind())
+    
+    # Given 7 queued notifications, the first of which takes a long time to send
+    for i in range(7):
+        crud.create_notification(db, _new_notification(recipient_email=f"user{i}@school.edu", message=f"Material {i}"))
+    slow_id = crud.get_pending_notifications(db, limit=1)[0].id
+    others_sent = threading.Event()
+    sent = []
+    
+    def deliver(notification_id, *args):
+        if notification_id == slow_id:
+            assert others_sent.wait(timeout=5), "the other sends waited for the slow one"
+        else:
+            sent.append(notification_id)
+            if len(sent) == 6:
+                others_sent.set()
+        return True
+    
+    w = worker_module.NotificationWorker(
+        worker_id="w1", concurrency=2, batch_size=2, express_concurrency=0,
+        limiter=throttle.DomainLimiter({}), source_weights={}, source_max_processing={}
+    )
+    # When a worker with 2 threads and batches of 2 runs
+    with patch.object(worker_module, "SessionLocal", Session), \
+            patch.object(worker_module, "deliver_notification", side_effect=deliver) as delivered:
+        claimed = w.run_once()
+    w._pool.shutdown()
+    
+    # Then the other thread went through the rest of the queue meanwhile
+    assert claimed == 7
+    assert others_sent.is_set()
+    assert delivered.call_count == 7
+
+# ============================================================================
+# Test 38: The Migrations Go Down And Up Again
+# ============================================================================
+
+def test_migrations_downgrade_to_the_original_schema_and_back(tmp_path):
+    """Test that downgrading to base keeps notify_db and its rows, and upgrading restores the rest"""
+    import os
+    from alembic import command
+    from alembic.config import Config
+    from sqlalchemy import create_engine, inspect, text
+    _sqlite_session(tmp_path)
+    from app import database
+    engine = create_engine(f"sqlite:///{tmp_path}/migrated.db")
+    service_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    config = Config(os.path.join(service_dir, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(service_dir, "migrations"))
+    
+    with patch.object(database, "engine", engine):
+        # Given a fully migrated database with a notification in it
+        command.upgrade(config, "head")
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO notify_db (recipient_email, subject, message, status) VALUES ('a@school.edu', 'Hi', 'Text', 'SENT')"))
+        
+        # When downgrading every revision
+        command.downgrade(config, "base")
+        
+        # Then only the original table is left, with the notification
+        inspector = inspect(engine)
+        assert set(inspector.get_table_names()) == {"alembic_version", "notify_db"}
+        assert "claimed_at" not in {c["name"] for c in inspector.get_columns("notify_db")}
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM notify_db")).scalar() == 1
+        
+        # And upgrading again brings everything back
+        command.upgrade(config, "head")
+        assert "worker_heartbeats" in inspect(engine).get_table_names()